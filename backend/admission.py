@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import collections
+import math
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+# Priority lanes, highest first: a free slot always goes to the oldest request of the highest non-empty lane
+LANES = ("moderation", "interactive", "bulk")
+
+# Analyses running at once, and requests allowed to wait for a slot (all lanes together)
+MAX_INFLIGHT_ANALYSES = int(os.getenv("MAX_INFLIGHT_ANALYSES", "32"))
+MAX_QUEUED_ANALYSES = int(os.getenv("MAX_QUEUED_ANALYSES", "256"))
+# Longest acceptable wait for a slot per lane: a request expected to wait longer is refused at once
+# (503 + Retry-After), and one still queued when its deadline passes is shed instead of run late
+LANE_DEADLINES_S = {
+    "moderation": float(os.getenv("MODERATION_DEADLINE_S", "60")),
+    "interactive": float(os.getenv("INTERACTIVE_DEADLINE_S", "15")),
+    "bulk": float(os.getenv("BULK_DEADLINE_S", "300")),
+}
+# Per-client token bucket (requests/second and burst); 0 turns rate limiting off
+CLIENT_RATE_PER_S = float(os.getenv("CLIENT_RATE_PER_S", "2"))
+CLIENT_BURST = int(os.getenv("CLIENT_BURST", "20"))
+# Seed for the service-time estimate until real analyses have been timed
+INITIAL_SERVICE_S = 2.0
+
+
+class Rejected(Exception):
+    """A request refused or shed by admission control: maps to an HTTP status with Retry-After."""
+
+    def __init__(self, status_code, reason, message, retry_after):
+        super().__init__(message)
+        self.status_code = status_code  # 429 (client over its rate) or 503 (overloaded)
+        self.reason = reason            # rate_limited | queue_full | deadline | expired
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """Takes one token; returns 0, or the seconds until one is available (nothing taken)."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    In-process scheduler in front of the dispatcher (replaces a bare semaphore).
+
+    At most `slots` analyses run at once. Others wait in one bounded queue per lane, and a
+    released slot goes to the highest-priority lane first, FIFO within it. Admission is
+    decided up front, so overload is answered in microseconds instead of by timeouts:
+      - client over its token bucket          -> 429, Retry-After = time to the next token
+      - max_queue requests already waiting    -> 503 (queue_full)
+      - estimated wait beyond the lane's deadline -> 503 (deadline)
+    The wait estimate is the queue ahead (same or higher lanes) divided by the slots, times
+    an EWMA of the time a slot is held. A request still queued at its deadline is shed (503, expired).
+
+    on_shed: optional callable(lane, reason) for every refusal (metrics).
+    clock: injectable for tests.
+    """
+
+    def __init__(self, slots=MAX_INFLIGHT_ANALYSES, max_queue=MAX_QUEUED_ANALYSES, deadlines=None,
+                 rate=CLIENT_RATE_PER_S, burst=CLIENT_BURST, on_shed=None, clock=time.monotonic,
+                 max_clients=10_000):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.deadlines = dict(LANE_DEADLINES_S, **(deadlines or {}))
+        self.rate = rate
+        self.burst = burst
+        self.on_shed = on_shed
+        self.clock = clock
+        self.max_clients = max_clients
+        self.running = 0
+        self.service_s = INITIAL_SERVICE_S
+        self._queues = {lane: collections.deque() for lane in LANES}
+        self._buckets = {}
+        self.counters = {"admitted": 0, "rate_limited": 0, "queue_full": 0, "deadline": 0, "expired": 0}
+
+    def queue_depths(self):
+        return {lane: len(queue) for lane, queue in self._queues.items()}
+
+    def estimated_wait(self, lane):
+        """Seconds a new request in `lane` would wait for a slot."""
+        ahead = 0
+        for other in LANES[:LANES.index(lane) + 1]:
+            ahead += len(self._queues[other])
+        if self.running < self.slots and ahead == 0:
+            return 0.0
+        return (ahead + 1) / self.slots * self.service_s
+
+    def admit(self, lane, client=None):
+        """
+        The up-front checks, run once per request before slot(). Raises Rejected;
+        `client` (any hashable id) is charged one token, None skips the rate limit.
+        """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane: {lane}")
+        if client is not None and self.rate > 0:
+            wait = self._bucket(client).take(self.clock())
+            if wait:
+                self._shed(lane, Rejected(429, "rate_limited", "Too many requests from this client", wait))
+        if sum(len(queue) for queue in self._queues.values()) >= self.max_queue:
+            self._shed(lane, Rejected(503, "queue_full", "Analysis queue is full", self.estimated_wait(lane)))
+        wait = self.estimated_wait(lane)
+        if wait > self.deadlines[lane]:
+            self._shed(lane, Rejected(503, "deadline",
+                                      f"Estimated wait {wait:.1f}s exceeds the {self.deadlines[lane]:.0f}s {lane} deadline", wait))
+
+    @asynccontextmanager
+    async def slot(self, lane="interactive"):
+        """Waits for a slot (at most the lane's deadline) and holds it for the body. Call admit() first."""
+        await self._acquire(lane)
+        self.counters["admitted"] += 1
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self._release(self.clock() - started)
+
+    async def _acquire(self, lane):
+        if self.running < self.slots and not any(self._queues[other] for other in LANES[:LANES.index(lane) + 1]):
+            self.running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[lane].append(waiter)
+        try:
+            # shield: a timeout must not cancel a slot that was handed over at the same moment
+            await asyncio.wait_for(asyncio.shield(waiter), self.deadlines[lane])
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return  # granted just in time
+            self._queues[lane].remove(waiter)
+            self._shed(lane, Rejected(503, "expired", f"Waited longer than the {self.deadlines[lane]:.0f}s {lane} deadline",
+                                      self.estimated_wait(lane)))
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot we may just have received
+            if waiter.done():
+                self._release(None)
+            else:
+                self._queues[lane].remove(waiter)
+            raise
+
+    def _release(self, held_s):
+        if held_s is not None:
+            self.service_s += 0.2 * (held_s - self.service_s)
+        # The slot passes straight to the next waiter (running stays the same)
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+        self.running -= 1
+
+    def _bucket(self, client):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                # Forget the clients idle longest (a fresh bucket starts full, so this only forgives them)
+                for stale in sorted(self._buckets, key=lambda c: self._buckets[c].updated)[:self.max_clients // 10]:
+                    del self._buckets[stale]
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, self.clock())
+        return bucket
+
+    def _shed(self, lane, rejected):
+        self.counters[rejected.reason] += 1
+        if self.on_shed is not None:
+            self.on_shed(lane, rejected.reason)
+        raise rejected
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats.update({"running": self.running, "queued": self.queue_depths(), "service_s": round(self.service_s, 3)})
+        return stats
+
+
+# --- LOAD SIMULATION (simulated slow worker, no models or network) ---
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def simulate(slots, service_ms, duration_s, rates, deadlines=None, max_queue=MAX_QUEUED_ANALYSES, seed=0):
+    """
+    Poisson arrivals per lane (rates: {lane: requests/s}) against a worker that takes
+    ~service_ms (exponential) per analysis. Returns per-lane latency percentiles and shed counts.
+    """
+    rng = random.Random(seed)
+    controller = AdmissionController(slots=slots, max_queue=max_queue, deadlines=deadlines, rate=0)
+    latencies = {lane: [] for lane in rates}
+    shed = {lane: collections.Counter() for lane in rates}
+    tasks = []
+
+    async def request(lane):
+        started = time.monotonic()
+        try:
+            controller.admit(lane)
+            async with controller.slot(lane):
+                await asyncio.sleep(rng.expovariate(1000.0 / service_ms))
+            latencies[lane].append(time.monotonic() - started)
+        except Rejected as e:
+            shed[lane][e.reason] += 1
+
+    async def arrivals(lane, rate):
+        end = time.monotonic() + duration_s
+        while time.monotonic() < end:
+            await asyncio.sleep(rng.expovariate(rate))
+            tasks.append(asyncio.create_task(request(lane)))
+
+    await asyncio.gather(*(arrivals(lane, rate) for lane, rate in rates.items() if rate > 0))
+    await asyncio.gather(*tasks)
+    return {
+        lane: {
+            "completed": len(latencies[lane]),
+            "shed": dict(shed[lane]),
+            "p50_s": round(_percentile(latencies[lane], 50), 3),
+            "p99_s": round(_percentile(latencies[lane], 99), 3),
+            "max_s": round(max(latencies[lane], default=0.0), 3),
+        }
+        for lane in rates
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Admission control under simulated overload (no models, no network)")
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=200, help="mean simulated analysis time")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of arrivals")
+    parser.add_argument("--moderation-rps", type=float, default=2)
+    parser.add_argument("--interactive-rps", type=float, default=20)
+    parser.add_argument("--bulk-rps", type=float, default=40)
+    parser.add_argument("--interactive-deadline", type=float, default=LANE_DEADLINES_S["interactive"])
+    parser.add_argument("--bulk-deadline", type=float, default=LANE_DEADLINES_S["bulk"])
+    args = parser.parse_args()
+
+    capacity = args.slots * 1000.0 / args.service_ms
+    offered = args.moderation_rps + args.interactive_rps + args.bulk_rps
+    print(f"Capacity ~{capacity:.0f} req/s, offered {offered:.0f} req/s ({offered / capacity:.1f}x)")
+    result = asyncio.run(simulate(
+        args.slots, args.service_ms, args.duration,
+        {"moderation": args.moderation_rps, "interactive": args.interactive_rps, "bulk": args.bulk_rps},
+        deadlines={"interactive": args.interactive_deadline, "bulk": args.bulk_deadline},
+    ))
+    for lane, row in result.items():
+        print(f"{lane:<12} completed {row['completed']:6d}   p50 {row['p50_s']:7.3f}s   p99 {row['p99_s']:7.3f}s   "
+              f"max {row['max_s']:7.3f}s   shed {row['shed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from detector_logic import DeepfakeDetectorLogic, detector_version, peak_rss_mb, reset_peak_rss
+from generate_test_data import synth_image, save_image, write_video
+
+# Resolution grid (width, height): model input size up to 8K
+RESOLUTIONS = {
+    "224": (224, 224),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+BATCH_SIZES = [1, 4, 16]
+VIDEOS = {"360p_3s": ((640, 360), 3), "1080p_3s": ((1920, 1080), 3)}
+
+STAGES = ["decode_ms", "model_a_ms", "model_b_ms", "metadata_ms", "fft_ms", "scoring_ms", "total_ms"]
+
+
+class StubPipeline:
+    """
+    Offline stand-in for a HuggingFace image-classification pipeline.
+    Does the same resize-to-224 preprocessing and returns a label/score list,
+    so the benchmark runs without downloading weights.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def _classify(self, image):
+        import numpy as np
+        pixels = np.asarray(image.resize((224, 224)), dtype=np.float32) / 255.0
+        score = float(pixels.mean())
+        return [{"label": self.labels[0], "score": score}, {"label": self.labels[1], "score": 1 - score}]
+
+    def __call__(self, images, batch_size=None, **kwargs):
+        if isinstance(images, list):
+            return [self._classify(img) for img in images]
+        return self._classify(images)
+
+
+# --- CASES ---
+
+def build_detector(stub_models, backend="torch"):
+    detector = DeepfakeDetectorLogic()
+    detector.record_timings = True
+    detector.record_peak_rss = True
+    if stub_models:
+        detector.pipe1 = StubPipeline(["FAKE", "REAL"])
+        detector.pipe2 = StubPipeline(["Fake", "Real"])
+        detector.parallel_models = False
+    else:
+        detector.load_models(device=-1, backend=backend)
+    return detector
+
+def summarize_timings(runs):
+    # Median of each stage across repeats
+    summary = {}
+    for stage in STAGES:
+        values = [run[stage] for run in runs if stage in run]
+        if values:
+            summary[stage] = round(statistics.median(values), 3)
+    return summary
+
+def measure(fn, repeats):
+    """Runs fn() `repeats` times after one warm-up call; returns (per-run timings, peak RSS MB)."""
+    fn()
+    per_case_peak = reset_peak_rss()
+    runs, peaks = [], []
+    for _ in range(repeats):
+        result = fn()
+        results = result if isinstance(result, list) else [result]
+        for res in results:
+            if res.get("status") != "success":
+                raise RuntimeError(res.get("message"))
+            # Each analysis resets the peak for its own report, so keep the largest one
+            if "peak_rss_mb" in res:
+                peaks.append(res["peak_rss_mb"])
+        runs.extend(res["timings"] for res in results)
+    return runs, max(peaks + [peak_rss_mb()]), per_case_peak
+
+def run_suite(detector, workdir, repeats, resolutions, formats, quick=False):
+    results = {}
+
+    # 1. Stills: resolution x format x EXIF
+    for res_name in resolutions:
+        width, height = RESOLUTIONS[res_name]
+        img = synth_image(width, height, seed=width)
+        for fmt_name in formats:
+            for with_exif in (False, True):
+                case = f"image/{res_name}/{fmt_name}/{'exif' if with_exif else 'noexif'}"
+                path = os.path.join(workdir, f"{res_name}_{'exif' if with_exif else 'noexif'}.{fmt_name}")
+                save_image(img, path, fmt=FORMATS[fmt_name], with_exif=with_exif)
+
+                runs, peak, exact = measure(lambda: detector.analyze_image(path, f"image/{fmt_name}"), repeats)
+                results[case] = {
+                    "file_bytes": os.path.getsize(path),
+                    "pixels": width * height,
+                    "timings_ms": summarize_timings(runs),
+                    "peak_rss_mb": round(peak, 1),
+                    "peak_rss_per_case": exact,
+                }
+                print(f"{case:<32} total {results[case]['timings_ms']['total_ms']:9.1f} ms   peak RSS {peak:8.1f} MB")
+
+    # 2. Batch size scaling (1080p JPEG, amortised per image)
+    path = os.path.join(workdir, "batch.jpeg")
+    save_image(synth_image(1920, 1080, seed=1), path)
+    for batch_size in ([1, 4] if quick else BATCH_SIZES):
+        case = f"batch/1080p/jpeg/{batch_size}"
+        items = [(path, "image/jpeg")] * batch_size
+        started = time.perf_counter()
+        runs, peak, exact = measure(lambda: detector.analyze_batch(items, batch_size=batch_size), repeats)
+        wall = time.perf_counter() - started
+        results[case] = {
+            "batch_size": batch_size,
+            "timings_ms": summarize_timings(runs),
+            "images_per_sec": round(batch_size * (repeats + 1) / wall, 2),
+            "peak_rss_mb": round(peak, 1),
+            "peak_rss_per_case": exact,
+        }
+        print(f"{case:<32} total {results[case]['timings_ms']['total_ms']:9.1f} ms/img   {results[case]['images_per_sec']:.2f} img/s")
+
+    # 3. Short videos
+    for name, (size, seconds) in VIDEOS.items():
+        if quick and name != "360p_3s":
+            continue
+        case = f"video/{name}"
+        path = write_video(os.path.join(workdir, f"{name}.mp4"), seconds=seconds, size=size)
+        runs, peak, exact = measure(lambda: detector.analyze_video(path, "video/mp4"), repeats)
+        results[case] = {
+            "file_bytes": os.path.getsize(path),
+            "timings_ms": {stage: round(statistics.median(run[stage] for run in runs), 3) for stage in runs[0]},
+            "peak_rss_mb": round(peak, 1),
+            "peak_rss_per_case": exact,
+        }
+        print(f"{case:<32} total {results[case]['timings_ms']['total_ms']:9.1f} ms   peak RSS {peak:8.1f} MB")
+
+    return results
+
+# --- COLD START ---
+
+def startup_child(stub_models, backend, warmup):
+    """
+    Runs inside a fresh interpreter (see run_startup): loads the detector the way a
+    worker does, optionally warms it up, then times the first two analyses.
+    Module imports have already happened by the time this runs.
+    """
+    imports_done_at = time.time()
+    started = time.perf_counter()
+    detector = build_detector(stub_models, backend)
+    load_ms = (time.perf_counter() - started) * 1000
+    if warmup:
+        detector.warmup()
+
+    with tempfile.TemporaryDirectory(prefix="veritas-bench-") as workdir:
+        path = os.path.join(workdir, "first.jpeg")
+        save_image(synth_image(1920, 1080, seed=7), path)
+        requests_ms = []
+        for _ in range(2):
+            started = time.perf_counter()
+            result = detector.analyze_image(path, "image/jpeg")
+            requests_ms.append(round((time.perf_counter() - started) * 1000, 3))
+            if result.get("status") != "success":
+                raise RuntimeError(result.get("message"))
+
+    return {
+        "imports_done_at": imports_done_at,
+        "load_ms": round(load_ms, 3),
+        "phases": detector.startup_timings or {},
+        "first_request_ms": requests_ms[0],
+        "second_request_ms": requests_ms[1],
+    }
+
+def run_startup(stub_models, backend, repeats, offline):
+    """
+    Cold-start breakdown: each run is a new Python process (nothing cached in memory),
+    with and without warm-up. offline=True sets HF_HUB_OFFLINE, so only local weights
+    (MODEL_CACHE_DIR or the HF cache) can be used and no time goes to the network.
+    """
+    env = dict(os.environ)
+    if offline:
+        env["HF_HUB_OFFLINE"] = "1"
+    results = {}
+    for warmup in (False, True):
+        runs = []
+        for _ in range(repeats):
+            cmd = [sys.executable, os.path.abspath(__file__), "--startup-child", "--backend", backend]
+            if stub_models:
+                cmd.append("--stub-models")
+            if warmup:
+                cmd.append("--warmup")
+            spawned_at = time.time()
+            out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+            run = json.loads(out.strip().splitlines()[-1])
+            run["process_and_imports_ms"] = round((run.pop("imports_done_at") - spawned_at) * 1000, 3)
+            runs.append(run)
+
+        case = f"startup/{'warmup' if warmup else 'cold'}"
+        summary = {
+            key: round(statistics.median(run[key] for run in runs), 3)
+            for key in ("process_and_imports_ms", "load_ms", "first_request_ms", "second_request_ms")
+        }
+        for phase in runs[0]["phases"]:
+            summary[phase] = round(statistics.median(run["phases"].get(phase, 0) for run in runs), 3)
+        results[case] = {"timings_ms": summary}
+        print(f"{case:<16} " + "  ".join(f"{k} {v:.1f}" for k, v in summary.items()))
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def compare(current, baseline_path):
+    # Prints the per-case change in median total time against an earlier results file
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n--- Compared with {baseline_path} (commit {baseline['meta'].get('commit')}) ---")
+    for case, res in current["results"].items():
+        old = baseline["results"].get(case)
+        if not old or "total_ms" not in res["timings_ms"]:
+            continue
+        new_ms, old_ms = res["timings_ms"]["total_ms"], old["timings_ms"]["total_ms"]
+        change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0.0
+        print(f"{case:<32} {old_ms:9.1f} -> {new_ms:9.1f} ms  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency / memory benchmark for DeepfakeDetectorLogic (CPU, offline)")
+    parser.add_argument("--stub-models", action="store_true", help="use tiny stand-in pipelines instead of the HF models")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per case (after one warm-up)")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS), help="comma-separated subset of " + ",".join(RESOLUTIONS))
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma-separated subset of " + ",".join(FORMATS))
+    parser.add_argument("--quick", action="store_true", help="smaller batch/video grid")
+    parser.add_argument("--output", default="benchmark_results.json", help="machine-readable results (JSON)")
+    parser.add_argument("--baseline", help="earlier results file to diff against")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx", "onnx-int8"], help="model runtime for the real models")
+    parser.add_argument("--startup", action="store_true", help="cold-start breakdown in fresh processes instead of the latency suite")
+    parser.add_argument("--offline", action="store_true", help="with --startup: HF_HUB_OFFLINE=1 (local weights only)")
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_child:
+        print(json.dumps(startup_child(args.stub_models, args.backend, args.warmup)))
+        return
+
+    if args.startup:
+        results = run_startup(args.stub_models, args.backend, args.repeats, args.offline)
+    else:
+        detector = build_detector(args.stub_models, args.backend)
+        with tempfile.TemporaryDirectory(prefix="veritas-bench-") as workdir:
+            results = run_suite(
+                detector, workdir, args.repeats,
+                [r for r in args.resolutions.split(",") if r], [f for f in args.formats.split(",") if f], args.quick,
+            )
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "detector_version": detector_version(),
+            "stub_models": args.stub_models,
+            "backend": None if args.stub_models else args.backend,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeats": args.repeats,
+            "model_cache_dir": os.getenv("MODEL_CACHE_DIR") if args.startup else None,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.baseline:
+        compare(output, args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+
+# The API reads its configuration at import: keep tests off real AWS and off the default on-disk stores
+os.environ.setdefault("AWS_BUCKET_NAME", "test-bucket")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+os.environ.setdefault("RESULT_STORE_PATH", "")
+os.environ.setdefault("WARMUP", "0")
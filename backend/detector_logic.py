@@ -1,180 +1,1097 @@
+import functools
+import os
+import time
+
+# Ensemble members (HuggingFace Hub ids)
+MODEL_A_ID = "umm-maybe/AI-image-detector"
+MODEL_B_ID = "dima806/deepfake_vs_real_image_detection"
+
+# Pre-populated weights (see prefetch_models): <MODEL_CACHE_DIR>/<org>__<model>/ is loaded from disk
+# with no Hub round-trips. Unset, or a model missing there, falls back to resolving the Hub id.
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR")
+
+# Bump to invalidate cached verdicts when something outside this file changes (e.g. new upstream weights)
+CACHE_EPOCH = "1"
+
+# Spectral engine (Forensic Layer 2). The 85/160 energy thresholds were tuned on ~1080p
+# images, so larger inputs are area-downsampled to this pixel budget before the FFT;
+# this also bounds FFT time and memory regardless of the upload's resolution.
+SPECTRUM_MAX_PIXELS = 1920 * 1080
+SPECTRUM_LOW_FREQ_MASK = 30
+SPECTRUM_RADIAL_BINS = 64
+
+# Ingestion policy (see LoadedImage.from_source). Stills are decoded at about the resolution the
+# layers actually use: the FFT's pixel budget (the models resize to 224 px anyway). Larger JPEGs
+# are DCT-scaled while decoding; other formats are area-downsampled right after the decode.
+DECODE_MAX_PIXELS = SPECTRUM_MAX_PIXELS
+# Refused before any pixel is decoded (decompression bombs, oversized uploads)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(64 * 1000 * 1000)))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(100 * 1024 * 1024)))
+
+
+@functools.lru_cache(maxsize=1)
+def detector_version():
+    """
+    Version string for cached verdicts: model ids + a digest of this module's source.
+    Editing any threshold or heuristic here changes it, so stale cache entries stop matching.
+    """
+    import hashlib
+    import inspect
+    import sys
+
+    source = inspect.getsource(sys.modules[__name__])
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    return f"{MODEL_A_ID}+{MODEL_B_ID}@{digest}.{CACHE_EPOCH}"
+
+
+def cache_version(backend="torch", cascade=False):
+    """
+    detector_version() plus the worker settings that change scores: quantised backends
+    and the cascade get their own keys. Used by the worker's caches and the API's result store.
+    """
+    version = detector_version()
+    if backend != "torch":
+        version = f"{version}+{backend}"
+    if cascade:
+        version = f"{version}+cascade"
+    return version
+
+
+def local_model_dir(model_id, root=None):
+    """The pre-populated copy of `model_id` under root (default MODEL_CACHE_DIR), or None."""
+    root = root or MODEL_CACHE_DIR
+    if not root:
+        return None
+    path = os.path.join(root, model_id.replace("/", "__"))
+    return path if os.path.isfile(os.path.join(path, "config.json")) else None
+
+
+def prefetch_models(root):
+    """Downloads both ensemble models into <root>/<org>__<model> (run once, e.g. at image build time)."""
+    from huggingface_hub import snapshot_download
+
+    for model_id in (MODEL_A_ID, MODEL_B_ID):
+        snapshot_download(model_id, local_dir=os.path.join(root, model_id.replace("/", "__")))
+
+
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM, so the next peak_rss_mb() covers only what follows
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    # Fallback: lifetime peak (kilobytes on Linux, bytes on macOS)
+    import resource
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def _timed(timings, stage, fn, *args, **kwargs):
+    # Runs fn(*args, **kwargs); when `timings` is a dict, records its wall time in ms under `stage`
+    if timings is None:
+        return fn(*args, **kwargs)
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 3)
+
+
+def _notify(progress, indices, stage):
+    # Progress hooks are best-effort: a failing callback must not fail the analysis
+    if progress is None:
+        return
+    for idx in indices:
+        try:
+            progress(idx, stage)
+        except Exception as e:
+            print(f"Progress callback failed: {e}")
+
+
+def normalise_for_spectrum(gray, max_pixels=SPECTRUM_MAX_PIXELS):
+    # Downscale only; images within the budget are analysed at native resolution
+    h, w = gray.shape
+    if h * w <= max_pixels:
+        return gray
+    import cv2
+    scale = (max_pixels / float(h * w)) ** 0.5
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+# About 8 MB per 1920x1080 shape (float32 mask weights + int32 bin indices), so at most ~32 MB
+@functools.lru_cache(maxsize=4)
+def _spectral_geometry(h, w, mask_size=SPECTRUM_LOW_FREQ_MASK, bins=SPECTRUM_RADIAL_BINS):
+    """
+    Per-shape constants for a real-input (rfft2) spectrum of an h x w image.
+    Each rfft column other than DC/Nyquist stands in for itself and its conjugate twin,
+    so weighting them by 2 reproduces sums over the full fft2 spectrum exactly.
+    Returns (keep, radial_index, column_weight, radial_count).
+    """
+    import numpy as np
+
+    cols = w // 2 + 1
+    rows_signed = np.fft.fftfreq(h, 1.0 / h).astype(np.int64)[:, None]
+    cols_signed = np.fft.fftfreq(w, 1.0 / w).astype(np.int64)[:cols][None, :]
+
+    self_conjugate = np.zeros(cols, dtype=bool)
+    self_conjugate[0] = True
+    if w % 2 == 0:
+        self_conjugate[-1] = True
+    weight = np.where(self_conjugate, 1.0, 2.0)[None, :]
+
+    # Old fftshift-based mask: the 2*mask_size square starting at centre - mask_size
+    def in_mask(r, c):
+        return ((r >= -mask_size) & (r < mask_size) & (c >= -mask_size) & (c < mask_size)).astype(np.float64)
+
+    masked = in_mask(rows_signed, cols_signed) + np.where(
+        self_conjugate[None, :], 0.0, in_mask(-rows_signed, -cols_signed)
+    )
+    keep = (weight - masked).astype(np.float32) / float(h * w)
+
+    # Radial bin index, normalised so the corner (Nyquist, Nyquist) lands in the last bin
+    radius = np.sqrt((rows_signed / float(h)) ** 2 + (cols_signed / float(w)) ** 2) / np.sqrt(0.5)
+    radial_index = np.minimum((radius * bins).astype(np.int32), bins - 1).ravel()
+    radial_count = np.bincount(radial_index, weights=np.broadcast_to(weight, (h, cols)).ravel(), minlength=bins)
+
+    return keep, radial_index, weight, radial_count
+
+
+def spectral_signature(gray):
+    """
+    Single-precision real FFT of the resolution-normalised grayscale image.
+    Returns {"energy", "radial_profile", "shape"} (see DeepfakeDetectorLogic.spectral_signature).
+    """
+    import numpy as np
+    try:
+        from scipy import fft as fft_impl
+        fft_kwargs = {"workers": -1}
+    except ImportError:
+        fft_impl = np.fft
+        fft_kwargs = {}
+
+    img = normalise_for_spectrum(gray).astype(np.float32)
+    h, w = img.shape
+    keep, radial_index, column_weight, radial_count = _spectral_geometry(h, w)
+
+    magnitude = np.abs(fft_impl.rfft2(img, **fft_kwargs))
+    magnitude += 1e-8
+    np.log(magnitude, out=magnitude)
+    magnitude *= 20
+
+    energy = float(np.vdot(magnitude, keep))
+    magnitude *= column_weight
+    radial_sum = np.bincount(radial_index, weights=magnitude.ravel(), minlength=len(radial_count))
+    radial_profile = (radial_sum / np.maximum(radial_count, 1)).astype(np.float32)
+
+    return {"energy": energy, "radial_profile": radial_profile, "shape": (h, w)}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def _fit_pixels(width, height, max_pixels):
+    # Largest (w, h) with the same aspect ratio and at most max_pixels pixels
+    scale = (max_pixels / float(width * height)) ** 0.5
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+class LoadedImage:
+    """
+    Shared decode of a single image, built once per request.
+    Both model pipelines and both forensic layers read from this object
+    instead of each re-opening (and re-decoding) the source file.
+    """
+
+    def __init__(self, rgb, exif=None, exif_error=False, source_size=None, exif_from_header=False):
+        self.rgb = rgb                # PIL image in RGB mode (what the pipelines consume)
+        self.exif = exif              # Raw EXIF block {tag_id: value}, or None
+        self.exif_error = exif_error  # True if the container could not be parsed for EXIF
+        self.source_size = source_size or rgb.size  # (width, height) before any reduced decode
+        self.exif_from_header = exif_from_header    # EXIF taken from a header read (see from_source)
+        self._gray = None
+        self._spectrum = None
+
+    @property
+    def gray(self):
+        # Grayscale view (uint8 ndarray), derived lazily from the decoded RGB pixels
+        if self._gray is None:
+            import numpy as np
+            self._gray = np.asarray(self.rgb.convert("L"))
+        return self._gray
+
+    @property
+    def spectrum_view(self):
+        # What the FFT layer sees: the grayscale view within SPECTRUM_MAX_PIXELS, whatever the source resolution
+        return normalise_for_spectrum(self.gray)
+
+    @classmethod
+    def from_source(cls, source, max_pixels=MAX_IMAGE_PIXELS, max_bytes=MAX_IMAGE_BYTES, decode_max_pixels=DECODE_MAX_PIXELS,
+                    header=None):
+        """
+        Accepts a filesystem path, raw bytes, a binary file object,
+        a PIL image or an RGB/grayscale numpy array.
+
+        Encoded sources above max_bytes, or whose header declares more than max_pixels,
+        raise ImageTooLarge before decoding. Images above decode_max_pixels are decoded
+        reduced: JPEGs at the smallest DCT scale (1/2, 1/4, 1/8) that still covers the
+        budget, then every format is box-downsampled to fit it before any further copy.
+
+        header: optional {"width", "height", "exif"} read from the start of the same object
+        before the body arrived (worker.header_hint). When its dimensions match the body's,
+        its EXIF is used as is instead of being parsed again.
+        """
+        import io
+        from PIL import Image, ImageOps
+
+        if isinstance(source, LoadedImage):
+            return source
+
+        if isinstance(source, Image.Image):
+            img = source
+        elif hasattr(source, "__array_interface__"):
+            return cls(Image.fromarray(source).convert("RGB"))
+        else:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                size = len(source)
+                source = io.BytesIO(source)
+            else:
+                size = os.path.getsize(source) if isinstance(source, (str, os.PathLike)) else None
+            if max_bytes and size and size > max_bytes:
+                raise ImageTooLarge(f"Image is {size} bytes, above the {max_bytes} byte limit")
+            try:
+                img = Image.open(source)
+            except Image.DecompressionBombError as e:
+                # PIL's own guard (far above max_pixels by default) trips before ours can
+                raise ImageTooLarge(str(e))
+            # Image.open only reads the header: nothing has been decoded yet
+            width, height = img.size
+            if max_pixels and width * height > max_pixels:
+                raise ImageTooLarge(f"Image is {width}x{height}, above the {max_pixels} pixel limit")
+
+        exif, exif_error, exif_from_header = None, False, False
+        if header is not None and (header.get("width"), header.get("height")) == img.size:
+            exif, exif_from_header = header.get("exif"), True
+        else:
+            try:
+                exif = img._getexif()
+            except Exception:
+                exif_error = True
+
+        source_size = img.size
+        if decode_max_pixels and source_size[0] * source_size[1] > decode_max_pixels:
+            target = _fit_pixels(source_size[0], source_size[1], decode_max_pixels)
+            if img.format == "JPEG":
+                # Decodes straight at 1/2, 1/4 or 1/8 scale (never below `target`)
+                img.draft("RGB", target)
+            # Area average, like the FFT's own downsampling (resize keeps .info, so the EXIF orientation survives)
+            img = img.resize(target, Image.BOX)
+
+        # Same orientation handling as transformers' load_image, so scores match the path-based call
+        rgb = ImageOps.exif_transpose(img).convert("RGB")
+        return cls(rgb, exif=exif, exif_error=exif_error, source_size=source_size, exif_from_header=exif_from_header)
+
+
+# --- SCORING (pure functions of the layer outputs) ---
+
+# Model scores below this count as "unsure": only then do spectral artifacts add to the fake probability
+MODEL_UNSURE_BELOW = 40
+
+# Verdict bands on the credibility score (100 - fake probability)
+AI_GENERATED_BELOW = 30
+SUSPICIOUS_BELOW = 65  # Tightened threshold from 60 to 65
+VERDICTS = ("Likely Real", "Unverified Source (No Metadata)", "Suspicious / Unverified", "AI Generated")
+
+# Forensic Layer 2 thresholds on the spectral energy (tuned for 1080p images)
+FFT_SMOOTH_BELOW = 85   # AI images often have lower 'chaotic' energy than real sensors
+FFT_GRAIN_ABOVE = 160   # Too much uniform noise (artificial grain added)
+
+# EXIF tags that count as a camera signature (Forensic Layer 1)
+CAMERA_TAGS = ("Make", "Model", "ISOSpeedRatings", "DateTimeOriginal")
+
+
+def fft_penalty_for(energy, smooth_below=FFT_SMOOTH_BELOW, grain_above=FFT_GRAIN_ABOVE):
+    """Returns (penalty, status) for a spectral energy (see analyze_frequency_domain)."""
+    if energy < smooth_below:
+        return 40, "Abnormal Frequency Drop-off (Synthetic Smoothness)"
+    if energy > grain_above:
+        return 20, "Uniform Noise Pattern (Artificial Grain)"
+    return 0, "Normal Spectrum"
+
+
+def camera_signature(exif):
+    """The CAMERA_TAGS present in a raw EXIF block, as {tag_name: value}."""
+    from PIL import ExifTags
+
+    found = {}
+    for tag, value in (exif or {}).items():
+        tag_name = ExifTags.TAGS.get(tag, tag)
+        if tag_name in CAMERA_TAGS:
+            found[tag_name] = value
+    return found
+
+
+def metadata_finding(exif):
+    """Forensic Layer 1 on a raw EXIF dict ({tag_id: value} or None): (has_camera_data, message)."""
+    if not exif:
+        return False, "No Camera Metadata found (Suspicious for original files)"
+    found = camera_signature(exif)
+    if not found:
+        return False, "Metadata present but lacks Camera Signature"
+    details = [f"{tag_name}: {str(value)[:20]}" for tag_name, value in found.items()]
+    return True, f"Camera Signature Detected: {', '.join(details)}"
+
+
+def fuse_scores(model_score, has_camera_data, fft_penalty):
+    """
+    The Ghost / Trust heuristics. model_score is the ensemble's fake confidence
+    (max of the model scores, 0-100). Returns (fake_probability, notes): the
+    unclamped fake probability and a detail line for each rule that fired.
+    """
+    notes = []
+    fake_probability = model_score
+
+    # HEURISTIC 1: The "Ghost" Rule
+    # If there is NO metadata, the image loses "Benefit of the Doubt".
+    if not has_camera_data:
+        fake_probability = max(fake_probability, 30) # Floor is now 30% Fake
+
+        # If Models are unsure (0-30%) BUT No Metadata + FFT Artifacts -> FLAG IT
+        if fake_probability < MODEL_UNSURE_BELOW and fft_penalty > 0:
+            fake_probability += fft_penalty
+            notes.append("Pattern Match: Synthetic frequency patterns detected.")
+
+        # Heavy penalty for "No Metadata"
+        fake_probability += 20
+        notes.append("Trust Penalty: Missing digital provenance (Metadata).")
+
+    # HEURISTIC 2: The "Trust" Rule
+    # If we have confirmed Camera Metadata (e.g. 'iPhone 13 Pro', 'ISO 80'), we trust it significantly
+    elif fake_probability < 80:
+        fake_probability -= 30
+        notes.append("Trust Boost: Verified Camera Source.")
+
+    return fake_probability, notes
+
+
+def verdict_for(fake_probability, has_camera_data):
+    """Returns (credibility_score, verdict, capped) for a fused fake probability."""
+    fake_probability = min(max(fake_probability, 0), 100)
+    credibility_score = 100 - fake_probability
+    verdict = "Likely Real"
+    capped = False
+
+    # Override Verdicts based on strict rules
+    if credibility_score < AI_GENERATED_BELOW:
+        verdict = "AI Generated"
+    elif credibility_score < SUSPICIOUS_BELOW:
+        verdict = "Suspicious / Unverified"
+    elif not has_camera_data and credibility_score > SUSPICIOUS_BELOW:
+        # CAP CREDIBILITY for non-metadata images
+        credibility_score = SUSPICIOUS_BELOW
+        verdict = "Unverified Source (No Metadata)"
+        capped = True
+
+    return credibility_score, verdict, capped
+
+
+def score_signals(model_a, model_b, has_camera_data, spectral_energy,
+                  ai_below=AI_GENERATED_BELOW, suspicious_below=SUSPICIOUS_BELOW,
+                  smooth_below=FFT_SMOOTH_BELOW, grain_above=FFT_GRAIN_ABOVE):
+    """
+    fft_penalty_for + fuse_scores + verdict_for over numpy arrays of raw signals (see signal_store),
+    one element per image. model_a / model_b are NaN where a model did not run, spectral_energy
+    is NaN where the FFT failed. Same results as the scalar path for the default thresholds.
+    Returns (credibility_score, verdict index into VERDICTS), both arrays.
+    """
+    import numpy as np
+
+    model_score = np.fmax(np.asarray(model_a, dtype=np.float64), np.asarray(model_b, dtype=np.float64))
+    energy = np.asarray(spectral_energy, dtype=np.float64)
+    has_camera_data = np.asarray(has_camera_data, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        # NaN energy compares False both ways: no penalty, as when the FFT fails
+        fft_penalty = np.where(energy < smooth_below, 40.0, np.where(energy > grain_above, 20.0, 0.0))
+
+    # Ghost rule (no camera data): floor at 30, spectral penalty while the models are unsure, +20
+    ghost = np.maximum(model_score, 30)
+    ghost = ghost + np.where((ghost < MODEL_UNSURE_BELOW) & (fft_penalty > 0), fft_penalty, 0.0) + 20
+    # Trust rule (camera data): -30 unless the models are already sure it is fake
+    trust = np.where(model_score < 80, model_score - 30, model_score)
+    fake_probability = np.clip(np.where(has_camera_data, trust, ghost), 0, 100)
+
+    credibility = 100 - fake_probability
+    capped = ~has_camera_data & (credibility > suspicious_below)
+    verdict = np.select(
+        [credibility < ai_below, credibility < suspicious_below, capped],
+        [VERDICTS.index("AI Generated"), VERDICTS.index("Suspicious / Unverified"), VERDICTS.index("Unverified Source (No Metadata)")],
+        default=VERDICTS.index("Likely Real"),
+    ).astype(np.int8)
+    return np.where(capped, float(suspicious_below), credibility), verdict
+
+
+def cascade_decides(first_score, has_camera_data, fft_penalty, fake_above=70, real_below=5):
+    """
+    True when the cascade may skip the second model, given the first model's score and the forensics.
+
+    Fake side (exact): the ensemble score will be max(first, second) >= first_score. fuse_scores
+    only dips once as the score rises (at MODEL_UNSURE_BELOW, where the spectral rule stops
+    applying), so its minimum over [first_score, 100] is at one of the two points below. If even
+    that minimum is above `fake_above`, no second score can lower the fake probability under it.
+    Real side (a policy bet, not exact): verified camera EXIF and a first model at most `real_below`.
+    """
+    lowest = min(
+        fuse_scores(first_score, has_camera_data, fft_penalty)[0],
+        fuse_scores(max(first_score, MODEL_UNSURE_BELOW), has_camera_data, fft_penalty)[0],
+    )
+    if lowest > fake_above:
+        return True
+    return bool(has_camera_data) and first_score <= real_below
+
+
 class DeepfakeDetectorLogic:
-    def load_models(self):
+    # Default number of images per forward pass in analyze_batch()
+    batch_size = 8
+
+    # Concurrency: the CPU-only forensic layers run on a thread pool while the models run.
+    # parallel_models=None means auto: Model A and Model B run side by side on GPU, serially on CPU
+    # (where they would only compete for the same intra-op threads).
+    forensic_workers = 4
+    parallel_models = None
+    _forensic_pool = None
+    _model_pool = None
+
+    # When True, every result carries a "timings" dict of per-stage wall times (ms)
+    record_timings = False
+
+    # When True, every result carries "peak_rss_mb": the process peak RSS during its analysis.
+    # Each analysis first resets the kernel's peak counter (/proc/self/clear_refs), which walks
+    # the page tables, so this is for benchmark / evaluate runs rather than the serving path
+    record_peak_rss = False
+
+    # When True, result["signals"] also carries the FFT radial profile (for signal_store; too bulky for API responses)
+    record_spectrum = False
+
+    # Startup phases (ms) of this instance: imports, model loads, warm-up (see load_models / warmup)
+    startup_timings = None
+
+    # Model runtime: "torch", "onnx" or "onnx-int8" (CPU boxes); onnx_threads=None uses every available core
+    inference_backend = "torch"
+    onnx_threads = None
+
+    # Confidence cascade for stills (off by default): run `cascade_first` ("model_a" or "model_b")
+    # alongside the forensic layers, and the other model only when cascade_decides() says the
+    # partial result is still uncertain. With 70 the fake-side skip never changes a verdict
+    # ("AI Generated" is credibility < 30); cascade_real_below trades accuracy for compute.
+    cascade = False
+    cascade_first = "model_a"
+    cascade_fake_above = 70
+    cascade_real_below = 5
+
+    # Video sampling (analyze_video)
+    video_sample_interval_s = 1.0        # take one frame per interval...
+    video_scene_check_interval_s = 0.25  # ...plus any frame where a scene cut is detected at this granularity
+    video_scene_change_threshold = 0.4   # Bhattacharyya distance between gray histograms that counts as a cut
+    video_max_frames = 48                # hard frame budget per clip
+    video_batch_frames = 8               # frames per ensemble pass
+    video_min_frames = 8                 # frames required before an early exit is allowed
+    video_confident_fake = 70            # early exit when the mean frame score is surely above this...
+    video_confident_real = 35            # ...or surely below this (mean +/- 2 standard errors)
+
+    def load_models(self, device=None, batch_size=None, backend=None):
+        """
+        device: HuggingFace pipeline device (0 = first GPU, -1 = CPU).
+                Defaults to the GPU when torch can see one, otherwise the CPU.
+        backend: "torch" (HF pipelines), or "onnx" / "onnx-int8" for ONNX Runtime on CPU
+                 (see onnx_backend.py). Defaults to self.inference_backend.
+        """
         print("Loading Forensics & Ensemble Models...")
+        # Per-phase startup breakdown (ms), extended by warmup() and DetectorWorker.start_worker()
+        self.startup_timings = timings = {}
+        if batch_size is not None:
+            self.batch_size = batch_size
+        backend = backend or self.inference_backend
+        self.inference_backend = backend
+
+        if backend in ("onnx", "onnx-int8"):
+            try:
+                from onnx_backend import load_pipelines
+            except ImportError:
+                from backend.onnx_backend import load_pipelines
+            self.pipe1, self.pipe2 = _timed(timings, "model_load_ms", lambda: load_pipelines(
+                quantized=backend == "onnx-int8", intra_op_threads=self.onnx_threads))
+            if self.parallel_models is None:
+                # Both sessions already use every core through intra-op threads
+                self.parallel_models = False
+            print(f"Production Ensemble Loaded (backend={backend}).")
+            return
+        if backend != "torch":
+            raise ValueError(f"Unknown inference backend: {backend}")
+
+        # transformers + torch are the bulk of a cold start: imported here, not at module load
+        started = time.perf_counter()
+        import torch
         from transformers import pipeline
+        timings["import_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+        if device is None:
+            device = 0 if torch.cuda.is_available() else -1
+
+        def load(model_id):
+            # A local directory is read straight from disk; a Hub id costs metadata requests even when cached
+            return pipeline("image-classification", model=local_model_dir(model_id) or model_id, device=device)
 
         # Model 1: General Purpose AI Detector
-        self.pipe1 = pipeline("image-classification", model="umm-maybe/AI-image-detector", device=0)
+        self.pipe1 = _timed(timings, "model_a_load_ms", load, MODEL_A_ID)
 
         # Model 2: The Specialist (Deepfake vs Real)
-        self.pipe2 = pipeline("image-classification", model="dima806/deepfake_vs_real_image_detection", device=0)
+        self.pipe2 = _timed(timings, "model_b_load_ms", load, MODEL_B_ID)
+
+        if self.parallel_models is None:
+            self.parallel_models = device != -1
+
+        print(f"Production Ensemble Loaded (device={device}).")
+
+    def warmup(self, batch_sizes=None):
+        """
+        Throwaway analyses of a synthetic image, one per batch shape (default: 1 and
+        self.batch_size), so the first real request does not pay for lazy imports
+        (cv2), allocator growth or kernel selection. Records warmup_ms.
+        """
+        import numpy as np
+        from PIL import Image
 
-        print("Production Ensemble Loaded.")
+        started = time.perf_counter()
+        image = Image.fromarray(np.random.default_rng(0).integers(0, 255, (256, 256, 3), dtype=np.uint8))
+        # Both models must run, whatever the cascade would decide
+        cascade, self.cascade = self.cascade, False
+        try:
+            for size in batch_sizes or sorted({1, self.batch_size}):
+                self.analyze_batch([(image, "image/png")] * size, batch_size=size)
+        finally:
+            self.cascade = cascade
+        if self.startup_timings is None:
+            self.startup_timings = {}
+        self.startup_timings["warmup_ms"] = round((time.perf_counter() - started) * 1000, 3)
 
-    def analyze_metadata(self, img_path):
+    def analyze_metadata(self, image):
         """
         Forensic Layer 1: EXIF Data
         Real photos usually have Camera Maker, Model, ISO, etc.
         AI images usually strip this or have none.
         """
-        from PIL import Image, ExifTags
         try:
-            img = Image.open(img_path)
-            exif_data = img._getexif()
-
-            if not exif_data:
-                return False, "No Camera Metadata found (Suspicious for original files)"
-
+            image = LoadedImage.from_source(image)
+            if image.exif_error:
+                raise ValueError("EXIF block unreadable")
             # Check for specific camera tags
-            found_camera_tags = False
-            details = []
-            for tag, value in exif_data.items():
-                tag_name = ExifTags.TAGS.get(tag, tag)
-                if tag_name in ['Make', 'Model', 'ISOSpeedRatings', 'DateTimeOriginal']:
-                    found_camera_tags = True
-                    details.append(f"{tag_name}: {str(value)[:20]}")
-
-            if found_camera_tags:
-                return True, f"Camera Signature Detected: {', '.join(details)}"
-            else:
-                return False, "Metadata present but lacks Camera Signature"
+            return metadata_finding(image.exif)
 
         except Exception:
             return False, "Metadata extraction failed"
 
-    def analyze_frequency_domain(self, img_path):
+    def analyze_frequency_domain(self, image):
         """
         Forensic Layer 2: Fast Fourier Transform (FFT)
         Real cameras produce a specific 'power law' falloff in frequency.
         AI Generators (GANs/Diffusion) often leave 'grid artifacts' or unnatural energy drops in the spectrum.
         """
-        import cv2
-        import numpy as np
-
         try:
-            img = cv2.imread(img_path, 0) # Load grayscale
+            avg_high_freq_energy = self.spectral_signature(image)["energy"]
+
+            # Thresholds (tuned for 1080p images): FFT_SMOOTH_BELOW / FFT_GRAIN_ABOVE
+            score_penalty, status = fft_penalty_for(avg_high_freq_energy)
+
+            return score_penalty, f"Spectral Energy: {avg_high_freq_energy:.1f} ({status})"
 
-            # FFT Transform
-            f = np.fft.fft2(img)
-            fshift = np.fft.fftshift(f)
-            magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-8)
+        except Exception as e:
+            return 0, f"FFT Failed: {str(e)}"
 
-            # Calculate Azimuthal Average (Energy distribution from center to edge)
-            h, w = magnitude_spectrum.shape
-            center_h, center_w = h // 2, w // 2
+    def spectral_signature(self, image):
+        """
+        Spectrum statistics behind Forensic Layer 2, computed once per LoadedImage.
+        energy: mean log-magnitude over the full spectrum with the low-frequency centre zeroed
+        radial_profile: azimuthal average of the log-magnitude, SPECTRUM_RADIAL_BINS bins from DC to Nyquist
+        """
+        loaded = LoadedImage.from_source(image)
+        if loaded._spectrum is None:
+            loaded._spectrum = spectral_signature(loaded.spectrum_view)
+        return loaded._spectrum
 
-            # Analyze the High Frequency (Edge) Energy vs Low Frequency (Center)
-            # Real photos have chaotic high-frequency noise.
-            # AI (even with grain) often has structured or dampened high-freq energy.
+    def model_a_score(self, res1):
+        # Model 1 (General) labels: FAKE/AI/ARTIFICIAL vs REAL
+        m1_score = 0.0
+        for item in res1:
+            if item['label'] in ['FAKE', 'AI', 'ARTIFICIAL']: m1_score = item['score'] * 100
+            elif item['label'] == 'REAL': m1_score = (1 - item['score']) * 100
+        return m1_score
 
-            # Mask the center (Low Freq)
-            mask_size = 30
-            magnitude_spectrum[center_h-mask_size:center_h+mask_size, center_w-mask_size:center_w+mask_size] = 0
+    def model_b_score(self, res2):
+        # Model 2 (Specialist) labels: *fake*/*ai* vs *real*
+        m2_score = 0.0
+        for item in res2:
+            lbl = item['label'].lower()
+            if 'fake' in lbl or 'ai' in lbl: m2_score = item['score'] * 100
+            elif 'real' in lbl: m2_score = (1 - item['score']) * 100
+        return m2_score
 
-            avg_high_freq_energy = np.mean(magnitude_spectrum)
+    def analyze_image(self, image, file_type="image"):
+        """
+        Entry point for in-memory media: accepts a path, raw bytes, a PIL image or a numpy array.
+        The image is decoded once and the same pixels/EXIF feed every layer below.
+        """
+        if self.cascade:
+            return self.analyze_batch([(image, file_type)], batch_size=1)[0]
 
-            # Thresholds (tuned for 1080p images)
-            # AI images often have lower 'chaotic' energy than real sensors
-            score_penalty = 0
-            status = "Normal Spectrum"
+        timings = {} if self.record_timings else None
+        started = time.perf_counter()
+        memory = self._track_memory()
+        try:
+            loaded = _timed(timings, "decode_ms", LoadedImage.from_source, image)
+            forensics = self._start_forensics(loaded, timings)
 
-            if avg_high_freq_energy < 85:
-                score_penalty = 40
-                status = "Abnormal Frequency Drop-off (Synthetic Smoothness)"
-            elif avg_high_freq_energy > 160:
-                # Too much uniform noise (artificial grain added)
-                score_penalty = 20
-                status = "Uniform Noise Pattern (Artificial Grain)"
+            # --- STEP 1: AI MODEL ENSEMBLE ---
+            res1, res2 = self._run_models(
+                lambda: _timed(timings, "model_a_ms", self.pipe1, loaded.rgb),
+                lambda: _timed(timings, "model_b_ms", self.pipe2, loaded.rgb),
+            )
+            m1_score = self.model_a_score(res1)
+            m2_score = self.model_b_score(res2)
 
-            return score_penalty, f"Spectral Energy: {avg_high_freq_energy:.1f} ({status})"
+            result = self._score_image(loaded, m1_score, m2_score, file_type, forensics, timings)
 
+        except ImageTooLarge as e:
+            result = {"status": "error", "message": str(e)}
         except Exception as e:
-            return 0, f"FFT Failed: {str(e)}"
+            result = {"status": "error", "message": f"Analysis failed: {str(e)}"}
 
-    def analyze_local_file(self, local_filename, file_type):
+        return self._attach_timings(result, timings, started, memory=memory)
+
+    def analyze_batch(self, items, batch_size=None, progress=None):
+        """
+        Batched version of analyze_local_file.
+        items: list of (source, file_type) or (source, file_type, header) tuples, or bare
+        sources (treated as images). header: a still's header read (worker.header_hint);
+        its EXIF, and the Forensic Layer 1 result already drawn from it, are used when
+        the body turns out to be the same image.
+        Both pipelines run once over all decodable images with `batch_size` images per
+        forward pass. Returns one result dict per item, in order; a file that fails to
+        decode or score gets its own error dict without failing the rest of the batch.
+        progress: optional callable(index, stage), called as each item passes
+        "model_a", "model_b", "forensics" and "verdict" (from worker threads).
+        """
+        batch_size = batch_size or self.batch_size
+        results = [None] * len(items)
+        loaded = []  # (index, LoadedImage, file_type, forensic futures, timings)
+        started = time.perf_counter()
+        memory = self._track_memory()
+
+        for idx, item in enumerate(items):
+            source, file_type, header = (tuple(item) + (None,))[:3] if isinstance(item, tuple) else (item, "image", None)
+            if not file_type.startswith("image"):
+                results[idx] = self.analyze_local_file(source, file_type)
+                _notify(progress, [idx], "verdict")
+                continue
+            timings = {} if self.record_timings else None
+            try:
+                img = _timed(timings, "decode_ms", LoadedImage.from_source, source, header=header)
+                metadata = header.get("metadata") if header is not None and img.exif_from_header else None
+                loaded.append((idx, img, file_type, self._start_forensics(img, timings, metadata), timings))
+            except ImageTooLarge as e:
+                results[idx] = self._attach_timings({"status": "error", "message": str(e)}, timings, started)
+            except Exception as e:
+                results[idx] = self._attach_timings({"status": "error", "message": f"Analysis failed: {str(e)}"}, timings, started)
+
+        if loaded:
+            images = [img.rgb for _, img, _, _, _ in loaded]
+            indices = [idx for idx, _, _, _, _ in loaded]
+            batch_timings = {} if self.record_timings else None
+
+            def run_model(stage, pipe, subset=None):
+                # subset: positions in `loaded` to run (None = all of them)
+                subset = range(len(loaded)) if subset is None else subset
+                batch = [images[k] for k in subset]
+                outputs = _timed(batch_timings, f"{stage}_ms", self._run_pipeline, pipe, batch, batch_size) if batch else []
+                _notify(progress, [indices[k] for k in subset], stage)
+                model_runs[stage] = len(batch)
+                return outputs
+
+            model_runs = {}
+            if self.cascade:
+                res1, res2 = self._run_cascade(loaded, run_model)
+            else:
+                res1, res2 = self._run_models(
+                    lambda: run_model("model_a", self.pipe1),
+                    lambda: run_model("model_b", self.pipe2),
+                )
+
+            for (idx, img, file_type, forensics, timings), r1, r2 in zip(loaded, res1, res2):
+                if timings is not None:
+                    # Model time is shared by the items that ran it: report each one's amortised share
+                    for stage, r in (("model_a", r1), ("model_b", r2)):
+                        if r is not None and f"{stage}_ms" in batch_timings:
+                            timings[f"{stage}_ms"] = round(batch_timings[f"{stage}_ms"] / model_runs[stage], 3)
+                try:
+                    for r in (r1, r2):
+                        if isinstance(r, Exception):
+                            raise r
+                    if progress is not None:
+                        for future in forensics:
+                            future.result()
+                        _notify(progress, [idx], "forensics")
+                    m1_score = self.model_a_score(r1) if r1 is not None else None
+                    m2_score = self.model_b_score(r2) if r2 is not None else None
+                    results[idx] = self._score_image(img, m1_score, m2_score, file_type, forensics, timings)
+                except Exception as e:
+                    results[idx] = {"status": "error", "message": f"Analysis failed: {str(e)}"}
+                self._attach_timings(results[idx], timings, started, share=len(loaded), memory=memory)
+                _notify(progress, [idx], "verdict")
+
+        return results
+
+    def _run_cascade(self, loaded, run_model):
+        """
+        First model over the whole batch, then the second model only over the items whose
+        partial result cascade_decides() leaves open. Returns (res1, res2) aligned with
+        `loaded`, with None where a model was skipped.
+        """
+        stages = {"model_a": self.pipe1, "model_b": self.pipe2}
+        scorers = {"model_a": self.model_a_score, "model_b": self.model_b_score}
+        first = self.cascade_first
+        second = "model_b" if first == "model_a" else "model_a"
+
+        first_res = run_model(first, stages[first])
+        undecided = []
+        for k, ((_, _, _, forensics, _), r) in enumerate(zip(loaded, first_res)):
+            try:
+                if isinstance(r, Exception):
+                    raise r
+                has_camera_data, _ = forensics[0].result()
+                fft_penalty, _ = forensics[1].result()
+                if cascade_decides(scorers[first](r), has_camera_data, fft_penalty,
+                                   self.cascade_fake_above, self.cascade_real_below):
+                    continue
+            except Exception:
+                pass  # let the scoring step report the failure
+            undecided.append(k)
+
+        second_res = [None] * len(loaded)
+        for k, r in zip(undecided, run_model(second, stages[second], undecided)):
+            second_res[k] = r
+        return (first_res, second_res) if first == "model_a" else (second_res, first_res)
+
+    def _track_memory(self):
+        # Per-analysis peak RSS (record_peak_rss); needs a resettable peak (Linux)
+        return self.record_peak_rss and reset_peak_rss()
+
+    def _attach_timings(self, result, timings, started, share=1, memory=False):
+        # total_ms is the wall time since `started`, split evenly across `share` batch items
+        if timings is not None:
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000 / share, 3)
+            result["timings"] = timings
+        if memory:
+            # Process peak since the analysis (or batch) began: shared by the items decoded together
+            result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        return result
+
+    def _forensics_executor(self):
+        if self._forensic_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._forensic_pool = ThreadPoolExecutor(max_workers=self.forensic_workers, thread_name_prefix="forensics")
+        return self._forensic_pool
+
+    def _start_forensics(self, loaded, timings=None, metadata=None):
+        # EXIF + FFT are pure CPU work: start them now so they overlap with model inference.
+        # metadata: Layer 1's (has_camera_data, message) if it already ran on the header's EXIF
+        pool = self._forensics_executor()
+        if metadata is None:
+            meta_future = pool.submit(_timed, timings, "metadata_ms", self.analyze_metadata, loaded)
+        else:
+            from concurrent.futures import Future
+            meta_future = Future()
+            meta_future.set_result(tuple(metadata))
+        return (
+            meta_future,
+            pool.submit(_timed, timings, "fft_ms", self.analyze_frequency_domain, loaded),
+        )
+
+    def _run_models(self, run_a, run_b):
+        # Model A on the calling thread; Model B alongside it when parallel_models is on
+        if not self.parallel_models:
+            return run_a(), run_b()
+        if self._model_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._model_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-b")
+        future_b = self._model_pool.submit(run_b)
+        return run_a(), future_b.result()
+
+    def close_executors(self):
+        # Joins the forensic and model-B threads; both pools are recreated on the next analysis
+        for pool in (self._forensic_pool, self._model_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self._forensic_pool = self._model_pool = None
+
+    def _run_pipeline(self, pipe, images, batch_size):
+        # One batched pass; if it fails, retry item by item so a single bad input
+        # only costs its own result (returned as the Exception in its slot)
+        try:
+            return list(pipe(images, batch_size=batch_size))
+        except Exception:
+            outputs = []
+            for img in images:
+                try:
+                    outputs.append(pipe(img))
+                except Exception as e:
+                    outputs.append(e)
+            return outputs
+
+    def _score_image(self, loaded, m1_score, m2_score, file_type, forensics=None, timings=None):
+        """
+        forensics: futures from _start_forensics(), or None to start both layers here.
+        m1_score / m2_score: None for a model the cascade skipped.
+        """
         details = []
-        fake_probability = 0.0
-        has_camera_data = False
-        fft_penalty = 0
+        for name, score in (("A", m1_score), ("B", m2_score)):
+            if score is None:
+                details.append(f"AI Detection Model {name}: skipped (cascade)")
+            else:
+                details.append(f"AI Detection Model {name}: {score:.1f}% Fake Confidence")
+
+        # --- STEP 2: DIGITAL FORENSICS ---
+        if forensics is None:
+            forensics = self._start_forensics(loaded, timings)
+        meta_future, fft_future = forensics
+
+        # Metadata Check
+        has_camera_data, meta_msg = meta_future.result()
+        details.append(f"Metadata Analysis: {meta_msg}")
+
+        # Frequency Domain Check (The Leonardo Killer)
+        fft_penalty, fft_msg = fft_future.result()
+        details.append(f"Frequency Analysis: {fft_msg}")
+
+        # --- STEP 3: SCORING LOGIC (STRICT MODE) ---
+        scoring_started = time.perf_counter()
+
+        # Start with the highest model score (Pessimistic approach)
+        model_score = max(score for score in (m1_score, m2_score) if score is not None)
+        fake_probability, notes = fuse_scores(model_score, has_camera_data, fft_penalty)
+        details.extend(notes)
+        if m1_score is None or m2_score is None:
+            ran, skipped = ("B", "A") if m1_score is None else ("A", "B")
+            details.append(f"Cascade: Model {skipped} skipped (Model {ran} and forensics were decisive).")
 
+        result = self._final_verdict(fake_probability, has_camera_data, details, file_type)
+        # Raw layer outputs, so evaluation can re-score offline under other policies
+        spectrum = loaded._spectrum  # None if the FFT layer failed
+        result["signals"] = {
+            "model_a": m1_score,
+            "model_b": m2_score,
+            "has_camera_data": bool(has_camera_data),
+            "camera_tags": sorted(camera_signature(loaded.exif)) if has_camera_data else [],
+            "fft_penalty": fft_penalty,
+            "spectral_energy": spectrum["energy"] if spectrum else None,
+        }
+        if self.record_spectrum and spectrum:
+            result["signals"]["radial_profile"] = spectrum["radial_profile"].tolist()
+        result["decode"] = {"source_size": list(loaded.source_size), "decoded_size": list(loaded.rgb.size)}
+        if timings is not None:
+            timings["scoring_ms"] = round((time.perf_counter() - scoring_started) * 1000, 3)
+        return result
+
+    def analyze_local_file(self, local_filename, file_type):
         if file_type.startswith("image"):
-            try:
-                # --- STEP 1: AI MODEL ENSEMBLE ---
-                # Model 1 (General)
-                res1 = self.pipe1(local_filename)
-                m1_score = 0.0
-                for item in res1:
-                    if item['label'] in ['FAKE', 'AI', 'ARTIFICIAL']: m1_score = item['score'] * 100
-                    elif item['label'] == 'REAL': m1_score = (1 - item['score']) * 100
-
-                # Model 2 (Specialist)
-                res2 = self.pipe2(local_filename)
-                m2_score = 0.0
-                for item in res2:
-                    lbl = item['label'].lower()
-                    if 'fake' in lbl or 'ai' in lbl: m2_score = item['score'] * 100
-                    elif 'real' in lbl: m2_score = (1 - item['score']) * 100
-
-                details.append(f"AI Detection Model A: {m1_score:.1f}% Fake Confidence")
-                details.append(f"AI Detection Model B: {m2_score:.1f}% Fake Confidence")
-
-                # --- STEP 2: DIGITAL FORENSICS ---
-
-                # Metadata Check
-                has_camera_data, meta_msg = self.analyze_metadata(local_filename)
-                details.append(f"Metadata Analysis: {meta_msg}")
-
-                # Frequency Domain Check (The Leonardo Killer)
-                fft_penalty, fft_msg = self.analyze_frequency_domain(local_filename)
-                details.append(f"Frequency Analysis: {fft_msg}")
-
-                # --- STEP 3: SCORING LOGIC (STRICT MODE) ---
-
-                # Start with the highest model score (Pessimistic approach)
-                fake_probability = max(m1_score, m2_score)
-
-                # HEURISTIC 1: The "Ghost" Rule
-                # If there is NO metadata, the image loses "Benefit of the Doubt".
-                if not has_camera_data:
-                    fake_probability = max(fake_probability, 30) # Floor is now 30% Fake
-
-                    # If Models are unsure (0-30%) BUT No Metadata + FFT Artifacts -> FLAG IT
-                    if fake_probability < 40 and fft_penalty > 0:
-                        fake_probability += fft_penalty
-                        details.append("Pattern Match: Synthetic frequency patterns detected.")
-
-                    # Heavy penalty for "No Metadata"
-                    fake_probability += 20
-                    details.append("Trust Penalty: Missing digital provenance (Metadata).")
-
-                # HEURISTIC 2: The "Trust" Rule
-                # If we have confirmed Camera Metadata (e.g. 'iPhone 13 Pro', 'ISO 80'), we trust it significantly
-                elif has_camera_data and fake_probability < 80:
-                    fake_probability -= 30
-                    details.append("Trust Boost: Verified Camera Source.")
+            return self.analyze_image(local_filename, file_type)
 
-            except Exception as e:
-                return {"status": "error", "message": f"Analysis failed: {str(e)}"}
+        if file_type.startswith("video"):
+            return self.analyze_video(local_filename, file_type)
+
+        return self._final_verdict(0.0, False, [], file_type)
+
+    def analyze_video(self, video_path, file_type="video"):
+        """
+        Streams the clip with cv2.VideoCapture (frames are decoded one at a time, never the whole file).
+        A frame is sampled every `video_sample_interval_s` seconds and additionally on scene cuts.
+        Sampled frames go through the model ensemble in batches and through the FFT layer,
+        and the per-frame fake scores are averaged into the verdict.
+        Sampling stops early once the running mean is confidently on one side of the verdict bands.
+        """
+        import math
+        import cv2
+        from PIL import Image
+
+        started = time.perf_counter()
+        memory = self._track_memory()
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return {"status": "error", "message": "Analysis failed: could not open video stream"}
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or math.isnan(fps) or fps <= 0:
+            fps = 25.0
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        scene_check_step = max(1, int(round(fps * self.video_scene_check_interval_s)))
+
+        frames = []    # per-frame records, in order
+        scores = []    # fake probability of every successfully scored frame
+        pending = []   # (record, LoadedImage) waiting for the next ensemble pass
+        last_hist = None
+        next_sample_t = 0.0
+        frame_idx = -1
+        early_exit = False
+        decode_started = time.perf_counter()
+
+        try:
+            while len(frames) + len(pending) < self.video_max_frames:
+                if not cap.grab():
+                    break
+                frame_idx += 1
+                t = frame_idx / fps
+                due = t >= next_sample_t
+                if not due and frame_idx % scene_check_step:
+                    continue
+
+                ok, frame = cap.retrieve()
+                if not ok:
+                    continue
+                if frame.shape[0] * frame.shape[1] > DECODE_MAX_PIXELS:
+                    # Same working resolution as stills: every later copy of the frame stays small
+                    frame = cv2.resize(frame, _fit_pixels(frame.shape[1], frame.shape[0], DECODE_MAX_PIXELS), interpolation=cv2.INTER_AREA)
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                hist = cv2.calcHist([cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)], [0], None, [32], [0, 256])
+                cv2.normalize(hist, hist)
+                scene_cut = last_hist is not None and cv2.compareHist(last_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > self.video_scene_change_threshold
+                if not (due or scene_cut):
+                    continue
+
+                last_hist = hist
+                next_sample_t = t + self.video_sample_interval_s
+                loaded = LoadedImage(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                loaded._gray = gray
+                record = {
+                    "frame": frame_idx,
+                    "time_s": round(t, 3),
+                    "trigger": "interval" if due else "scene_change",
+                    # Includes grabbing the skipped frames since the previous sample
+                    "decode_ms": round((time.perf_counter() - decode_started) * 1000, 2),
+                }
+                pending.append((record, loaded))
+
+                if len(pending) >= self.video_batch_frames:
+                    self._score_frames(pending, frames, scores)
+                    pending = []
+                    if self._video_confident(scores):
+                        early_exit = True
+                        break
+                decode_started = time.perf_counter()
+
+            if pending:
+                self._score_frames(pending, frames, scores)
+        except Exception as e:
+            return {"status": "error", "message": f"Analysis failed: {str(e)}"}
+        finally:
+            cap.release()
+
+        if not scores:
+            return {"status": "error", "message": "Analysis failed: no decodable frames in video"}
+
+        mean_score = sum(scores) / len(scores)
+        flagged_fft = sum(1 for f in frames if f.get("fft_penalty"))
+        details = [
+            f"Video Sampling: {len(scores)} frames analyzed across {frames[-1]['time_s']:.1f}s"
+            + (f" of {total_frames / fps:.1f}s" if total_frames else ""),
+            f"AI Detection Ensemble: {mean_score:.1f}% mean / {max(scores):.1f}% peak Fake Confidence across frames",
+            f"Frequency Analysis: {flagged_fft}/{len(frames)} frames with abnormal spectra",
+        ]
+        if early_exit:
+            details.append(f"Early Exit: verdict settled after {len(scores)} frames.")
+
+        result = self._final_verdict(mean_score, False, details, file_type)
+        result["video"] = {
+            "fps": fps,
+            "total_frames": total_frames,
+            "frames_analyzed": len(scores),
+            "early_exit": early_exit,
+        }
+        result["frames"] = frames
+        if self.record_timings:
+            timings = {stage: round(sum(f.get(stage, 0) for f in frames), 3) for stage in ("decode_ms", "model_ms", "fft_ms")}
+            self._attach_timings(result, timings, started, memory=memory)
+        return result
+
+    def _score_frames(self, pending, frames, scores):
+        def timed_fft(loaded):
+            t0 = time.perf_counter()
+            fft_penalty, _ = self.analyze_frequency_domain(loaded)
+            return fft_penalty, (time.perf_counter() - t0) * 1000
+
+        pool = self._forensics_executor()
+        fft_futures = [pool.submit(timed_fft, loaded) for _, loaded in pending]
+
+        images = [loaded.rgb for _, loaded in pending]
+        t0 = time.perf_counter()
+        res1, res2 = self._run_models(
+            lambda: self._run_pipeline(self.pipe1, images, self.video_batch_frames),
+            lambda: self._run_pipeline(self.pipe2, images, self.video_batch_frames),
+        )
+        model_ms = (time.perf_counter() - t0) * 1000 / len(pending)
+
+        for (record, loaded), r1, r2, fft_future in zip(pending, res1, res2, fft_futures):
+            record["model_ms"] = round(model_ms, 2)
+            error = r1 if isinstance(r1, Exception) else r2 if isinstance(r2, Exception) else None
+            if error is not None:
+                record["error"] = str(error)
+                frames.append(record)
+                continue
+
+            m1_score = self.model_a_score(r1)
+            m2_score = self.model_b_score(r2)
+            fft_penalty, fft_ms = fft_future.result()
+            record["fft_ms"] = round(fft_ms, 2)
+
+            # Same pessimistic ensemble as stills; spectral artifacts only count when the models are unsure.
+            # The metadata rules do not apply: video containers carry no camera EXIF.
+            fake_probability = max(m1_score, m2_score)
+            if fake_probability < MODEL_UNSURE_BELOW and fft_penalty > 0:
+                fake_probability += fft_penalty
+            fake_probability = min(fake_probability, 100)
+
+            record.update({
+                "m1_score": round(m1_score, 2),
+                "m2_score": round(m2_score, 2),
+                "fft_penalty": fft_penalty,
+                "fake_probability": round(fake_probability, 2),
+            })
+            frames.append(record)
+            scores.append(fake_probability)
 
-        elif file_type.startswith("video"):
-            fake_probability = 50.0
-            details.append("Video analysis running in basic mode.")
+    def _video_confident(self, scores):
+        n = len(scores)
+        if n < self.video_min_frames:
+            return False
+        mean = sum(scores) / n
+        stderr = (sum((s - mean) ** 2 for s in scores) / (n - 1)) ** 0.5 / n ** 0.5
+        return mean - 2 * stderr > self.video_confident_fake or mean + 2 * stderr < self.video_confident_real
 
+    def _final_verdict(self, fake_probability, has_camera_data, details, file_type):
         # --- FINAL VERDICT ---
-        fake_probability = min(max(fake_probability, 0), 100)
-        credibility_score = 100 - fake_probability
-
-        verdict = "Likely Real"
-
-        # Override Verdicts based on strict rules
-        if credibility_score < 30:
-            verdict = "AI Generated"
-        elif credibility_score < 65: # Tightened threshold from 60 to 65
-            verdict = "Suspicious / Unverified"
-        elif not has_camera_data and credibility_score > 65:
-            # CAP CREDIBILITY for non-metadata images
-            credibility_score = 65
-            verdict = "Unverified Source (No Metadata)"
+        credibility_score, verdict, capped = verdict_for(fake_probability, has_camera_data)
+        if capped:
             details.append("Result Capped: Cannot verify authenticity without metadata.")
 
         return {
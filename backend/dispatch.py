@@ -0,0 +1,129 @@
+import asyncio
+
+
+class ModalDispatcher:
+    """
+    Sends analyses to the deployed Modal worker.
+    The class handle is resolved once (at startup, or on first use if Modal was
+    unreachable then) and every call uses Modal's async API, so a slow inference
+    never blocks the API's event loop.
+    """
+
+    def __init__(self, app_name, class_name):
+        self.app_name = app_name
+        self.class_name = class_name
+        self._remote = None
+
+    async def start(self):
+        import modal
+
+        print(f"Looking up Modal Class: {self.class_name} in App: {self.app_name}...")
+        cls = modal.Cls.from_name(self.app_name, self.class_name)
+        await cls.hydrate.aio()
+        self._remote = cls()
+
+    async def analyze(self, read_url, file_type):
+        if self._remote is None:
+            await self.start()
+        return await self._remote.analyze_media.remote.aio(read_url, file_type)
+
+    async def analyze_events(self, read_url, file_type):
+        """Stage events, then the result (see DetectorWorker.analyze_url_events)."""
+        if self._remote is None:
+            await self.start()
+        async for event in self._remote.analyze_media_events.remote_gen.aio(read_url, file_type):
+            yield event
+
+    async def analyze_batch(self, read_urls, file_types):
+        """One result per URL, in order, from a single worker call (one batched ensemble pass)."""
+        if self._remote is None:
+            await self.start()
+        return await self._remote.analyze_media_batch.remote.aio(list(read_urls), list(file_types))
+
+
+class LocalDispatcher:
+    """
+    In-process stand-in for the Modal worker: runs DetectorWorker (and so
+    DeepfakeDetectorLogic) inside the API process. Same result contract,
+    so the API can be developed and load-tested without Modal.
+    Pass a pre-built worker (e.g. with stand-in pipelines) to skip loading the HF models.
+    """
+
+    def __init__(self, worker=None):
+        self.worker = worker
+
+    async def start(self):
+        if self.worker is None:
+            try:
+                from worker import DetectorWorker
+            except ImportError:
+                from backend.worker import DetectorWorker
+            self.worker = DetectorWorker()
+        if getattr(self.worker, "batcher", None) is None:
+            # Model loading is slow and blocking: keep it off the event loop
+            await asyncio.to_thread(self.worker.start_worker)
+
+    async def analyze(self, read_url, file_type):
+        if getattr(self.worker, "batcher", None) is None:
+            await self.start()
+        return await self.worker.analyze_url(read_url, file_type)
+
+    async def analyze_events(self, read_url, file_type):
+        if getattr(self.worker, "batcher", None) is None:
+            await self.start()
+        async for event in self.worker.analyze_url_events(read_url, file_type):
+            yield event
+
+    async def analyze_batch(self, read_urls, file_types):
+        if getattr(self.worker, "batcher", None) is None:
+            await self.start()
+        # Submitted together, the items land in the same micro-batch(es)
+        return await asyncio.gather(*[self.worker.analyze_url(url, file_type) for url, file_type in zip(read_urls, file_types)])
+
+
+class PoolDispatcher:
+    """
+    Sends analyses to a local_pool.LocalWorkerPool: several forked CPU worker
+    processes sharing one copy of the model weights. Same result contract as Modal.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool
+
+    async def start(self):
+        if self.pool is None:
+            try:
+                from local_pool import LocalWorkerPool
+            except ImportError:
+                from backend.local_pool import LocalWorkerPool
+            self.pool = LocalWorkerPool()
+        if not self.pool.started:
+            # Loads the models, then forks: blocking, so off the event loop
+            await asyncio.to_thread(self.pool.start)
+
+    async def analyze(self, read_url, file_type):
+        if self.pool is None or not self.pool.started:
+            await self.start()
+        return await self.pool.analyze_media(read_url, file_type)
+
+    async def analyze_events(self, read_url, file_type):
+        if self.pool is None or not self.pool.started:
+            await self.start()
+        async for event in self.pool.analyze_media_events(read_url, file_type):
+            yield event
+
+    async def analyze_batch(self, read_urls, file_types):
+        if self.pool is None or not self.pool.started:
+            await self.start()
+        return await self.pool.analyze_media_batch(read_urls, file_types)
+
+
+def make_dispatcher(backend, app_name, class_name):
+    """backend: "modal" (default), "local" (in-process) or "pool" (forked local CPU workers)."""
+    if backend == "local":
+        return LocalDispatcher()
+    if backend == "pool":
+        return PoolDispatcher()
+    if backend == "modal":
+        return ModalDispatcher(app_name, class_name)
+    raise ValueError(f"Unknown ANALYSIS_BACKEND: {backend}")
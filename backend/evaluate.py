@@ -1,11 +1,29 @@
 import os
 import sys
+import json
+import time
+import hashlib
+import argparse
 import mimetypes
+import multiprocessing
+from html import escape
+
+import numpy as np
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from detector_logic import DeepfakeDetectorLogic
+from detector_logic import (
+    AI_GENERATED_BELOW, FFT_GRAIN_ABOVE, FFT_SMOOTH_BELOW, SUSPICIOUS_BELOW, VERDICTS,
+    DeepfakeDetectorLogic, cascade_decides, detector_version, fuse_scores, score_signals, verdict_for,
+)
+from signal_store import SignalStore
+
+# Files per analyze_batch() call
+BATCH_SIZE = 16
+
+# Per-stage timings reported by DeepfakeDetectorLogic(record_timings=True)
+STAGES = ["decode_ms", "model_a_ms", "model_b_ms", "metadata_ms", "fft_ms", "scoring_ms", "total_ms"]
 
 def get_file_type(filepath):
     mime_type, _ = mimetypes.guess_type(filepath)
@@ -19,28 +37,138 @@ def get_file_type(filepath):
         return 'video/mp4'
     return 'application/octet-stream'
 
-def evaluate():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    dataset_dir = os.path.join(base_dir, 'dataset')
-    real_dir = os.path.join(dataset_dir, 'real')
-    fake_dir = os.path.join(dataset_dir, 'fake')
+def is_positive(verdict):
+    # Returns True if detected as Fake/Suspicious
+    return verdict in ["AI Generated", "Suspicious / Unverified"]
 
-    if not os.path.exists(real_dir) or not os.path.exists(fake_dir):
-        print(f"Dataset directories not found. Please create {real_dir} and {fake_dir}")
-        return
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-    real_files = [os.path.join(real_dir, f) for f in os.listdir(real_dir) if not f.startswith('.')]
-    fake_files = [os.path.join(fake_dir, f) for f in os.listdir(fake_dir) if not f.startswith('.')]
+# --- WORKER PROCESS ---
+# Each worker loads the models once and then scores chunks of files.
+_detector = None
 
-    if not real_files and not fake_files:
-        print("No files found in dataset directories. Please add images/videos to backend/dataset/real and backend/dataset/fake.")
-        return
+def init_worker(torch_threads=0, backend="torch"):
+    global _detector
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+    _detector = DeepfakeDetectorLogic()
+    _detector.record_timings = True
+    _detector.record_peak_rss = True
+    # The radial profile goes to the signal store (see run_pool), not to the checkpoint
+    _detector.record_spectrum = True
+    _detector.onnx_threads = torch_threads or None
+    _detector.load_models(backend=backend)
+    # No warm-up here: the first chunk's extra cost is part of the measured throughput anyway
+    print(f"Worker {os.getpid()} startup: {_detector.startup_timings}")
+
+def score_chunk(chunk):
+    """chunk: list of (file, path, label). Returns one checkpoint record per file."""
+    batch = _detector.analyze_batch([(path, get_file_type(path)) for _, path, _ in chunk])
+    records = []
+    for (name, path, label), res in zip(chunk, batch):
+        records.append({
+            "file": name,
+            "sha256": file_sha256(path),
+            "label": label,
+            "status": res.get("status"),
+            "verdict": res.get("verdict"),
+            "score": res.get("score"),
+            "message": res.get("message"),
+            "timings": res.get("timings", {}),
+            "peak_rss_mb": res.get("peak_rss_mb"),
+            "signals": res.get("signals"),
+        })
+    return records
 
-    print("Initializing DeepfakeDetector...")
-    detector = DeepfakeDetectorLogic()
-    detector.load_models()
-    print("Models loaded.")
+# --- CHECKPOINT (append-only JSONL, one record per scored file) ---
 
+def load_checkpoint(path):
+    """Returns the set of files already scored. Drops a torn last line left by a crash."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r+b') as f:
+        valid_end = 0
+        for line in f:
+            try:
+                done.add(json.loads(line)["file"])
+            except (ValueError, KeyError):
+                break
+            valid_end += len(line)
+        f.truncate(valid_end)
+    return done
+
+def iter_checkpoint(path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+def collect_files(dataset_dir):
+    files = []
+    for label in ['real', 'fake']:
+        label_dir = os.path.join(dataset_dir, label)
+        for name in sorted(os.listdir(label_dir)):
+            if not name.startswith('.'):
+                files.append((f"{label}/{name}", os.path.join(label_dir, name), label))
+    return files
+
+def run_pool(files, workers, batch_size, checkpoint_path, backend="torch", store=None):
+    """
+    Scores `files` and appends each record to the checkpoint as soon as its chunk finishes.
+    store: optional SignalStore that also receives every record's raw signals.
+    """
+    chunks = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    done = 0
+
+    pool = None
+    if workers <= 1:
+        init_worker(backend=backend)
+        results = map(score_chunk, chunks)
+    else:
+        # spawn: workers must not inherit a half-initialised torch/CUDA state
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=init_worker, initargs=(threads, backend))
+        results = pool.imap_unordered(score_chunk, chunks)
+
+    try:
+        with open(checkpoint_path, 'a') as out:
+            for records in results:
+                for record in records:
+                    if store is not None:
+                        store.append(record['sha256'], record['label'], record)
+                    if record.get('signals'):
+                        record['signals'].pop('radial_profile', None)
+                    out.write(json.dumps(record) + "\n")
+                out.flush()
+                done += len(records)
+                print(f"[{done}/{len(files)}] scored ({records[-1]['file']})")
+    finally:
+        if store is not None:
+            store.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return done
+
+# --- SUMMARY ---
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+def summarize(checkpoint_path):
     results = {
         'TP': 0, # Fake detected as Fake
         'TN': 0, # Real detected as Real
@@ -48,67 +176,179 @@ def evaluate():
         'FN': 0, # Fake detected as Real
         'errors': 0
     }
+    stage_values = {stage: [] for stage in STAGES}
+    peak_rss = None
+
+    for record in iter_checkpoint(checkpoint_path):
+        if record.get('peak_rss_mb') is not None:
+            peak_rss = max(peak_rss or 0.0, record['peak_rss_mb'])
+        for stage, ms in record.get('timings', {}).items():
+            if stage in stage_values:
+                stage_values[stage].append(ms)
+
+        if record['status'] != 'success':
+            results['errors'] += 1
+        elif record['label'] == 'fake':
+            results['TP' if is_positive(record['verdict']) else 'FN'] += 1
+        else:
+            results['FP' if is_positive(record['verdict']) else 'TN'] += 1
+
+    latency = {}
+    for stage, values in stage_values.items():
+        if values:
+            values.sort()
+            latency[stage] = {pct: percentile(values, pct) for pct in (50, 90, 99)}
+
+    total = results['TP'] + results['TN'] + results['FP'] + results['FN']
+    results['total'] = total
+    results['accuracy'] = (results['TP'] + results['TN']) / total if total > 0 else 0
+    results['precision'] = results['TP'] / (results['TP'] + results['FP']) if (results['TP'] + results['FP']) > 0 else 0
+    results['recall'] = results['TP'] / (results['TP'] + results['FN']) if (results['TP'] + results['FN']) > 0 else 0
+    results['latency'] = latency
+    results['peak_rss_mb'] = peak_rss
+    return results
+
+# --- CASCADE TRADE-OFF (replayed offline from the full-ensemble signals) ---
+
+def simulate_cascade(checkpoint_path, first="model_a", fake_above=70, real_below=5):
+    """
+    Replays a cascade policy (see DeepfakeDetectorLogic.cascade) over the signals recorded
+    by a full-ensemble run: which files would have skipped the second model, what their
+    verdicts would have been, and the model time that would have been spent.
+    """
+    second = "model_b" if first == "model_a" else "model_a"
+    files = skipped = changed = correct_full = correct_cascade = 0
+    full_ms = cascade_ms = 0.0
+
+    for record in iter_checkpoint(checkpoint_path):
+        signals = record.get('signals')
+        if record['status'] != 'success' or not signals or signals.get(first) is None or signals.get(second) is None:
+            continue
+        files += 1
+        timings = record.get('timings', {})
+        first_ms, second_ms = timings.get(f"{first}_ms", 0.0), timings.get(f"{second}_ms", 0.0)
+        full_ms += first_ms + second_ms
+        cascade_ms += first_ms
+
+        verdict = record['verdict']
+        has_camera_data, fft_penalty = signals['has_camera_data'], signals['fft_penalty']
+        if cascade_decides(signals[first], has_camera_data, fft_penalty, fake_above, real_below):
+            skipped += 1
+            fake_probability, _ = fuse_scores(signals[first], has_camera_data, fft_penalty)
+            verdict = verdict_for(fake_probability, has_camera_data)[1]
+        else:
+            cascade_ms += second_ms
+
+        is_fake = record['label'] == 'fake'
+        changed += verdict != record['verdict']
+        correct_full += is_positive(record['verdict']) == is_fake
+        correct_cascade += is_positive(verdict) == is_fake
+
+    if not files:
+        return None
+    return {
+        'policy': {'first': first, 'fake_above': fake_above, 'real_below': real_below},
+        'files': files,
+        'skip_rate': skipped / files,
+        'verdicts_changed': changed,
+        'full': {'accuracy': correct_full / files, 'model_passes': 2.0, 'model_ms': full_ms / files},
+        'cascade': {'accuracy': correct_cascade / files, 'model_passes': 2.0 - skipped / files, 'model_ms': cascade_ms / files},
+    }
 
-    details_log = []
+# --- THRESHOLD SWEEP (re-scored from the signal store, no model loaded) ---
 
-    def is_positive(verdict):
-        # Returns True if detected as Fake/Suspicious
-        return verdict in ["AI Generated", "Suspicious / Unverified"]
+def confusion(predicted, actual):
+    tp = int(np.count_nonzero(predicted & actual))
+    fp = int(np.count_nonzero(predicted & ~actual))
+    fn = int(np.count_nonzero(~predicted & actual))
+    tn = int(np.count_nonzero(~predicted & ~actual))
+    total = tp + fp + fn + tn
+    return {
+        'TP': tp, 'FP': fp, 'FN': fn, 'TN': tn,
+        'accuracy': (tp + tn) / total if total else 0.0,
+        'precision': tp / (tp + fp) if tp + fp else 1.0,
+        'recall': tp / (tp + fn) if tp + fn else 0.0,
+        'fpr': fp / (fp + tn) if fp + tn else 0.0,
+    }
 
-    print("\n--- Starting Evaluation ---\n")
+def sweep(signals_path, version=None):
+    """
+    Replays the scoring over every stored image under other thresholds (see score_signals):
+    the ROC / PR curve of the "Suspicious" credibility threshold, and a grid over the
+    two spectral-energy thresholds. A 100k-image store takes seconds.
+    """
+    started = time.perf_counter()
+    data = SignalStore.load(signals_path, version=version)
+    if data is None:
+        return None
+    labelled = data['label'] >= 0
+    data = {column: values[labelled] for column, values in data.items()}
+    load_s = time.perf_counter() - started
+    actual = data['label'] == 1
+    signals = (data['model_a'], data['model_b'], data['has_camera_data'], data['spectral_energy'])
+    positive = (VERDICTS.index("Suspicious / Unverified"), VERDICTS.index("AI Generated"))
 
-    # Evaluate Real Files (Expecting Negative)
-    print(f"Processing {len(real_files)} Real files...")
-    for fpath in real_files:
-        try:
-            ftype = get_file_type(fpath)
-            print(f"Analyzing {os.path.basename(fpath)}...")
-            res = detector.analyze_local_file(fpath, ftype)
-            verdict = res['verdict']
-            score = res['score']
-            
-            if is_positive(verdict):
-                results['FP'] += 1
-                details_log.append(f"[FALSE POSITIVE] {os.path.basename(fpath)}: {verdict} (Score: {score})")
-            else:
-                results['TN'] += 1
-                details_log.append(f"[CORRECT REAL] {os.path.basename(fpath)}: {verdict} (Score: {score})")
-                
-        except Exception as e:
-            print(f"Error processing {fpath}: {e}")
-            results['errors'] += 1
+    def predicted(**thresholds):
+        return np.isin(score_signals(*signals, **thresholds)[1], positive)
 
-    # Evaluate Fake Files (Expecting Positive)
-    print(f"\nProcessing {len(fake_files)} Fake files...")
-    for fpath in fake_files:
-        try:
-            ftype = get_file_type(fpath)
-            print(f"Analyzing {os.path.basename(fpath)}...")
-            res = detector.analyze_local_file(fpath, ftype)
-            verdict = res['verdict']
-            score = res['score']
-            
-            if is_positive(verdict):
-                results['TP'] += 1
-                details_log.append(f"[CORRECT FAKE] {os.path.basename(fpath)}: {verdict} (Score: {score})")
-            else:
-                results['FN'] += 1
-                details_log.append(f"[FALSE NEGATIVE] {os.path.basename(fpath)}: {verdict} (Score: {score})")
+    # The default thresholds must reproduce the recorded verdicts (same detector version)
+    _, verdicts = score_signals(*signals)
+    recorded = data['verdict'] >= 0
+    mismatches = int(np.count_nonzero(verdicts[recorded] != data['verdict'][recorded]))
 
-        except Exception as e:
-            print(f"Error processing {fpath}: {e}")
-            results['errors'] += 1
+    curve = []
+    for threshold in range(AI_GENERATED_BELOW, 101):
+        row = confusion(predicted(suspicious_below=threshold), actual)
+        row['suspicious_below'] = threshold
+        curve.append(row)
+    # ROC from (0, 0) to (1, 1) through every threshold; trapezoidal area
+    points = sorted({(0.0, 0.0), (1.0, 1.0)} | {(row['fpr'], row['recall']) for row in curve})
+    auc = sum((x1 - x0) * (y0 + y1) / 2 for (x0, y0), (x1, y1) in zip(points, points[1:]))
 
-    # Calculate Metrics
-    total = results['TP'] + results['TN'] + results['FP'] + results['FN']
-    accuracy = (results['TP'] + results['TN']) / total if total > 0 else 0
-    precision = results['TP'] / (results['TP'] + results['FP']) if (results['TP'] + results['FP']) > 0 else 0
-    recall = results['TP'] / (results['TP'] + results['FN']) if (results['TP'] + results['FN']) > 0 else 0
-
-    # Generate HTML Report
-    report_path = os.path.join(dataset_dir, 'evaluation_report.html')
-    
-    html_content = f"""
+    grid = []
+    for smooth_below in range(60, 111, 5):
+        for grain_above in range(130, 201, 10):
+            row = confusion(predicted(smooth_below=smooth_below, grain_above=grain_above), actual)
+            row.update({'fft_smooth_below': smooth_below, 'fft_grain_above': grain_above})
+            grid.append(row)
+
+    return {
+        'images': int(len(actual)),
+        'fake': int(np.count_nonzero(actual)),
+        'replay_mismatches': mismatches,
+        'defaults': {'suspicious_below': SUSPICIOUS_BELOW, 'fft_smooth_below': FFT_SMOOTH_BELOW, 'fft_grain_above': FFT_GRAIN_ABOVE},
+        'roc_auc': auc,
+        'curve': curve,
+        'best_threshold': max(curve, key=lambda row: row['accuracy']),
+        'fft_grid': grid,
+        'best_fft': max(grid, key=lambda row: row['accuracy']),
+        'load_s': load_s,
+        'elapsed_s': time.perf_counter() - started,
+    }
+
+def print_sweep(result):
+    defaults = result['defaults']
+    print(f"Sweep over {result['images']} stored images ({result['fake']} fake) in {result['elapsed_s']:.2f}s "
+          f"(load {result['load_s']:.2f}s); default thresholds reproduce the recorded verdicts "
+          f"except {result['replay_mismatches']}")
+    print(f"ROC AUC (suspicious threshold): {result['roc_auc']:.4f}")
+    print(f"{'suspicious_below':>16} {'accuracy':>9} {'precision':>10} {'recall':>8} {'FPR':>8}")
+    for row in result['curve']:
+        if row['suspicious_below'] % 5 == 0:
+            mark = "  <- current" if row['suspicious_below'] == defaults['suspicious_below'] else ""
+            print(f"{row['suspicious_below']:>16} {row['accuracy']:>9.2%} {row['precision']:>10.2%} "
+                  f"{row['recall']:>8.2%} {row['fpr']:>8.2%}{mark}")
+    best = result['best_threshold']
+    print(f"Best accuracy: suspicious_below={best['suspicious_below']} ({best['accuracy']:.2%})")
+    best = result['best_fft']
+    print(f"Best FFT thresholds: smooth_below={best['fft_smooth_below']} grain_above={best['fft_grain_above']} "
+          f"({best['accuracy']:.2%}; current {defaults['fft_smooth_below']}/{defaults['fft_grain_above']})")
+
+# --- HTML REPORT (streamed row by row from the checkpoint) ---
+
+def write_report(report_path, checkpoint_path, summary, images_per_sec, cascade=None):
+    with open(report_path, 'w') as f:
+        f.write(f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -139,52 +379,118 @@ def evaluate():
     <body>
         <div class="container">
             <h1>Veritas AI Evaluation Report</h1>
-            <p>Generated on: {os.popen('date').read().strip()}</p>
+            <p>Generated on: {time.strftime('%a %b %d %H:%M:%S %Z %Y')}</p>
 
             <h2>Summary Metrics</h2>
             <div class="metrics-grid">
                 <div class="metric-card">
-                    <div class="metric-value">{accuracy:.1%}</div>
+                    <div class="metric-value">{summary['accuracy']:.1%}</div>
                     <div class="metric-label">Accuracy</div>
                 </div>
                 <div class="metric-card">
-                    <div class="metric-value">{precision:.1%}</div>
+                    <div class="metric-value">{summary['precision']:.1%}</div>
                     <div class="metric-label">Precision</div>
                 </div>
                 <div class="metric-card">
-                    <div class="metric-value">{recall:.1%}</div>
+                    <div class="metric-value">{summary['recall']:.1%}</div>
                     <div class="metric-label">Recall</div>
                 </div>
                 <div class="metric-card">
-                    <div class="metric-value">{total}</div>
+                    <div class="metric-value">{summary['total']}</div>
                     <div class="metric-label">Total Files</div>
                 </div>
+                <div class="metric-card">
+                    <div class="metric-value">{images_per_sec:.2f}</div>
+                    <div class="metric-label">Images / sec</div>
+                </div>
             </div>
 
             <h2>Confusion Matrix</h2>
             <div class="metrics-grid">
                 <div class="metric-card" style="background: #e8f5e9;">
-                    <div class="metric-value" style="color: #2e7d32;">{results['TP']}</div>
+                    <div class="metric-value" style="color: #2e7d32;">{summary['TP']}</div>
                     <div class="metric-label">True Positives</div>
                     <small>Fake detected as Fake</small>
                 </div>
                 <div class="metric-card" style="background: #e8f5e9;">
-                    <div class="metric-value" style="color: #2e7d32;">{results['TN']}</div>
+                    <div class="metric-value" style="color: #2e7d32;">{summary['TN']}</div>
                     <div class="metric-label">True Negatives</div>
                     <small>Real detected as Real</small>
                 </div>
                 <div class="metric-card" style="background: #ffebee;">
-                    <div class="metric-value" style="color: #c62828;">{results['FP']}</div>
+                    <div class="metric-value" style="color: #c62828;">{summary['FP']}</div>
                     <div class="metric-label">False Positives</div>
                     <small>Real detected as Fake</small>
                 </div>
                 <div class="metric-card" style="background: #ffebee;">
-                    <div class="metric-value" style="color: #c62828;">{results['FN']}</div>
+                    <div class="metric-value" style="color: #c62828;">{summary['FN']}</div>
                     <div class="metric-label">False Negatives</div>
                     <small>Fake detected as Real</small>
                 </div>
             </div>
 
+            <h2>Stage Latency (ms)</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Stage</th>
+                        <th>p50</th>
+                        <th>p90</th>
+                        <th>p99</th>
+                    </tr>
+                </thead>
+                <tbody>
+    """)
+        for stage, pcts in summary['latency'].items():
+            f.write(f"""
+                    <tr>
+                        <td>{stage[:-3]}</td>
+                        <td>{pcts[50]:.1f}</td>
+                        <td>{pcts[90]:.1f}</td>
+                        <td>{pcts[99]:.1f}</td>
+                    </tr>
+            """)
+
+        f.write("""
+                </tbody>
+            </table>
+    """)
+
+        if cascade:
+            policy = cascade['policy']
+            f.write(f"""
+            <h2>Cascade Trade-off</h2>
+            <p>Policy: {policy['first'].replace('_', ' ')} first, skip the other model when the fake probability
+            is surely above {policy['fake_above']} or the camera-verified first score is at most {policy['real_below']}.
+            Second model skipped on {cascade['skip_rate']:.1%} of {cascade['files']} files;
+            {cascade['verdicts_changed']} verdict(s) changed.</p>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Mode</th>
+                        <th>Accuracy</th>
+                        <th>Model passes / file</th>
+                        <th>Model time / file (ms)</th>
+                    </tr>
+                </thead>
+                <tbody>
+            """)
+            for mode, label in (('full', 'Full ensemble'), ('cascade', 'Cascade')):
+                row = cascade[mode]
+                f.write(f"""
+                    <tr>
+                        <td>{label}</td>
+                        <td>{row['accuracy']:.1%}</td>
+                        <td>{row['model_passes']:.2f}</td>
+                        <td>{row['model_ms']:.1f}</td>
+                    </tr>
+            """)
+            f.write("""
+                </tbody>
+            </table>
+    """)
+
+        f.write("""
             <h2>Detailed Results</h2>
             <table>
                 <thead>
@@ -197,59 +503,136 @@ def evaluate():
                     </tr>
                 </thead>
                 <tbody>
-    """
+    """)
 
-    import re
-    for log in details_log:
-        # Parse log string: "[STATUS] filename: Verdict (Score: X)"
-        # Example: [FALSE POSITIVE] solid_real.jpg: AI Generated (Score: 10)
-        match = re.match(r"\[(.*?)\] (.*?): (.*?) \(Score: (.*?)\)", log)
-        
-        if match:
-            status_tag = match.group(1)
-            filename = match.group(2)
-            verdict = match.group(3)
-            score_str = match.group(4)
-            
-            try:
-                score = float(score_str)
-            except ValueError:
-                score = 0.0
-            
-            actual_type = "Fake" if "FAKE" in status_tag or "FN" in status_tag or "CORRECT FAKE" in status_tag else "Real"
-            if "CORRECT" in status_tag:
-                row_class = "status-pass"
-                result_text = "PASS"
+        for record in iter_checkpoint(checkpoint_path):
+            actual_type = "Fake" if record['label'] == 'fake' else "Real"
+            if record['status'] != 'success':
+                verdict, score_cell = escape(str(record.get('message'))), "-"
+                row_class, result_text = "status-fail", "ERROR"
             else:
-                row_class = "status-fail"
-                result_text = "FAIL"
+                verdict, score_cell = escape(record['verdict']), f"{float(record['score']):.1f}%"
+                correct = is_positive(record['verdict']) == (record['label'] == 'fake')
+                row_class, result_text = ("status-pass", "PASS") if correct else ("status-fail", "FAIL")
 
-            html_content += f"""
+            f.write(f"""
                     <tr>
-                        <td>{filename}</td>
+                        <td>{escape(os.path.basename(record['file']))}</td>
                         <td><span class="badge {'badge-fake' if actual_type == 'Fake' else 'badge-real'}">{actual_type}</span></td>
                         <td>{verdict}</td>
-                        <td>{score:.1f}%</td>
+                        <td>{score_cell}</td>
                         <td class="{row_class}">{result_text}</td>
                     </tr>
-            """
-        else:
-            html_content += f"<tr><td colspan='5'>{log}</td></tr>"
+            """)
 
-    html_content += """
+        f.write("""
                 </tbody>
             </table>
         </div>
     </body>
     </html>
-    """
+    """)
 
-    with open(report_path, 'w') as f:
-        f.write(html_content)
+def evaluate(workers=1, batch_size=BATCH_SIZE, resume=False, checkpoint_path=None, report_path=None, backend="torch",
+             cascade_policy=None, signals_path=None, reset_signals=False):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    dataset_dir = os.path.join(base_dir, 'dataset')
+    real_dir = os.path.join(dataset_dir, 'real')
+    fake_dir = os.path.join(dataset_dir, 'fake')
+    checkpoint_path = checkpoint_path or os.path.join(dataset_dir, 'evaluation_results.jsonl')
+    report_path = report_path or os.path.join(dataset_dir, 'evaluation_report.html')
+    signals_path = signals_path or os.path.join(dataset_dir, 'signals')
+
+    if not os.path.exists(real_dir) or not os.path.exists(fake_dir):
+        print(f"Dataset directories not found. Please create {real_dir} and {fake_dir}")
+        return
+
+    files = collect_files(dataset_dir)
+    if not files:
+        print("No files found in dataset directories. Please add images/videos to backend/dataset/real and backend/dataset/fake.")
+        return
+
+    if resume:
+        done = load_checkpoint(checkpoint_path)
+        files = [entry for entry in files if entry[0] not in done]
+        print(f"Resuming: {len(done)} files already scored, {len(files)} remaining.")
+    else:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    # Stored signals outlive a fresh run (load() keeps each file's latest row); wiping them is opt-in
+    if reset_signals:
+        SignalStore.clear(signals_path)
+
+    print(f"\n--- Starting Evaluation ({len(files)} files, {workers} worker(s), batch size {batch_size}, {backend} backend) ---\n")
+    started = time.perf_counter()
+    store = SignalStore(signals_path, version=detector_version())
+    processed = run_pool(files, workers, batch_size, checkpoint_path, backend, store) if files else 0
+    elapsed = time.perf_counter() - started
+    images_per_sec = processed / elapsed if processed and elapsed > 0 else 0.0
+
+    if not os.path.exists(checkpoint_path):
+        print("Nothing was scored.")
+        return
+
+    summary = summarize(checkpoint_path)
+    cascade = simulate_cascade(checkpoint_path, **(cascade_policy or {}))
+    write_report(report_path, checkpoint_path, summary, images_per_sec, cascade)
 
     print(f"\n--- Report Generated ---")
     print(f"HTML Report saved to: {report_path}")
-    print(f"Accuracy: {accuracy:.2%}")
+    print(f"Per-file results: {checkpoint_path}")
+    print(f"Raw signals (for --sweep): {signals_path}")
+    print(f"Accuracy: {summary['accuracy']:.2%}  Precision: {summary['precision']:.2%}  Recall: {summary['recall']:.2%}  Errors: {summary['errors']}")
+    print(f"Throughput: {images_per_sec:.2f} images/sec ({processed} files in {elapsed:.1f}s)")
+    if summary['peak_rss_mb'] is not None:
+        print(f"Peak RSS per worker: {summary['peak_rss_mb']:.1f} MB")
+    for stage, pcts in summary['latency'].items():
+        print(f"  {stage[:-3]:<10} p50 {pcts[50]:8.1f} ms   p90 {pcts[90]:8.1f} ms   p99 {pcts[99]:8.1f} ms")
+    if cascade:
+        print(f"Cascade ({cascade['policy']}): second model skipped on {cascade['skip_rate']:.1%} of files, "
+              f"{cascade['verdicts_changed']} verdict(s) changed")
+        for mode in ('full', 'cascade'):
+            row = cascade[mode]
+            print(f"  {mode:<8} accuracy {row['accuracy']:.2%}   {row['model_passes']:.2f} model passes/file   {row['model_ms']:.1f} ms model time/file")
 
 if __name__ == "__main__":
-    evaluate()
+    parser = argparse.ArgumentParser(description="Evaluate the detector on backend/dataset/{real,fake}")
+    parser.add_argument("--workers", type=int, default=1, help="detector processes (each loads the models once)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="files per analyze_batch() call")
+    parser.add_argument("--resume", action="store_true", help="skip files already in the checkpoint")
+    parser.add_argument("--checkpoint", help="per-file JSONL results (default: dataset/evaluation_results.jsonl)")
+    parser.add_argument("--report", help="HTML report path (default: dataset/evaluation_report.html)")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx", "onnx-int8"],
+                        help="model runtime (onnx / onnx-int8 run on CPU via ONNX Runtime, see onnx_backend.py)")
+    parser.add_argument("--signals", help="raw-signal store directory (default: dataset/signals)")
+    parser.add_argument("--reset-signals", action="store_true",
+                        help="delete the stored signals before scoring (by default new rows supersede old ones per file)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="re-score the stored signals under other thresholds (ROC / PR, FFT grid); loads no model")
+    parser.add_argument("--sweep-output", help="with --sweep: write the full curves as JSON")
+    parser.add_argument("--cascade-first", default=DeepfakeDetectorLogic.cascade_first, choices=["model_a", "model_b"],
+                        help="cascade policy to report: model that runs first")
+    parser.add_argument("--cascade-fake-above", type=float, default=DeepfakeDetectorLogic.cascade_fake_above,
+                        help="cascade policy to report: skip when the fake probability is surely above this")
+    parser.add_argument("--cascade-real-below", type=float, default=DeepfakeDetectorLogic.cascade_real_below,
+                        help="cascade policy to report: skip when camera EXIF is verified and the first score is at most this")
+    args = parser.parse_args()
+
+    if args.sweep:
+        signals_path = args.signals or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset', 'signals')
+        # Every stored version: the signals outlive edits to the scoring constants (replay_mismatches shows the drift)
+        result = sweep(signals_path)
+        if result is None:
+            print(f"No stored signals in {signals_path}: run the evaluation first.")
+            sys.exit(1)
+        print_sweep(result)
+        if args.sweep_output:
+            with open(args.sweep_output, 'w') as f:
+                json.dump(result, f, indent=2)
+        sys.exit(0)
+
+    evaluate(workers=args.workers, batch_size=args.batch_size, resume=args.resume,
+             checkpoint_path=args.checkpoint, report_path=args.report, backend=args.backend,
+             cascade_policy={"first": args.cascade_first, "fake_above": args.cascade_fake_above,
+                             "real_below": args.cascade_real_below},
+             signals_path=args.signals, reset_signals=args.reset_signals)
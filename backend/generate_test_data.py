@@ -2,6 +2,59 @@ import os
 import numpy as np
 from PIL import Image
 
+# Camera-style EXIF tags (the ones analyze_metadata looks for)
+CAMERA_EXIF = {
+    0x010F: "Apple",                # Make
+    0x0110: "iPhone 13 Pro",        # Model
+    0x8827: 80,                     # ISOSpeedRatings
+    0x9003: "2024:05:01 12:00:00",  # DateTimeOriginal
+}
+
+def synth_image(width, height, seed=0):
+    """
+    Photo-like test content: smooth gradients + texture + sensor-style noise,
+    so the decode/FFT cost resembles a real photo rather than a flat colour.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 128 + 60 * np.sin(x / (width / 7.0)) * np.cos(y / (height / 5.0))
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    for c in range(3):
+        channel = base + 20 * np.sin((x + 40 * c) / 13.0) + rng.normal(0, 6, (height, width)).astype(np.float32)
+        img[..., c] = np.clip(channel, 0, 255).astype(np.uint8)
+    return Image.fromarray(img)
+
+def save_image(img, path, fmt="JPEG", with_exif=False):
+    exif = Image.Exif()
+    if with_exif:
+        # Make/Model live in IFD0; ISO and DateTimeOriginal belong to the Exif sub-IFD
+        exif[0x010F] = CAMERA_EXIF[0x010F]
+        exif[0x0110] = CAMERA_EXIF[0x0110]
+        exif_ifd = exif.get_ifd(0x8769)
+        exif_ifd[0x8827] = CAMERA_EXIF[0x8827]
+        exif_ifd[0x9003] = CAMERA_EXIF[0x9003]
+    kwargs = {"exif": exif.tobytes()} if with_exif else {}
+    if fmt == "JPEG":
+        kwargs["quality"] = 90
+    img.save(path, format=fmt, **kwargs)
+    return path
+
+def write_video(path, seconds=3, fps=24, size=(640, 360), seed=0):
+    """Short synthetic clip (moving texture with one scene cut halfway through)."""
+    import cv2
+    width, height = size
+    frame0 = np.asarray(synth_image(width * 2, height, seed))[..., ::-1]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    total = int(seconds * fps)
+    for i in range(total):
+        offset = (i * 4) % width
+        frame = np.ascontiguousarray(frame0[:, offset:offset + width])
+        if i >= total // 2:
+            frame = 255 - frame
+        writer.write(frame)
+    writer.release()
+    return path
+
 def generate_data():
     base_dir = os.path.dirname(os.path.abspath(__file__))
     dataset_dir = os.path.join(base_dir, 'dataset')
@@ -0,0 +1,123 @@
+import abc
+import asyncio
+import collections
+import time
+import uuid
+
+# Job lifecycle: queued -> running -> done | error
+# Stage progression reported while running (see DetectorWorker.analyze_url_events)
+STAGES = ["queued", "downloaded", "model_a", "model_b", "forensics", "verdict"]
+
+
+class JobStore(abc.ABC):
+    """
+    Storage interface for analysis jobs.
+
+    A job is a plain dict (job_id, status, stage, file_key, file_type, created,
+    updated, result) plus an append-only list of events, each
+    {"id": n, "event": "stage" | "result", "data": {...}} with n counting up from 0.
+    The "result" event is always the last one. A shared backend (Redis, a
+    database) can replace InMemoryJobStore once the API runs on several replicas.
+    """
+
+    @abc.abstractmethod
+    def create(self, file_key, file_type):
+        ...
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        ...
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        ...
+
+    @abc.abstractmethod
+    def add_event(self, job_id, event, data):
+        ...
+
+    @abc.abstractmethod
+    async def wait_events(self, job_id, after=-1, timeout=None):
+        """Events with id > after; waits up to `timeout` seconds if there are none yet."""
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local job store (the default, and what local development uses).
+    Finished jobs are kept for `ttl_seconds`; beyond `max_jobs` the oldest
+    finished jobs are dropped first.
+    """
+
+    def __init__(self, max_jobs=10_000, ttl_seconds=3600):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs = collections.OrderedDict()
+        self._events = {}
+        self._changed = {}
+
+    def create(self, file_key, file_type):
+        self._evict()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": "queued",
+            "file_key": file_key,
+            "file_type": file_type,
+            "created": now,
+            "updated": now,
+            "result": None,
+        }
+        self._events[job_id] = []
+        self.add_event(job_id, "stage", {"stage": "queued"})
+        return dict(self._jobs[job_id])
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job["updated"] = time.time()
+
+    def add_event(self, job_id, event, data):
+        events = self._events.get(job_id)
+        if events is None:
+            return
+        events.append({"id": len(events), "event": event, "data": data})
+        # Wake every waiting stream, then arm a fresh event for the next change
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    async def wait_events(self, job_id, after=-1, timeout=None):
+        events = self._events.get(job_id)
+        if events is None:
+            return []
+        # Nothing new can follow the "result" event, so there is nothing to wait for
+        if len(events) - 1 <= after and not (events and events[-1]["event"] == "result"):
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            events = self._events.get(job_id, [])
+        return events[after + 1:]
+
+    def _evict(self):
+        now = time.time()
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("done", "error")]
+        for job_id in finished:
+            if now - self._jobs[job_id]["updated"] > self.ttl_seconds or len(self._jobs) >= self.max_jobs:
+                self._drop(job_id)
+
+    def _drop(self, job_id):
+        self._jobs.pop(job_id, None)
+        self._events.pop(job_id, None)
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
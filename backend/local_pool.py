@@ -0,0 +1,588 @@
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+try:
+    from worker import DetectorWorker, BATCH_MAX_SIZE, WARMUP
+except ImportError:
+    from backend.worker import DetectorWorker, BATCH_MAX_SIZE, WARMUP
+
+# Pool size: worker processes, and torch intra-op threads in each (0 = derive from the visible cores)
+POOL_WORKERS = int(os.getenv("POOL_WORKERS", "0"))
+POOL_THREADS_PER_WORKER = int(os.getenv("POOL_THREADS_PER_WORKER", "0"))
+# Crash-loop guard: a worker that exits within POOL_MIN_UPTIME_S counts as a quick exit. Each
+# consecutive quick exit doubles the delay before its replacement (up to POOL_MAX_BACKOFF_S),
+# and after POOL_MAX_RESTARTS of them in a row dead workers are no longer replaced.
+POOL_MIN_UPTIME_S = 30
+POOL_MAX_BACKOFF_S = 60
+POOL_MAX_RESTARTS = int(os.getenv("POOL_MAX_RESTARTS", "5"))
+
+# The zygote's loaded worker; children forked from the zygote inherit it (and its model weights) from this global
+_inherited = None
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _set_torch_threads(threads):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def process_memory(pid):
+    """RSS, PSS and private (USS) memory of a process in MB, from /proc/<pid>/smaps_rollup (Linux)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "private_mb": round(private / 1024, 1),
+    }
+
+
+def load_worker():
+    """The pool's default worker: both pipelines on CPU with torch."""
+    worker = DetectorWorker()
+    worker.load_models(device=-1, batch_size=BATCH_MAX_SIZE, backend="torch")
+    return worker
+
+
+def stub_worker():
+    """A worker with tiny stand-in pipelines (no weights download), for measure() and tests."""
+    try:
+        from benchmark import StubPipeline
+    except ImportError:
+        from backend.benchmark import StubPipeline
+    worker = DetectorWorker()
+    worker.pipe1 = StubPipeline(["FAKE", "REAL"])
+    worker.pipe2 = StubPipeline(["Fake", "Real"])
+    worker.parallel_models = False
+    return worker
+
+
+def _zygote_main(control, threads, factory):
+    """
+    The process every pool worker is forked from. Started with "spawn" (a fresh interpreter,
+    so it inherits none of the API's threads or locks), it loads the models, runs the
+    warm-up once for every child, freezes the GC and then only ever forks: it stays single-threaded, so a fork never copies a lock that
+    some other thread held. The API sends ("spawn", child_id) followed by the child's two
+    pipe ends as file descriptors; the zygote answers ("spawned", child_id, pid) and, once
+    the child has been reaped, ("exit", child_id, exit_code). None (or EOF) shuts it down.
+    """
+    from multiprocessing.connection import Connection
+    from multiprocessing.reduction import recv_handle
+
+    global _inherited
+    # No OpenMP thread team before the forks: libgomp's is not usable in a forked child
+    _set_torch_threads(1)
+    try:
+        _inherited = factory()
+        if WARMUP:
+            # Lazy imports and allocator growth happen here, before the fork, so children share
+            # them copy-on-write; its forensic / model-B threads are joined again before any fork
+            _inherited.warmup()
+            _inherited.close_executors()
+    except BaseException as e:
+        control.send(("failed", repr(e)))
+        raise
+    gc.collect()
+    gc.freeze()
+    control.send(("ready",))
+
+    children = {}  # pid -> child id
+    running = True
+    while running:
+        if control.poll(0.5):
+            try:
+                message = control.recv()
+            except EOFError:
+                message = None  # the API process is gone
+            if message is None:
+                running = False
+            else:
+                child_id = message[1]
+                tasks = Connection(recv_handle(control), writable=False)
+                results = Connection(recv_handle(control), readable=False)
+                try:
+                    pid = os.fork()
+                except OSError as e:
+                    print(f"Pool zygote could not fork: {e}")
+                    tasks.close()
+                    results.close()
+                    control.send(("exit", child_id, None))
+                    continue
+                if pid == 0:
+                    # Only its own pipe ends stay open in the child: the API sees its death as EOF
+                    control.close()
+                    code = 0
+                    try:
+                        _child_main(tasks, results, threads)
+                    except BaseException:
+                        import traceback
+                        traceback.print_exc()
+                        code = 1
+                    finally:
+                        os._exit(code)
+                tasks.close()
+                results.close()
+                children[pid] = child_id
+                control.send(("spawned", child_id, pid))
+        _reap(children, control, block=False)
+
+    # Shutting down: the API has asked every child to stop; give them time, then kill the rest
+    deadline = time.monotonic() + 10
+    while children and time.monotonic() < deadline:
+        _reap(children, control, block=False)
+        time.sleep(0.1)
+    for pid in children:
+        try:
+            os.kill(pid, 9)
+        except OSError:
+            pass
+    _reap(children, control, block=True)
+
+
+def _reap(children, control, block):
+    while children:
+        try:
+            pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        child_id = children.pop(pid, None)
+        if child_id is not None:
+            try:
+                control.send(("exit", child_id, os.waitstatus_to_exitcode(status)))
+            except OSError:
+                pass
+
+
+def _child_main(tasks, results, threads):
+    """
+    Worker process loop: takes up to BATCH_MAX_SIZE queued analyses at a time and
+    runs them as one DetectorWorker.analyze_urls batch on the inherited models.
+    tasks / results: this child's own pipe ends (never shared with a sibling).
+    """
+    _set_torch_threads(threads)
+    worker = _inherited
+    # Per-process state only (verdict cache connection, HTTP session, pHash index): the models are
+    # already there, warmed up in the zygote
+    worker.start_worker(warmup=False)
+
+    # Keep reading the pipe while a batch runs, so the parent's sends never block on a full pipe
+    inbox = queue.Queue()
+
+    def receive():
+        while True:
+            try:
+                task = tasks.recv()
+            except EOFError:
+                task = None
+            inbox.put(task)
+            if task is None:
+                return
+
+    threading.Thread(target=receive, daemon=True).start()
+    send_lock = threading.Lock()
+
+    def send(message):
+        # Progress callbacks arrive from the batch's download / forensics threads
+        with send_lock:
+            results.send(message)
+
+    stopping = False
+    while not stopping:
+        task = inbox.get()
+        if task is None:
+            break
+        batch = [task]
+        while len(batch) < BATCH_MAX_SIZE:
+            try:
+                task = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                stopping = True
+                break
+            batch.append(task)
+
+        requests = []
+        for task_id, file_url, file_type, events in batch:
+            progress = (lambda stage, task_id=task_id: send(("stage", task_id, stage))) if events else None
+            requests.append((file_url, file_type, progress))
+        try:
+            batch_results = worker.analyze_urls(requests)
+        except Exception as e:
+            batch_results = [{"status": "error", "message": f"Batch failed: {str(e)}"} for _ in batch]
+        for (task_id, _, _, _), result in zip(batch, batch_results):
+            send(("result", task_id, result))
+
+
+class _Child:
+    def __init__(self, child_id, tasks, results):
+        self.child_id = child_id
+        self.pid = None           # reported by the zygote once forked
+        self.tasks = tasks        # parent's sending end
+        self.results = results    # parent's receiving end
+        self.inflight = set()     # task ids sent and not answered yet
+        self.eof = False          # its result pipe closed (the exit report follows from the zygote)
+        self.started = time.monotonic()
+
+
+class LocalWorkerPool:
+    """
+    Multi-process CPU serving without Modal, with one copy of the model weights.
+
+    The API process never forks: it is multithreaded (uvicorn, to_thread, this pool's
+    reader), and a fork copies whatever locks other threads hold at that moment. Instead
+    start() spawns a fresh single-threaded zygote process that loads both pipelines once,
+    freezes the GC and forks `workers` children on request, including replacements later
+    on. The tensors live in memory the children inherit copy-on-write and only ever read,
+    so they stay shared. gc.freeze() keeps the children's collector from writing to the
+    inherited objects. Each child therefore adds its own activations and buffers, not
+    another model load.
+
+    Each child pins its torch intra-op threads (cores // workers by default) and
+    has its own task / result pipes; an analysis goes to the child with the
+    fewest in flight, which micro-batches whatever has queued up. A child that
+    dies (OOM kill, segfault) fails only its own in-flight analyses and is
+    replaced, with backoff if it keeps dying young (see POOL_MAX_RESTARTS). The async
+    methods mirror modal_app.DeepfakeDetector (analyze_media, analyze_media_events,
+    analyze_media_batch), so dispatch.PoolDispatcher can stand in for Modal.
+
+    factory: picklable callable building the DetectorWorker inside the zygote (default load_worker).
+    CPU + torch only: CUDA contexts and ONNX Runtime thread pools do not survive a fork.
+    """
+
+    def __init__(self, workers=None, threads_per_worker=None, factory=None):
+        cores = _cores()
+        self.workers = workers or POOL_WORKERS or max(1, cores // 4)
+        self.threads_per_worker = threads_per_worker or POOL_THREADS_PER_WORKER or max(1, cores // self.workers)
+        self.factory = factory or load_worker
+        self.started = False
+
+        self._ids = itertools.count()
+        self._child_ids = itertools.count()
+        self._pending = {}   # task id -> (loop, future, on_stage)
+        self._children = {}  # child id -> _Child
+        self._lock = threading.Lock()
+        self._control_lock = threading.Lock()
+        self._closing = False
+        self._zygote_alive = False
+        self._quick_exits = 0
+
+    def start(self):
+        """Starts the zygote, waits for its model load and forks the workers (blocking: run it off the event loop)."""
+        context = multiprocessing.get_context("spawn")
+        # Duplex, so a socket pair: it can carry the children's pipe ends as file descriptors
+        self._control, zygote_end = context.Pipe()
+        self._zygote = context.Process(target=_zygote_main, args=(zygote_end, self.threads_per_worker, self.factory),
+                                       name="pool-zygote", daemon=True)
+        self._zygote.start()
+        zygote_end.close()
+        try:
+            status = self._control.recv()
+        except EOFError:
+            status = ("failed", f"exit code {self._zygote.join() or self._zygote.exitcode}")
+        if status[0] != "ready":
+            raise RuntimeError(f"Pool zygote failed to load the models: {status[1]}")
+        self._zygote_alive = True
+
+        for _ in range(self.workers):
+            self._spawn()
+        self._reader = threading.Thread(target=self._read_results, name="pool-results", daemon=True)
+        self._reader.start()
+        self.started = True
+        print(f"Local pool: {self.workers} workers x {self.threads_per_worker} threads")
+
+    def close(self):
+        self._closing = True
+        with self._lock:
+            children = list(self._children.values())
+        for child in children:
+            try:
+                child.tasks.send(None)
+            except OSError:
+                pass
+        # The zygote waits for its children to finish, then exits
+        try:
+            with self._control_lock:
+                self._control.send(None)
+        except OSError:
+            pass
+        self._zygote.join(timeout=15)
+        if self._zygote.is_alive():
+            self._zygote.terminate()
+        self._reader.join(timeout=5)
+
+    # --- Modal-compatible surface ---
+
+    async def analyze_media(self, file_url, file_type):
+        started = time.perf_counter()
+        result = await self._submit(file_url, file_type)
+        if "timings" in result:
+            result["timings"]["worker_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    async def analyze_media_events(self, file_url, file_type):
+        """{"event": "stage", "stage": ...} as the file progresses, then {"event": "result", "result": ...}."""
+        stages = asyncio.Queue()
+        task = asyncio.ensure_future(self._submit(file_url, file_type, on_stage=stages.put_nowait))
+        while not task.done() or not stages.empty():
+            getter = asyncio.ensure_future(stages.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield {"event": "stage", "stage": getter.result()}
+            else:
+                getter.cancel()
+        yield {"event": "result", "result": task.result()}
+
+    async def analyze_media_batch(self, file_urls, file_types):
+        return list(await asyncio.gather(*[self.analyze_media(url, file_type) for url, file_type in zip(file_urls, file_types)]))
+
+    def stats(self):
+        with self._lock:
+            children = {child.pid: len(child.inflight) for child in self._children.values() if child.pid}
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "pending": len(self._pending),
+            "parent": process_memory(os.getpid()),
+            "zygote": process_memory(self._zygote.pid) if self._zygote_alive else None,
+            "children": {pid: dict(process_memory(pid) or {}, inflight=inflight) for pid, inflight in children.items()},
+        }
+
+    # --- internals ---
+
+    def _submit(self, file_url, file_type, on_stage=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        task_id = next(self._ids)
+        with self._lock:
+            live = [child for child in self._children.values() if not child.eof]
+            if not live:
+                # Between a crash and its (possibly delayed) replacement, or after the restart cap
+                future.set_result({"status": "error", "message": "No pool worker available"})
+                return future
+            self._pending[task_id] = (loop, future, on_stage)
+            child = min(live, key=lambda c: len(c.inflight))
+            child.inflight.add(task_id)
+            try:
+                child.tasks.send((task_id, file_url, file_type, on_stage is not None))
+            except OSError:
+                pass  # the child just died: its exit report fails this task with the rest of its batch
+        return future
+
+    def _spawn(self):
+        from multiprocessing.reduction import send_handle
+
+        if self._closing or not self._zygote_alive:
+            return
+        task_recv, task_send = multiprocessing.Pipe(duplex=False)
+        result_recv, result_send = multiprocessing.Pipe(duplex=False)
+        child = _Child(next(self._child_ids), task_send, result_recv)
+        with self._lock:
+            self._children[child.child_id] = child
+        try:
+            with self._control_lock:
+                self._control.send(("spawn", child.child_id))
+                send_handle(self._control, task_recv.fileno(), self._zygote.pid)
+                send_handle(self._control, result_send.fileno(), self._zygote.pid)
+        except OSError as e:
+            print(f"Pool zygote unreachable ({e}); worker not started")
+            with self._lock:
+                self._children.pop(child.child_id, None)
+            task_send.close()
+            result_recv.close()
+        finally:
+            # Only the child keeps these ends, so its death shows up as EOF here
+            task_recv.close()
+            result_send.close()
+
+    def _read_results(self):
+        from multiprocessing.connection import wait
+
+        while self._zygote_alive or not self._closing:
+            with self._lock:
+                children = [child for child in self._children.values() if not child.eof]
+            by_handle = {child.results: child for child in children}
+            handles = list(by_handle) + ([self._control] if self._zygote_alive else [])
+            if not handles:
+                time.sleep(0.1)
+                continue
+            for ready in wait(handles, timeout=1.0):
+                if ready is self._control:
+                    self._zygote_message()
+                else:
+                    self._drain(by_handle[ready])
+
+    def _zygote_message(self):
+        try:
+            kind, child_id, value = self._control.recv()
+        except (EOFError, OSError):
+            self._zygote_alive = False
+            if not self._closing:
+                print("Pool zygote exited: crashed workers can no longer be replaced")
+            return
+        with self._lock:
+            child = self._children.get(child_id)
+        if child is None:
+            return
+        if kind == "spawned":
+            child.pid = value
+        elif kind == "exit":
+            self._drain(child)
+            self._replace(child, value)
+
+    def _drain(self, child):
+        while True:
+            try:
+                if not child.results.poll():
+                    return
+                kind, task_id, value = child.results.recv()
+            except (EOFError, OSError):
+                child.eof = True
+                return
+            with self._lock:
+                if kind == "result":
+                    child.inflight.discard(task_id)
+                    entry = self._pending.pop(task_id, None)
+                else:
+                    entry = self._pending.get(task_id)
+            if entry is None:
+                continue
+            loop, future, on_stage = entry
+            if kind == "stage":
+                if on_stage is not None:
+                    loop.call_soon_threadsafe(on_stage, value)
+            else:
+                loop.call_soon_threadsafe(_resolve, future, value)
+
+    def _replace(self, child, exitcode):
+        # A child that exited fails what it still had in flight and, unless we are shutting down, is replaced
+        with self._lock:
+            if self._children.pop(child.child_id, None) is None:
+                return
+            lost = [self._pending.pop(task_id, None) for task_id in child.inflight]
+        child.tasks.close()
+        child.results.close()
+        error = {"status": "error", "message": f"Pool worker exited (code {exitcode})"}
+        for entry in lost:
+            if entry is not None:
+                entry[0].call_soon_threadsafe(_resolve, entry[1], dict(error))
+        if self._closing:
+            return
+
+        if time.monotonic() - child.started < POOL_MIN_UPTIME_S:
+            self._quick_exits += 1
+        else:
+            self._quick_exits = 0
+        if self._quick_exits > POOL_MAX_RESTARTS:
+            print(f"Pool worker {child.pid} exited with code {exitcode}; {POOL_MAX_RESTARTS} quick exits in a row, not replacing it")
+            return
+        delay = min(POOL_MAX_BACKOFF_S, 2 ** (self._quick_exits - 1)) if self._quick_exits else 0
+        print(f"Pool worker {child.pid} exited with code {exitcode}; starting a replacement in {delay}s")
+        if delay:
+            timer = threading.Timer(delay, self._spawn)
+            timer.daemon = True
+            timer.start()
+        else:
+            self._spawn()
+
+
+def _resolve(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+# --- CLI: memory footprint of a running pool ---
+
+def measure(workers, threads, requests, stub_models=False):
+    """
+    Starts a pool, pushes `requests` synthetic images through it (served from a
+    local HTTP server) and reports per-process memory: the zygote's RSS is the
+    full model load, each child's private memory is what one extra worker costs.
+    """
+    import functools
+    import http.server
+    import tempfile
+    from PIL import Image
+
+    root = tempfile.mkdtemp(prefix="veritas_pool_")
+    Image.new("RGB", (1024, 768), (120, 90, 60)).save(os.path.join(root, "probe.png"))
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=root)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/probe.png"
+
+    pool = LocalWorkerPool(workers=workers, threads_per_worker=threads, factory=stub_worker if stub_models else None)
+    load_started = time.perf_counter()
+    pool.start()
+    load_s = time.perf_counter() - load_started
+
+    async def run():
+        started = time.perf_counter()
+        results = await pool.analyze_media_batch([url] * requests, ["image/png"] * requests)
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    stats = pool.stats()
+    pool.close()
+    server.shutdown()
+
+    children = [m for m in stats["children"].values() if m]
+    report = {
+        "workers": pool.workers,
+        "threads_per_worker": pool.threads_per_worker,
+        "startup_s": round(load_s, 2),
+        "requests": requests,
+        "errors": sum(r.get("status") != "success" for r in results),
+        "requests_per_sec": round(requests / elapsed, 2),
+        "zygote": stats["zygote"],
+        "children": children,
+    }
+    if children and stats["zygote"]:
+        private = sum(m["private_mb"] for m in children) / len(children)
+        report["child_private_mb_avg"] = round(private, 1)
+        report["child_private_vs_zygote_rss"] = round(private / stats["zygote"]["rss_mb"], 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fork-based worker pool: memory and throughput check")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--threads", type=int, help="torch threads per worker")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--stub-models", action="store_true", help="tiny stand-in pipelines (no weights download)")
+    args = parser.parse_args()
+    print(json.dumps(measure(args.workers, args.threads, args.requests, args.stub_models), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,37 @@
 import os
+import json
+import time
+import asyncio
 import boto3
 import uuid
+import re
+import ipaddress
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List
 from pydantic import BaseModel
-import modal
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+try:
+    from metrics import REGISTRY, METRICS_ENABLED
+    from dispatch import make_dispatcher
+    from jobs import InMemoryJobStore
+    from admission import LANES, AdmissionController, Rejected
+    from verdict_cache import VerdictCache
+    from detector_logic import cache_version
+    from worker import CASCADE, INFERENCE_BACKEND
+    from media_fetch import max_media_bytes
+except ImportError:
+    from backend.metrics import REGISTRY, METRICS_ENABLED
+    from backend.dispatch import make_dispatcher
+    from backend.jobs import InMemoryJobStore
+    from backend.admission import LANES, AdmissionController, Rejected
+    from backend.verdict_cache import VerdictCache
+    from backend.detector_logic import cache_version
+    from backend.worker import CASCADE, INFERENCE_BACKEND
+    from backend.media_fetch import max_media_bytes
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,12 +42,102 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+# S3-compatible endpoint instead of AWS (MinIO, or a moto server for local tests); unset: AWS
+AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL") or None
+# Multipart uploads: part size (S3 minimum 5 MB, except the last part) and S3's cap on parts
+MULTIPART_PART_SIZE = int(os.getenv("MULTIPART_PART_SIZE", str(16 * 1024 * 1024)))
+MULTIPART_MAX_PARTS = 10_000
 # App Name defined in modal_app.py
 MODAL_APP_NAME = "deepfake-detector-mvp"
 # Class Name defined in modal_app.py
 MODAL_CLASS_NAME = "DeepfakeDetector"
+# "modal" (GPU worker) or "local" (run DeepfakeDetectorLogic in this process, for dev / load tests)
+ANALYSIS_BACKEND = os.getenv("ANALYSIS_BACKEND", "modal")
+# Admission control (slots, queue bound, lane deadlines, per-client rates): see admission.py.
+# X-Api-Key values allowed to use the "moderation" lane (comma-separated), which also skips the rate limit
+MODERATION_API_KEYS = {key for key in os.getenv("MODERATION_API_KEYS", "").split(",") if key}
+# Reverse proxies / load balancers in front of the API (comma-separated IPs or CIDRs). Only
+# X-Forwarded-For hops they appended are believed; with none set, the peer address is the client
+TRUSTED_PROXIES = [ipaddress.ip_network(net.strip(), strict=False)
+                   for net in os.getenv("TRUSTED_PROXIES", "").split(",") if net.strip()]
+# How long finished jobs stay queryable via /jobs/{id}
+JOB_TTL_S = int(os.getenv("JOB_TTL_S", "3600"))
+# SSE keep-alive comment interval, so idle proxies don't drop the stream
+SSE_KEEPALIVE_S = 15
+# /analyze-batch: items per worker call, worker calls in flight per batch request, and the request size cap
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "8"))
+BATCH_FANOUT = int(os.getenv("BATCH_FANOUT", "4"))
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "1000"))
+# Verdicts by file SHA-256, answered by GET /lookup/{sha256} so the frontend can skip
+# re-uploading known files. Local SQLite (empty path: memory only), keyed like the workers' caches (cache_version)
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "/tmp/result_store.sqlite3")
+RESULT_STORE_TTL_S = int(os.getenv("RESULT_STORE_TTL_S", str(7 * 24 * 3600)))
 
-app = FastAPI(title="Misinformation Detector API")
+SHA256_HEX = re.compile(r"[0-9a-fA-F]{64}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Resolve the worker handle once instead of per request (a test can pre-set app.state.dispatcher)
+    if getattr(app.state, "dispatcher", None) is None:
+        app.state.dispatcher = make_dispatcher(ANALYSIS_BACKEND, MODAL_APP_NAME, MODAL_CLASS_NAME)
+    try:
+        await app.state.dispatcher.start()
+    except Exception as e:
+        # Keep serving; the handle is resolved lazily on the first analysis instead
+        print(f"Dispatcher startup failed ({e}); will retry on first request")
+    # Analyses run through one scheduler: bounded queue, priority lanes, load shedding (a test can pre-set it)
+    if getattr(app.state, "admission", None) is None:
+        app.state.admission = AdmissionController(on_shed=lambda lane, reason: SHED.inc(lane=lane, reason=reason))
+    if getattr(app.state, "jobs", None) is None:
+        app.state.jobs = InMemoryJobStore(ttl_seconds=JOB_TTL_S)
+    if getattr(app.state, "results", None) is None:
+        # Same version string as the workers' own caches, so /lookup never serves another configuration's verdict
+        app.state.results = VerdictCache(cache_version(INFERENCE_BACKEND, CASCADE), path=RESULT_STORE_PATH or None, ttl_seconds=RESULT_STORE_TTL_S)
+    # Strong references to running job tasks (the event loop only keeps weak ones)
+    app.state.job_tasks = set()
+    yield
+
+app = FastAPI(title="Misinformation Detector API", lifespan=lifespan)
+
+# --- METRICS ---
+REQUESTS = REGISTRY.counter("veritas_requests_total", "Requests received", ["endpoint"])
+ERRORS = REGISTRY.counter("veritas_errors_total", "Requests that ended in an error", ["endpoint"])
+CACHE_HITS = REGISTRY.counter("veritas_cache_hits_total", "Analyses answered from the worker verdict cache")
+LOOKUPS = REGISTRY.counter("veritas_lookups_total", "GET /lookup requests by outcome", ["outcome"])
+IN_FLIGHT = REGISTRY.gauge("veritas_inflight_requests", "Analyses currently in progress")
+QUEUE_DEPTH = REGISTRY.gauge("veritas_queue_depth", "Analyses waiting for a slot", ["lane"])
+ESTIMATED_WAIT = REGISTRY.gauge("veritas_estimated_wait_seconds", "Expected wait for a slot of a new request", ["lane"])
+SHED = REGISTRY.counter("veritas_shed_total", "Requests refused or dropped by admission control", ["lane", "reason"])
+REQUEST_LATENCY = REGISTRY.histogram("veritas_request_latency_seconds", "End-to-end latency", ["endpoint"])
+STAGE_LATENCY = REGISTRY.histogram("veritas_stage_latency_seconds", "Latency per pipeline stage (control plane + worker)", ["stage"])
+PEAK_RSS = REGISTRY.histogram("veritas_analysis_peak_rss_megabytes", "Worker peak RSS during an analysis",
+                              buckets=(256, 512, 1024, 2048, 4096, 8192, 16384))
+
+def record_analysis(endpoint, result):
+    # Folds one analysis result (and its optional per-stage "timings") into the metrics
+    if not METRICS_ENABLED:
+        return
+    if result.get("status") != "success":
+        ERRORS.inc(endpoint=endpoint)
+    if result.get("cached"):
+        CACHE_HITS.inc()
+    for stage, ms in result.get("timings", {}).items():
+        if stage.endswith("_ms"):
+            STAGE_LATENCY.observe(ms / 1000.0, stage=stage[:-3])
+    if "peak_rss_mb" in result:
+        PEAK_RSS.observe(result["peak_rss_mb"])
+
+async def remember(result):
+    # Files a successful verdict under the digest the worker computed from the bytes it read
+    # (never one the client claims), so GET /lookup can answer the next upload of that file.
+    # The store is SQLite: the write runs in the threadpool, off the event loop
+    digest = result.get("sha256")
+    results = getattr(app.state, "results", None)
+    if digest and results is not None and result.get("status") == "success":
+        try:
+            await run_in_threadpool(results.put, digest, result)
+        except Exception as e:
+            print(f"Result store write failed: {e}")
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +151,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser read when to retry a 429 / 503
+    expose_headers=["Retry-After"],
 )
 
 s3_client = boto3.client(
@@ -42,18 +160,55 @@ s3_client = boto3.client(
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
     region_name=AWS_REGION,
+    endpoint_url=AWS_ENDPOINT_URL,
 )
 
 class AnalyzeRequest(BaseModel):
     file_key: str
     file_type: str
 
+class AnalyzeBatchRequest(BaseModel):
+    items: List[AnalyzeRequest]
+
+class MultipartInitRequest(BaseModel):
+    file_type: str
+    extension: str
+    size: int
+
+class MultipartPartsRequest(BaseModel):
+    file_key: str
+    upload_id: str
+    part_numbers: List[int]
+
+class CompletedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class MultipartCompleteRequest(BaseModel):
+    file_key: str
+    upload_id: str
+    parts: List[CompletedPart]
+
+class MultipartAbortRequest(BaseModel):
+    file_key: str
+    upload_id: str
+
 @app.get("/")
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+def metrics():
+    admission = getattr(app.state, "admission", None)
+    if admission is not None:
+        for lane, depth in admission.queue_depths().items():
+            QUEUE_DEPTH.set(depth, lane=lane)
+            ESTIMATED_WAIT.set(round(admission.estimated_wait(lane), 3), lane=lane)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/generate-upload-url")
 def generate_upload_url(file_type: str, extension: str):
+    REQUESTS.inc(endpoint="generate-upload-url")
     if not AWS_BUCKET_NAME:
         raise HTTPException(status_code=500, detail="Server misconfigured: Missing S3 Bucket")
 
@@ -77,37 +232,400 @@ def generate_upload_url(file_type: str, extension: str):
         }
     except Exception as e:
         print(f"Error generating URL: {e}")
+        ERRORS.inc(endpoint="generate-upload-url")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/analyze")
-async def analyze_media(request: AnalyzeRequest):
+# --- MULTIPART UPLOADS ---
+# Large files go to S3 in parts instead of one PUT, so the browser can send several
+# parts at once and retry a failed part alone:
+#   POST /multipart-upload/initiate       -> upload_id, file_key, part_size, part_count
+#   POST /multipart-upload/presign-parts  -> one presigned PUT URL per requested part number
+#   POST /multipart-upload/complete       -> joins the parts (number + ETag); file_key is then analyzable
+#   POST /multipart-upload/abort          -> drops the parts uploaded so far
+
+def multipart_key(file_key):
+    # Only objects this API created: a client cannot complete or abort arbitrary keys
+    if not file_key.startswith("uploads/"):
+        raise HTTPException(status_code=422, detail="Unknown upload key")
+    return file_key
+
+@app.post("/multipart-upload/initiate")
+def initiate_multipart_upload(request: MultipartInitRequest):
+    REQUESTS.inc(endpoint="multipart-initiate")
+    if not AWS_BUCKET_NAME:
+        raise HTTPException(status_code=500, detail="Server misconfigured: Missing S3 Bucket")
+    # The worker's download limit for this type: a larger upload could never be analyzed
+    max_bytes = max_media_bytes(request.file_type)
+    if request.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File is {request.size} bytes, above the {max_bytes} byte limit")
+    part_count = max(1, -(-request.size // MULTIPART_PART_SIZE))
+    if request.size <= 0 or part_count > MULTIPART_MAX_PARTS:
+        raise HTTPException(status_code=422, detail=f"File size must be between 1 byte and {MULTIPART_PART_SIZE * MULTIPART_MAX_PARTS} bytes")
+
+    file_uuid = str(uuid.uuid4())
+    object_name = f"uploads/{file_uuid}.{request.extension}"
     try:
-        print(f"Looking up Modal Class: {MODAL_CLASS_NAME} in App: {MODAL_APP_NAME}...")
+        upload = s3_client.create_multipart_upload(Bucket=AWS_BUCKET_NAME, Key=object_name, ContentType=request.file_type)
+    except Exception as e:
+        print(f"Error starting multipart upload: {e}")
+        ERRORS.inc(endpoint="multipart-initiate")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "upload_id": upload["UploadId"],
+        "file_key": object_name,
+        "file_id": file_uuid,
+        "part_size": MULTIPART_PART_SIZE,
+        "part_count": part_count,
+    }
 
-        # FIX: Use Cls.from_name() which is the correct syntax for Modal 1.0+
-        ModelClass = modal.Cls.from_name(MODAL_APP_NAME, MODAL_CLASS_NAME)
+@app.post("/multipart-upload/presign-parts")
+def presign_multipart_parts(request: MultipartPartsRequest):
+    REQUESTS.inc(endpoint="multipart-presign")
+    file_key = multipart_key(request.file_key)
+    if not request.part_numbers or len(request.part_numbers) > MULTIPART_MAX_PARTS:
+        raise HTTPException(status_code=422, detail=f"Request between 1 and {MULTIPART_MAX_PARTS} parts")
+    if any(not 1 <= number <= MULTIPART_MAX_PARTS for number in request.part_numbers):
+        raise HTTPException(status_code=422, detail=f"Part numbers run from 1 to {MULTIPART_MAX_PARTS}")
+    # Local request signing (no S3 round-trip), so thousands of parts cost one request
+    urls = {}
+    for number in request.part_numbers:
+        urls[number] = s3_client.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': AWS_BUCKET_NAME, 'Key': file_key, 'UploadId': request.upload_id, 'PartNumber': number},
+            ExpiresIn=3600
+        )
+    return {"urls": urls}
 
-        # Generate a read-url for the worker
-        read_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': AWS_BUCKET_NAME, 'Key': request.file_key},
-            ExpiresIn=300
+@app.post("/multipart-upload/complete")
+def complete_multipart_upload(request: MultipartCompleteRequest):
+    REQUESTS.inc(endpoint="multipart-complete")
+    file_key = multipart_key(request.file_key)
+    if not request.parts:
+        raise HTTPException(status_code=422, detail="No parts to complete")
+    parts = [{"PartNumber": part.part_number, "ETag": part.etag} for part in sorted(request.parts, key=lambda p: p.part_number)]
+    try:
+        s3_client.complete_multipart_upload(
+            Bucket=AWS_BUCKET_NAME, Key=file_key, UploadId=request.upload_id, MultipartUpload={"Parts": parts}
         )
+    except Exception as e:
+        # e.g. a missing part or a wrong ETag: the upload stays open, so the client may retry or abort
+        print(f"Error completing multipart upload: {e}")
+        ERRORS.inc(endpoint="multipart-complete")
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"file_key": file_key}
 
-        print(f"Triggering inference on: {request.file_key}")
+@app.post("/multipart-upload/abort")
+def abort_multipart_upload(request: MultipartAbortRequest):
+    REQUESTS.inc(endpoint="multipart-abort")
+    file_key = multipart_key(request.file_key)
+    try:
+        s3_client.abort_multipart_upload(Bucket=AWS_BUCKET_NAME, Key=file_key, UploadId=request.upload_id)
+    except Exception as e:
+        print(f"Error aborting multipart upload: {e}")
+        ERRORS.inc(endpoint="multipart-abort")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"aborted": True}
+
+@app.get("/lookup/{sha256}")
+def lookup(sha256: str):
+    """Stored verdict for a file's SHA-256 (hex), or 404: the client uploads only on a miss."""
+    REQUESTS.inc(endpoint="lookup")
+    if not SHA256_HEX.fullmatch(sha256):
+        raise HTTPException(status_code=422, detail="Expected a hex SHA-256 digest")
+    result = app.state.results.get(sha256.lower())
+    if result is None:
+        LOOKUPS.inc(outcome="miss")
+        raise HTTPException(status_code=404, detail="No stored verdict for this file")
+    LOOKUPS.inc(outcome="hit")
+    # The stored timings belong to the original analysis, not to this request
+    result.pop("timings", None)
+    result.pop("peak_rss_mb", None)
+    result["cached"] = True
+    return result
 
-        # Instantiate the class and call the method remotely
-        # Note: ModelClass() creates the remote object handle
-        result = ModelClass().analyze_media.remote(read_url, request.file_type)
+# --- ADMISSION ---
+
+def trusted_proxy(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in net for net in TRUSTED_PROXIES)
 
+def client_id(http_request):
+    """
+    The address charged against the rate limit: the peer, or, when the peer is a trusted
+    proxy, the right-most X-Forwarded-For hop that is not one. Hops to the left of it are
+    whatever the caller sent, so they never pick the bucket.
+    """
+    client = http_request.client.host if http_request.client else "unknown"
+    if not trusted_proxy(client):
+        return client
+    hops = [hop.strip() for hop in http_request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else client
+
+def admission_for(http_request, default_lane):
+    """
+    (lane, client) for a request: X-Priority picks a lane (see admission.LANES); "moderation"
+    needs an X-Api-Key from MODERATION_API_KEYS and has no rate limit (client None).
+    """
+    lane = http_request.headers.get("x-priority", default_lane)
+    if lane == "moderation":
+        if http_request.headers.get("x-api-key") in MODERATION_API_KEYS:
+            return lane, None
+        lane = default_lane
+    return (lane if lane in LANES else default_lane), client_id(http_request)
+
+def rejection(e):
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def presign_read_url(file_key):
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': AWS_BUCKET_NAME, 'Key': file_key},
+        ExpiresIn=300
+    )
+
+async def run_analysis(endpoint, file_key, file_type, on_stage=None, lane="interactive"):
+    """
+    Presign -> slot in `lane` -> worker -> result, shared by /analyze and the job API.
+    The caller has already admitted the request (admission.admit, once per request).
+    on_stage: optional callable(stage), fed the worker's progress events.
+    Raises Rejected when the request is shed while queued;
+    any other failure comes back as an error result.
+    """
+    IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        # Generate a read-url for the worker (boto3 is blocking: keep it off the event loop)
+        stage_started = time.perf_counter()
+        read_url = await run_in_threadpool(presign_read_url, file_key)
+        presign_ms = (time.perf_counter() - stage_started) * 1000
+
+        print(f"Triggering inference on: {file_key}")
+
+        # Awaiting the worker yields the event loop, so other requests proceed meanwhile
+        stage_started = time.perf_counter()
+        async with app.state.admission.slot(lane):
+            if on_stage is None:
+                result = await app.state.dispatcher.analyze(read_url, file_type)
+            else:
+                result = None
+                async for event in app.state.dispatcher.analyze_events(read_url, file_type):
+                    if event["event"] == "stage":
+                        on_stage(event["stage"])
+                    else:
+                        result = event["result"]
+                if result is None:
+                    raise RuntimeError("Worker stream ended without a result")
+        dispatch_ms = (time.perf_counter() - stage_started) * 1000
+
+        # Control-plane stages join the worker's optional timings
+        if "timings" in result:
+            result["timings"].update({"presign_ms": round(presign_ms, 3), "dispatch_ms": round(dispatch_ms, 3)})
+        record_analysis(endpoint, result)
+        await remember(result)
         return result
 
+    except Rejected:
+        raise
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"FULL ERROR: {error_details}")
+        ERRORS.inc(endpoint=endpoint)
         return {
             "status": "error",
             "message": f"Backend Error: {str(e)}",
             "debug_error": error_details
-        }
\ No newline at end of file
+        }
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+
+@app.post("/analyze")
+async def analyze_media(request: AnalyzeRequest, http_request: Request):
+    REQUESTS.inc(endpoint="analyze")
+    lane, client = admission_for(http_request, "interactive")
+    try:
+        # Refused before presigning: shedding must cost next to nothing
+        app.state.admission.admit(lane, client)
+        return await run_analysis("analyze", request.file_key, request.file_type, lane=lane)
+    except Rejected as e:
+        raise rejection(e)
+
+# --- BATCH API ---
+# POST /analyze-batch presigns every key in one pass, splits the items into
+# chunks of BATCH_CHUNK_SIZE and sends up to BATCH_FANOUT chunks at once, each
+# as one worker call (one batched ensemble pass on whichever container takes it).
+# Results stream back as NDJSON in completion order, one line per item:
+#   {"index": i, "file_key": ..., "result": {...}}
+# followed by {"done": true, "items": n, "errors": k}. A failed item only fails its own line.
+
+def presign_all(file_keys):
+    # Presigning is local request signing (no S3 round-trip): one thread hop covers the whole batch
+    urls, errors = [], []
+    for file_key in file_keys:
+        try:
+            urls.append(presign_read_url(file_key))
+            errors.append(None)
+        except Exception as e:
+            urls.append(None)
+            errors.append(str(e))
+    return urls, errors
+
+async def run_chunk(chunk, read_urls, file_types, fanout, lane="bulk"):
+    """One worker call for a chunk of item indices; returns [(index, result)]."""
+    try:
+        async with fanout, app.state.admission.slot(lane):
+            IN_FLIGHT.inc()
+            started = time.perf_counter()
+            try:
+                results = await app.state.dispatcher.analyze_batch([read_urls[i] for i in chunk], [file_types[i] for i in chunk])
+            except Exception as e:
+                print(f"Batch chunk failed: {e}")
+                results = [{"status": "error", "message": f"Backend Error: {str(e)}"} for _ in chunk]
+            finally:
+                IN_FLIGHT.dec()
+            dispatch_ms = round((time.perf_counter() - started) * 1000, 3)
+    except Rejected as e:
+        # Shed while queued: only this chunk's items fail, each saying when to retry
+        return [(i, {"status": "error", "message": f"Shed: {e}", "retry_after": e.retry_after}) for i in chunk]
+    for result in results:
+        if "timings" in result:
+            result["timings"]["dispatch_ms"] = dispatch_ms
+    return list(zip(chunk, results))
+
+@app.post("/analyze-batch")
+async def analyze_batch(request: AnalyzeBatchRequest, http_request: Request):
+    REQUESTS.inc(endpoint="analyze-batch")
+    items = request.items
+    if not items:
+        raise HTTPException(status_code=422, detail="No items to analyze")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+    # One token per batch request; its chunks then queue in the (default: bulk) lane
+    lane, client = admission_for(http_request, "bulk")
+    try:
+        app.state.admission.admit(lane, client)
+    except Rejected as e:
+        raise rejection(e)
+
+    started = time.perf_counter()
+    read_urls, presign_errors = await run_in_threadpool(presign_all, [item.file_key for item in items])
+    file_types = [item.file_type for item in items]
+
+    pending = [i for i, error in enumerate(presign_errors) if error is None]
+    chunks = [pending[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(pending), BATCH_CHUNK_SIZE)]
+    fanout = asyncio.Semaphore(BATCH_FANOUT)
+
+    async def stream():
+        errors = 0
+
+        async def line(index, result):
+            nonlocal errors
+            if result.get("status") != "success":
+                errors += 1
+            record_analysis("analyze-batch", result)
+            await remember(result)
+            return json.dumps({"index": index, "file_key": items[index].file_key, "result": result}) + "\n"
+
+        # Tasks start here, so nothing runs for a client that never reads the response
+        tasks = [asyncio.create_task(run_chunk(chunk, read_urls, file_types, fanout, lane)) for chunk in chunks]
+        try:
+            for index, error in enumerate(presign_errors):
+                if error is not None:
+                    yield await line(index, {"status": "error", "message": f"Presign failed: {error}"})
+            for finished in asyncio.as_completed(tasks):
+                for index, result in await finished:
+                    yield await line(index, result)
+            yield json.dumps({"done": True, "items": len(items), "errors": errors}) + "\n"
+        finally:
+            # Client went away mid-stream: stop the chunks still waiting for a worker
+            for task in tasks:
+                task.cancel()
+            REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint="analyze-batch")
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+# --- JOB API ---
+# POST /jobs returns at once; the analysis runs in the background and its
+# progress is readable via GET /jobs/{id} (poll) or GET /jobs/{id}/events (SSE).
+
+async def run_job(job_id, request, lane):
+    jobs = app.state.jobs
+    jobs.update(job_id, status="running")
+
+    def on_stage(stage):
+        jobs.update(job_id, stage=stage)
+        jobs.add_event(job_id, "stage", {"stage": stage})
+
+    try:
+        result = await run_analysis("jobs", request.file_key, request.file_type, on_stage, lane=lane)
+    except Rejected as e:
+        result = {"status": "error", "message": f"Shed: {e}", "retry_after": e.retry_after}
+    jobs.update(job_id, status="done" if result.get("status") == "success" else "error", result=result)
+    jobs.add_event(job_id, "result", result)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: AnalyzeRequest, http_request: Request):
+    REQUESTS.inc(endpoint="jobs")
+    # Refused up front (429/503) rather than accepted into a job that would only be shed
+    lane, client = admission_for(http_request, "interactive")
+    try:
+        app.state.admission.admit(lane, client)
+    except Rejected as e:
+        raise rejection(e)
+    job = app.state.jobs.create(request.file_key, request.file_type)
+    task = asyncio.create_task(run_job(job["job_id"], request, lane))
+    app.state.job_tasks.add(task)
+    task.add_done_callback(app.state.job_tasks.discard)
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events",
+    }
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    jobs = app.state.jobs
+    if jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    # EventSource sends Last-Event-ID when it reconnects: resume after it
+    try:
+        after = int(request.headers.get("last-event-id", -1))
+    except ValueError:
+        after = -1
+
+    async def stream():
+        nonlocal after
+        while True:
+            events = await jobs.wait_events(job_id, after, timeout=SSE_KEEPALIVE_S)
+            if not events:
+                job = jobs.get(job_id)
+                if job is None or job["status"] in ("done", "error") or await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                after = event["id"]
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["event"] == "result":
+                    return
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,219 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+# Anything larger than this is refused outright. Videos get their own, higher cap: they always
+# go to a temp file and are decoded a frame at a time, so their size barely affects memory.
+# The API checks uploads against the same limits (max_media_bytes), before any bytes are sent.
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(200 * 1024 * 1024)))
+MEDIA_MAX_VIDEO_BYTES = int(os.getenv("MEDIA_MAX_VIDEO_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Downloads stay in memory up to this size, then spill to a temp file
+MEDIA_SPILL_BYTES = int(os.getenv("MEDIA_SPILL_BYTES", str(32 * 1024 * 1024)))
+MEDIA_CONNECT_TIMEOUT_S = float(os.getenv("MEDIA_CONNECT_TIMEOUT_S", "5"))
+MEDIA_READ_TIMEOUT_S = float(os.getenv("MEDIA_READ_TIMEOUT_S", "30"))
+# Wall-clock cap for one whole download (the read timeout only bounds each socket read)
+MEDIA_TOTAL_TIMEOUT_S = float(os.getenv("MEDIA_TOTAL_TIMEOUT_S", "120"))
+
+
+# Prefix fetched by fetch_header(): EXIF + frame header of typical uploads fit well inside it
+MEDIA_HEADER_BYTES = int(os.getenv("MEDIA_HEADER_BYTES", str(64 * 1024)))
+# Upper bound when the EXIF block is larger (e.g. embedded thumbnails, maker notes)
+MEDIA_HEADER_MAX_BYTES = 1024 * 1024
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def max_media_bytes(file_type):
+    """Largest file of this MIME type the worker will download."""
+    return MEDIA_MAX_VIDEO_BYTES if (file_type or "").startswith("video") else MEDIA_MAX_BYTES
+
+
+class FetchCancelled(Exception):
+    pass
+
+
+class FetchedMedia:
+    """
+    One downloaded file: either in memory (`data`, bytes) or spilled to a
+    unique temp file (`path`). `sha256` is computed while streaming; `etag`
+    is the response's ETag, to match against a header read of the same object.
+    Use as a context manager, or call close(), to remove a spilled file.
+    """
+
+    def __init__(self, data=None, path=None, size=0, sha256=None, etag=None):
+        self.data = data
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.etag = etag
+
+    @property
+    def source(self):
+        # What the detector consumes: bytes (LoadedImage.from_source wraps them without a copy) or a path
+        return self.data if self.data is not None else self.path
+
+    def close(self):
+        self.data = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MediaFetcher:
+    """
+    Pooled, size- and time-bounded media download.
+
+    One requests.Session per fetcher keeps connections to S3 alive across
+    downloads; its urllib3 pool is thread-safe, so a single fetcher serves
+    the parallel downloads of a whole micro-batch. Bodies are read in large
+    chunks straight into memory and only hit the disk above `spill_bytes`
+    (or when the caller needs a path, e.g. cv2 for videos), always under a
+    unique file name so concurrent inputs never collide.
+    """
+
+    def __init__(self, max_bytes=MEDIA_MAX_BYTES, spill_bytes=MEDIA_SPILL_BYTES,
+                 connect_timeout=MEDIA_CONNECT_TIMEOUT_S, read_timeout=MEDIA_READ_TIMEOUT_S,
+                 total_timeout=MEDIA_TOTAL_TIMEOUT_S, chunk_size=1024 * 1024, pool_size=32, tmp_dir=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.chunk_size = chunk_size
+        self.tmp_dir = tmp_dir
+
+        self.session = requests.Session()
+        # Retry connection hiccups and S3 throttling (GETs are idempotent)
+        retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url, to_file=False, cancel=None, max_bytes=None):
+        """
+        Downloads `url` into a FetchedMedia.
+        to_file=True always writes a temp file (for consumers that need a path).
+        cancel: optional threading.Event; once set, the download stops with FetchCancelled.
+        max_bytes: limit for this download (default: the fetcher's max_bytes).
+        Raises MediaTooLarge beyond the limit, TimeoutError beyond total_timeout,
+        and requests' exceptions for HTTP/network errors.
+        """
+        max_bytes = max_bytes or self.max_bytes
+        started = time.monotonic()
+        digest = hashlib.sha256()
+        buffer = io.BytesIO()
+        spill = None
+        size = 0
+
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+                etag = r.headers.get("ETag")
+                declared = int(r.headers.get("Content-Length") or 0)
+                if declared > max_bytes:
+                    raise MediaTooLarge(f"{declared} bytes exceeds the {max_bytes} byte limit")
+                if to_file or declared > self.spill_bytes:
+                    spill = self._open_spill()
+
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaTooLarge(f"Download exceeds the {max_bytes} byte limit")
+                    if time.monotonic() - started > self.total_timeout:
+                        raise TimeoutError(f"Download took longer than {self.total_timeout}s")
+                    if cancel is not None and cancel.is_set():
+                        raise FetchCancelled("Download cancelled")
+                    digest.update(chunk)
+                    if spill is None and size > self.spill_bytes:
+                        # Crossed the in-memory budget: move what we have to disk and continue there
+                        spill = self._open_spill()
+                        spill.write(buffer.getbuffer())
+                        buffer = io.BytesIO()
+                    (spill or buffer).write(chunk)
+
+            if spill is not None:
+                spill.close()
+                return FetchedMedia(path=spill.name, size=size, sha256=digest.hexdigest(), etag=etag)
+            # getvalue() hands over the BytesIO's own buffer rather than copying it
+            return FetchedMedia(data=buffer.getvalue(), size=size, sha256=digest.hexdigest(), etag=etag)
+
+        except BaseException:
+            if spill is not None:
+                spill.close()
+                os.remove(spill.name)
+            raise
+
+    def fetch_header(self, url, nbytes=MEDIA_HEADER_BYTES):
+        """
+        Reads just the start of the object with an HTTP Range request and parses it
+        (media_header.parse_header): format, dimensions and EXIF, plus the object's
+        full size and ETag. Re-reads a longer prefix if the EXIF block needs it, and
+        fetches the tail for WebP files that keep their EXIF chunk at the end.
+        Works against servers that ignore Range too (only the first bytes are read).
+        """
+        try:
+            from media_header import find_webp_exif, parse_header
+        except ImportError:
+            from backend.media_header import find_webp_exif, parse_header
+
+        data, size, etag = self._read_range(url, f"bytes=0-{nbytes - 1}", nbytes)
+        header = parse_header(data)
+        if header.need and len(data) >= nbytes and header.need <= MEDIA_HEADER_MAX_BYTES:
+            # Plus another prefix's worth, for the frame header that follows the large segment
+            extended = header.need + nbytes
+            data, size, etag = self._read_range(url, f"bytes=0-{extended - 1}", extended)
+            header = parse_header(data)
+        header.size, header.etag = size, etag
+
+        if header.format == "webp" and header.exif_at_end and size and size > len(data):
+            try:
+                tail, _, tail_etag = self._read_range(url, f"bytes=-{nbytes}", nbytes)
+                if tail_etag == etag:
+                    header.exif_raw = find_webp_exif(tail)
+                    header.exif_known = header.exif_raw is not None
+            except ValueError:
+                pass  # no suffix ranges here: the EXIF is read from the full download instead
+        return header
+
+    def _read_range(self, url, byte_range, limit):
+        # Returns (up to `limit` bytes, full object size or None, ETag or None)
+        with self.session.get(url, headers={"Range": byte_range}, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            size = None
+            content_range = r.headers.get("Content-Range", "")
+            if r.status_code == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                size = int(total) if total.isdigit() else None
+            elif r.status_code == 200:
+                # Range ignored: the body is the whole object, of which we read only the start
+                size = int(r.headers.get("Content-Length") or 0) or None
+            buffer = bytearray()
+            for chunk in r.iter_content(chunk_size=min(limit, self.chunk_size)):
+                buffer += chunk
+                if len(buffer) >= limit:
+                    break
+            if r.status_code == 200 and byte_range.startswith("bytes=-"):
+                raise ValueError("Server ignored the suffix Range request")
+            return bytes(buffer[:limit]), size, r.headers.get("ETag")
+
+    def _open_spill(self):
+        return tempfile.NamedTemporaryFile(prefix="veritas_media_", dir=self.tmp_dir, delete=False)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,165 @@
+import struct
+
+# JPEG start-of-frame markers that carry the image size (not DHT 0xC4, JPG 0xC8 or DAC 0xCC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class MediaHeader:
+    """
+    What the first bytes of an image container tell us before the body arrives.
+
+    format: "jpeg" | "png" | "webp" | None (not a supported image container)
+    width / height: pixel size, or None if the size-carrying segment lies beyond the bytes read
+    exif_raw: the raw TIFF-structured EXIF block, or None
+    exif_known: True once the bytes read settle the EXIF question: the block was read whole,
+                or the container shows there is none. Only then may the header's EXIF stand
+                in for the full download's (see worker.header_hint).
+    need: if a segment of interest extends past the bytes read, the byte count that would cover it
+    exif_at_end: WebP announced EXIF (VP8X flag) but stores it after the image data
+    """
+
+    def __init__(self, format=None, width=None, height=None, exif_raw=None, need=None, exif_at_end=False):
+        self.format = format
+        self.width = width
+        self.height = height
+        self.exif_raw = exif_raw
+        self.exif_known = False
+        self.need = need
+        self.exif_at_end = exif_at_end
+        self.size = None   # full object size, from Content-Range / Content-Length
+        self.etag = None
+
+    @property
+    def pixels(self):
+        return self.width * self.height if self.width and self.height else None
+
+    def exif(self):
+        """The EXIF block as {tag_id: value}, merged like PIL's _getexif() (IFD0 + Exif IFD), or None."""
+        if not self.exif_raw:
+            return None
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif.load(self.exif_raw)
+        return exif._get_merged_dict() or None
+
+    def as_dict(self):
+        return {"format": self.format, "width": self.width, "height": self.height, "bytes": self.size,
+                "exif": bool(self.exif_raw) if self.exif_known else None}
+
+
+def parse_header(data):
+    """Parses as much of a JPEG / PNG / WebP header as `data` (a prefix of the file) contains."""
+    data = bytes(data)
+    if data[:3] == b"\xff\xd8\xff":
+        return _parse_jpeg(data)
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return _parse_png(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _parse_webp(data)
+    return MediaHeader()
+
+
+def _parse_jpeg(data):
+    header = MediaHeader("jpeg")
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            break  # lost sync: corrupt or not a JPEG after all
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # standalone markers
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # end of image / start of scan: no more header segments
+            break
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        end = pos + 2 + length
+        if end > len(data):
+            header.need = end
+            break
+        segment = data[pos + 4:end]
+        if marker == 0xE1 and segment[:6] == b"Exif\x00\x00" and header.exif_raw is None:
+            header.exif_raw = segment[6:]
+        elif marker in _JPEG_SOF and len(segment) >= 5:
+            header.height, header.width = struct.unpack(">HH", segment[1:5])
+            # APP segments (EXIF included) all precede the frame header
+            header.exif_known = True
+            break
+        pos = end
+    return header
+
+
+def _parse_png(data):
+    header = MediaHeader("png")
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        end = pos + 12 + length  # length + type + data + CRC
+        if kind == b"IDAT":
+            # eXIf must come before the image data
+            header.exif_known = True
+            break
+        if end > len(data):
+            header.need = end
+            break
+        body = data[pos + 8:pos + 8 + length]
+        if kind == b"IHDR":
+            header.width, header.height = struct.unpack(">II", body[:8])
+        elif kind == b"eXIf":
+            header.exif_raw = body
+            header.exif_known = True
+        pos = end
+    return header
+
+
+def _parse_webp(data):
+    header = MediaHeader("webp")
+    pos = 12
+    while pos + 8 <= len(data):
+        kind, length = struct.unpack("<4sI", data[pos:pos + 8])
+        end = pos + 8 + length + (length & 1)  # chunks are padded to an even size
+        body = data[pos + 8:min(end, len(data))]
+        if kind == b"VP8X" and len(body) >= 10:
+            flags = body[0]
+            header.width = 1 + int.from_bytes(body[4:7], "little")
+            header.height = 1 + int.from_bytes(body[7:10], "little")
+            header.exif_at_end = bool(flags & 0x08)
+            header.exif_known = not header.exif_at_end
+        elif kind in (b"VP8 ", b"VP8L") and header.width is None:
+            # Simple format: a single image chunk, no room for metadata
+            if kind == b"VP8 " and len(body) >= 10:
+                # Lossy bitstream: frame tag (3 bytes), start code (3 bytes), then 14-bit width/height
+                w, h = struct.unpack("<HH", body[6:10])
+                header.width, header.height = w & 0x3FFF, h & 0x3FFF
+            elif kind == b"VP8L" and len(body) >= 5:
+                bits = int.from_bytes(body[1:5], "little")
+                header.width, header.height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            header.exif_known = True
+        elif kind == b"EXIF":
+            if end > len(data):
+                header.need = end
+                break
+            header.exif_raw = body[:length]
+            header.exif_at_end = False
+            header.exif_known = True
+        if header.width is not None and header.exif_known:
+            break
+        if end > len(data):
+            break
+        pos = end
+    return header
+
+
+def find_webp_exif(tail):
+    """Locates the EXIF chunk in the last bytes of a WebP file (where the container puts it)."""
+    idx = tail.rfind(b"EXIF")
+    while idx != -1:
+        if idx + 8 <= len(tail):
+            length = struct.unpack("<I", tail[idx + 4:idx + 8])[0]
+            if idx + 8 + length <= len(tail):
+                return bytes(tail[idx + 8:idx + 8 + length])
+        idx = tail.rfind(b"EXIF", 0, idx)
+    return None
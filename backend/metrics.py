@@ -0,0 +1,136 @@
+import os
+import threading
+
+# Set METRICS_ENABLED=0 to turn every metric update into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Latency buckets in seconds (presign is ~ms, a cold GPU analysis can take tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _label_str(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._label_str(key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = [
+            f"{self.name}_bucket{self._label_str(key, ('le', repr(float(bound))))} {n}"
+            for bound, n in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{self._label_str(key, ('le', '+Inf'))} {count}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {total}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import time
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching for the detector worker.
+
+    Concurrent submit() calls are collected into one batch until either
+    `max_batch_size` items are waiting or `max_wait_ms` has passed since the
+    first item of the batch arrived. The batch is handed to `process_batch`
+    (a blocking callable: list of items -> list of results, same order) in a
+    worker thread, and each result is routed back to the caller that submitted it.
+
+    Only one batch is processed at a time; items arriving meanwhile form the next batch.
+    Plain asyncio, no Modal dependency, so it can be driven with a fake model.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=20, history=2048):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = None
+        self._worker = None
+
+        # Rolling window of queueing delays (seconds) and batch sizes, for stats()
+        self._delays = collections.deque(maxlen=history)
+        self._batch_sizes = collections.deque(maxlen=history)
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        """Queue one item and wait for its result (re-raises the batch's exception on failure)."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def stats(self):
+        """Queueing delay percentiles (ms) and batch-size figures over the recent window."""
+        delays = sorted(self._delays)
+        sizes = list(self._batch_sizes)
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": (sum(sizes) / len(sizes)) if sizes else 0.0,
+            "queue_delay_p50_ms": _percentile(delays, 50) * 1000,
+            "queue_delay_p99_ms": _percentile(delays, 99) * 1000,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        getter = None
+
+        while True:
+            # Block until the first item of the next batch arrives
+            if getter is None:
+                getter = asyncio.ensure_future(self._queue.get())
+            batch = [await getter]
+            getter = None
+            deadline = loop.time() + self.max_wait
+
+            # Fill the batch until it is full or the window closes.
+            # A pending get() is carried over rather than cancelled so no item is dropped.
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                getter = asyncio.ensure_future(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=remaining)
+                if not done:
+                    break
+                batch.append(getter.result())
+                getter = None
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self._delays.append(started - enqueued)
+            self._batch_sizes.append(len(batch))
+            self.batches += 1
+            self.items += len(batch)
+
+            items = [entry[0] for entry in batch]
+            try:
+                results = await asyncio.to_thread(self.process_batch, items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"process_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
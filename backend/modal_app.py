@@ -1,13 +1,23 @@
 import os
 import modal
 try:
-    from detector_logic import DeepfakeDetectorLogic
+    from detector_logic import MODEL_A_ID, MODEL_B_ID
+    from worker import DetectorWorker, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, CASCADE, RECORD_TIMINGS
 except ImportError:
-    from backend.detector_logic import DeepfakeDetectorLogic
+    from backend.detector_logic import MODEL_A_ID, MODEL_B_ID
+    from backend.worker import DetectorWorker, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, CASCADE, RECORD_TIMINGS
 
-# Define the local path to the logic file
-# We assume this file is in the same directory as modal_app.py
-local_logic_path = os.path.join(os.path.dirname(__file__), "detector_logic.py")
+# Worker-side modules shipped into the image
+# We assume these files are in the same directory as modal_app.py
+WORKER_MODULES = ["detector_logic.py", "micro_batcher.py", "verdict_cache.py", "media_fetch.py", "media_header.py", "phash_index.py", "worker.py"]
+
+# Both models are downloaded once at image build time (same layout as detector_logic.prefetch_models),
+# so a new container loads them from local disk instead of resolving them on the Hub
+MODEL_CACHE_DIR = "/models"
+PREFETCH_MODELS = "from huggingface_hub import snapshot_download; " + "; ".join(
+    f"snapshot_download('{model_id}', local_dir='{MODEL_CACHE_DIR}/{model_id.replace('/', '__')}')"
+    for model_id in (MODEL_A_ID, MODEL_B_ID)
+)
 
 image = (
     modal.Image.debian_slim()
@@ -23,32 +33,63 @@ image = (
         "timm",
         "scipy"
     )
-    .add_local_file(local_logic_path, remote_path="/root/detector_logic.py")
+    .run_commands(f'python -c "{PREFETCH_MODELS}"')
+    .env({
+        "MODEL_CACHE_DIR": MODEL_CACHE_DIR,
+        "BATCH_MAX_SIZE": str(BATCH_MAX_SIZE),
+        "BATCH_MAX_WAIT_MS": str(BATCH_MAX_WAIT_MS),
+        "RECORD_TIMINGS": "1" if RECORD_TIMINGS else "0",
+        "CASCADE": "1" if CASCADE else "0",
+    })
 )
+for module_name in WORKER_MODULES:
+    image = image.add_local_file(os.path.join(os.path.dirname(__file__), module_name), remote_path=f"/root/{module_name}")
 
 app = modal.App("deepfake-detector-mvp")
 
 @app.cls(image=image, gpu="T4", timeout=600)
-class DeepfakeDetector(DeepfakeDetectorLogic):
+@modal.concurrent(max_inputs=BATCH_MAX_SIZE * 4)
+class DeepfakeDetector(DetectorWorker):
 
     @modal.enter()
     def setup(self):
-        self.load_models()
+        self.start_worker()
+
+    @modal.method()
+    async def analyze_media(self, file_url: str, file_type: str):
+        return await self.analyze_url(file_url, file_type)
+
+    @modal.method()
+    async def analyze_media_events(self, file_url: str, file_type: str):
+        """
+        Streaming variant of analyze_media for the job API: yields
+        {"event": "stage", "stage": ...} as the file progresses, then
+        {"event": "result", "result": ...}. Still goes through the micro-batcher.
+        """
+        async for event in self.analyze_url_events(file_url, file_type):
+            yield event
+
+    @modal.method()
+    def analyze_media_batch(self, file_urls: list, file_types: list):
+        """
+        Batched variant of analyze_media: one ensemble pass over every file that downloads.
+        Returns one result per URL, in order; a failed download only fails its own item.
+        """
+        return self.analyze_urls(list(zip(file_urls, file_types)))
+
+    @modal.method()
+    def batching_stats(self):
+        # p50/p99 queueing delay for tuning BATCH_MAX_WAIT_MS against latency SLOs
+        return self.batcher.stats()
+
+    @modal.method()
+    def startup_stats(self):
+        # Per-phase cold start of this container (imports, model loads, caches, warm-up)
+        return self.startup_timings
 
     @modal.method()
-    def analyze_media(self, file_url: str, file_type: str):
-        import requests
-        import numpy as np
-
-        # A. Download
-        local_filename = "/tmp/input_media"
-        try:
-            with requests.get(file_url, stream=True) as r:
-                r.raise_for_status()
-                with open(local_filename, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-        except Exception as e:
-            return {"status": "error", "message": f"Download failed: {str(e)}"}
-
-        return self.analyze_local_file(local_filename, file_type)
\ No newline at end of file
+    def cache_stats(self):
+        stats = self.cache.stats()
+        if self.phash_index is not None:
+            stats["near_duplicates"] = self.phash_index.stats()
+        return stats
@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from detector_logic import MODEL_A_ID, MODEL_B_ID, MODEL_CACHE_DIR, local_model_dir
+except ImportError:
+    from backend.detector_logic import MODEL_A_ID, MODEL_B_ID, MODEL_CACHE_DIR, local_model_dir
+
+# Where exported graphs live: <ONNX_MODEL_DIR>/<org>__<model>/{model.onnx, model.int8.onnx, config + preprocessor}.
+# Defaults to MODEL_CACHE_DIR, next to the pre-populated weights, so an export made at image build
+# time is what the workers load; backend/onnx_models/ when no model cache is configured
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR") or MODEL_CACHE_DIR or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+
+# Inference backends understood by DeepfakeDetectorLogic.load_models()
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+
+def model_dir(model_id, root=None):
+    return os.path.join(root or ONNX_MODEL_DIR, model_id.replace("/", "__"))
+
+
+def default_threads():
+    # Cores this process may actually run on (cgroup/affinity aware), not the host's total
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# --- EXPORT ---
+
+def export_model(model_id, root=None, opset=17):
+    """
+    Exports a HF image-classification model to <model_dir>/model.onnx (dynamic batch axis),
+    next to its config (id2label) and image-processor settings. The weights come from
+    MODEL_CACHE_DIR when they were pre-populated there, else from the Hub.
+    """
+    import torch
+    from PIL import Image
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+    out_dir = model_dir(model_id, root)
+    os.makedirs(out_dir, exist_ok=True)
+    source = local_model_dir(model_id) or model_id
+    processor = AutoImageProcessor.from_pretrained(source)
+    model = AutoModelForImageClassification.from_pretrained(source).eval()
+
+    class LogitsOnly(torch.nn.Module):
+        # The graph returns bare logits; softmax/top-k stay in Python like the HF pipeline
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, pixel_values):
+            return self.inner(pixel_values=pixel_values).logits
+
+    dummy = processor(images=[Image.new("RGB", (256, 256))] * 2, return_tensors="pt")["pixel_values"]
+    path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(model), (dummy,), path,
+            input_names=["pixel_values"], output_names=["logits"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset,
+        )
+    processor.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+    print(f"Exported {model_id} -> {path}")
+    return path
+
+
+def quantize_model(model_id, root=None):
+    """Dynamic int8 quantisation of the exported graph (weights int8, activations quantised at run time)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out_dir = model_dir(model_id, root)
+    src, dst = os.path.join(out_dir, "model.onnx"), os.path.join(out_dir, "model.int8.onnx")
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    print(f"Quantised {model_id} -> {dst} ({os.path.getsize(src) / 1e6:.0f} MB -> {os.path.getsize(dst) / 1e6:.0f} MB)")
+    return dst
+
+
+def ensure_exported(model_id, quantized=False, root=None):
+    out_dir = model_dir(model_id, root)
+    if not os.path.exists(os.path.join(out_dir, "model.onnx")):
+        export_model(model_id, root)
+    if quantized and not os.path.exists(os.path.join(out_dir, "model.int8.onnx")):
+        quantize_model(model_id, root)
+
+
+# --- RUNTIME ---
+
+class OnnxImageClassifier:
+    """
+    ONNX Runtime stand-in for transformers' image-classification pipeline:
+    same preprocessing (the model's own image processor), same softmax and
+    [{"label", "score"}, ...] output sorted by score, for one image or a list.
+    """
+
+    def __init__(self, model_id, quantized=False, intra_op_threads=None, root=None):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoImageProcessor
+
+        src_dir = model_dir(model_id, root)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or default_threads()
+        # One graph runs at a time per session; parallelism comes from intra-op threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        path = os.path.join(src_dir, "model.int8.onnx" if quantized else "model.onnx")
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.processor = AutoImageProcessor.from_pretrained(src_dir)
+        self.id2label = AutoConfig.from_pretrained(src_dir).id2label
+
+    def __call__(self, images, batch_size=None, top_k=5):
+        import numpy as np
+
+        single = not isinstance(images, list)
+        images = [images] if single else images
+        batch_size = batch_size or len(images) or 1
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            pixels = self.processor(images=chunk, return_tensors="np")["pixel_values"].astype(np.float32)
+            logits = self.session.run(None, {"pixel_values": pixels})[0]
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            outputs.extend(self._top_k(row, top_k) for row in probs)
+        return outputs[0] if single else outputs
+
+    def _top_k(self, probs, top_k):
+        order = probs.argsort()[::-1][:top_k]
+        return [{"label": self.id2label[int(i)], "score": float(probs[i])} for i in order]
+
+
+def load_pipelines(quantized=False, intra_op_threads=None, root=None):
+    """(pipe1, pipe2) for the ensemble, exporting/quantising on first use."""
+    pipes = []
+    for model_id in (MODEL_A_ID, MODEL_B_ID):
+        ensure_exported(model_id, quantized, root)
+        pipes.append(OnnxImageClassifier(model_id, quantized, intra_op_threads, root))
+    return tuple(pipes)
+
+
+# --- PARITY / SPEED / MEMORY COMPARISON ---
+
+def _measure_backend(backend, files, batch_size, threads, queue):
+    # Runs in its own process so load time and peak RSS belong to this backend alone
+    from detector_logic import DeepfakeDetectorLogic, LoadedImage, peak_rss_mb
+
+    started = time.perf_counter()
+    detector = DeepfakeDetectorLogic()
+    detector.onnx_threads = threads
+    if backend == "torch" and threads:
+        import torch
+        torch.set_num_threads(threads)
+    detector.load_models(device=-1, backend=backend)
+    load_s = time.perf_counter() - started
+
+    records, model_s = {}, 0.0
+    for start in range(0, len(files), batch_size):
+        chunk = files[start:start + batch_size]
+        loaded = [LoadedImage.from_source(path) for _, path, _, _ in chunk]
+        images = [img.rgb for img in loaded]
+        if start == 0:
+            detector._run_pipeline(detector.pipe1, images[:1], 1)  # warm-up, not timed
+            detector._run_pipeline(detector.pipe2, images[:1], 1)
+        t0 = time.perf_counter()
+        res1 = detector._run_pipeline(detector.pipe1, images, batch_size)
+        res2 = detector._run_pipeline(detector.pipe2, images, batch_size)
+        model_s += time.perf_counter() - t0
+        for (name, _, label, file_type), img, r1, r2 in zip(chunk, loaded, res1, res2):
+            m1, m2 = detector.model_a_score(r1), detector.model_b_score(r2)
+            verdict = detector._score_image(img, m1, m2, file_type)["verdict"]
+            records[name] = {"label": label, "model_a": m1, "model_b": m2, "verdict": verdict}
+
+    queue.put({
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "images_per_sec": round(len(files) / model_s, 2) if model_s else 0.0,
+        "model_ms_per_image": round(model_s * 1000 / max(1, len(files)), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "records": records,
+    })
+
+
+def compare(backends, limit=None, batch_size=8, threads=None, output=None):
+    from evaluate import collect_files, get_file_type, is_positive
+
+    dataset_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset")
+    files = [(name, path, label, get_file_type(path)) for name, path, label in collect_files(dataset_dir)]
+    files = [entry for entry in files if entry[3].startswith("image")][:limit]
+    if not files:
+        print("No images found in backend/dataset/{real,fake}.")
+        return None
+    threads = threads or default_threads()
+    print(f"--- Comparing {', '.join(backends)} on {len(files)} images ({threads} threads, batch size {batch_size}) ---")
+
+    # Export up front so conversion time is not billed to the first ONNX run
+    for backend in backends:
+        if backend != "torch":
+            for model_id in (MODEL_A_ID, MODEL_B_ID):
+                ensure_exported(model_id, quantized=backend == "onnx-int8")
+
+    ctx = multiprocessing.get_context("spawn")
+    runs = {}
+    for backend in backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_measure_backend, args=(backend, files, batch_size, threads, queue))
+        proc.start()
+        runs[backend] = queue.get()
+        proc.join()
+
+    reference = runs.get("torch")
+    report = {}
+    for backend, run in runs.items():
+        records = run.pop("records")
+        correct = sum(is_positive(r["verdict"]) == (r["label"] == "fake") for r in records.values())
+        entry = dict(run, accuracy=round(correct / len(records), 4))
+        if reference is not None and backend != "torch":
+            ref = reference["records"]
+            diffs_a = [abs(records[n]["model_a"] - ref[n]["model_a"]) for n in records]
+            diffs_b = [abs(records[n]["model_b"] - ref[n]["model_b"]) for n in records]
+            entry["parity"] = {
+                "model_a_max_abs_diff": round(max(diffs_a), 3),
+                "model_a_mean_abs_diff": round(sum(diffs_a) / len(diffs_a), 3),
+                "model_b_max_abs_diff": round(max(diffs_b), 3),
+                "model_b_mean_abs_diff": round(sum(diffs_b) / len(diffs_b), 3),
+                "verdict_agreement": round(sum(records[n]["verdict"] == ref[n]["verdict"] for n in records) / len(records), 4),
+            }
+        report[backend] = entry
+
+    print(f"\n{'backend':<10} {'load s':>7} {'img/s':>8} {'ms/img':>8} {'peak RSS MB':>12} {'accuracy':>9}")
+    for backend, entry in report.items():
+        print(f"{backend:<10} {entry['load_s']:>7.1f} {entry['images_per_sec']:>8.2f} {entry['model_ms_per_image']:>8.1f} "
+              f"{entry['peak_rss_mb']:>12.1f} {entry['accuracy']:>9.2%}")
+    for backend, entry in report.items():
+        if "parity" in entry:
+            p = entry["parity"]
+            print(f"{backend} vs torch: model A |diff| max {p['model_a_max_abs_diff']:.2f} / mean {p['model_a_mean_abs_diff']:.2f} pts, "
+                  f"model B max {p['model_b_max_abs_diff']:.2f} / mean {p['model_b_mean_abs_diff']:.2f} pts, "
+                  f"verdict agreement {p['verdict_agreement']:.2%}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"images": len(files), "threads": threads, "batch_size": batch_size, "backends": report}, f, indent=2)
+        print(f"\nResults saved to: {output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Runtime backend for the detector ensemble: export, quantise, compare")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="export both ensemble models to ONNX")
+    export.add_argument("--int8", action="store_true", help="also write the dynamic int8 quantised graphs")
+
+    cmp_parser = sub.add_parser("compare", help="parity, speed and peak RSS per backend on backend/dataset")
+    cmp_parser.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated subset of " + ",".join(BACKENDS))
+    cmp_parser.add_argument("--limit", type=int, help="only the first N images")
+    cmp_parser.add_argument("--batch-size", type=int, default=8)
+    cmp_parser.add_argument("--threads", type=int, help="intra-op threads (default: all available cores)")
+    cmp_parser.add_argument("--output", help="machine-readable results (JSON)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for model_id in (MODEL_A_ID, MODEL_B_ID):
+            export_model(model_id)
+            if args.int8:
+                quantize_model(model_id)
+    else:
+        compare([b for b in args.backends.split(",") if b], args.limit, args.batch_size, args.threads, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+import argparse
+import copy
+import functools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Hamming distance (out of 64 bits) up to which two pHashes count as the same picture.
+# Resizing and JPEG recompression typically move a pHash by 0-4 bits; the limit stays at
+# the tight end of that range because a match replays the stored verdict without inference.
+PHASH_MAX_DISTANCE = 4
+
+# Only verdicts on this side are indexed (and so replayed): a reposted fake stays fake,
+# but a "real" verdict must not carry over to an edited copy of the same photo.
+KNOWN_FAKE_VERDICTS = ("AI Generated", "Suspicious / Unverified")
+
+# Multi-index hashing: the 64-bit hash is split into 4 substrings of 16 bits
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+_POPCOUNT8 = None
+
+
+def _popcount(values):
+    global _POPCOUNT8
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    if _POPCOUNT8 is None:
+        _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+@functools.lru_cache(maxsize=None)
+def _dct_matrix(n):
+    import numpy as np
+
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _gray_thumbnail(image, size):
+    # image: PIL image, or a grayscale uint8 array (LoadedImage.gray)
+    import numpy as np
+    from PIL import Image
+
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    # reducing_gap shrinks large inputs by integer factors first: much faster, same thumbnail quality
+    return np.asarray(image.convert("L").resize(size, Image.LANCZOS, reducing_gap=3.0), dtype=np.float64)
+
+
+def phash(image):
+    """
+    64-bit DCT perceptual hash: 32x32 grayscale thumbnail -> 2D DCT -> lowest 8x8
+    frequencies, each bit set when the coefficient is above their median.
+    Survives resizing, recompression and mild colour changes.
+    """
+    import numpy as np
+
+    dct = _dct_matrix(32)
+    pixels = _gray_thumbnail(image, (32, 32))
+    low = (dct @ pixels @ dct.T)[:8, :8].ravel()
+    # The DC term only measures overall brightness: leave it out of the median
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def dhash(image):
+    """64-bit gradient hash (9x8 thumbnail, each bit = left pixel brighter than its right neighbour)."""
+    import numpy as np
+
+    pixels = _gray_thumbnail(image, (9, 8))
+    bits = pixels[:, :-1] > pixels[:, 1:]
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _probe_masks(radius):
+    # Every CHUNK_BITS-bit value with at most `radius` bits set
+    import numpy as np
+
+    values = np.arange(1 << CHUNK_BITS, dtype=np.uint64)
+    return values[_popcount(values) <= radius].astype(np.int64)
+
+
+class PhashIndex:
+    """
+    Near-duplicate index: pHash -> earlier fake verdict, searchable by Hamming distance.
+
+    Lookup uses multi-index hashing. If two 64-bit hashes are within distance r,
+    at least one of their 4 16-bit substrings is within r // 4 of the other's
+    (pigeonhole), so probing each substring table for values that close finds
+    every true match, and only those candidates get a full popcount. Each table is
+    a row order sorted by substring value plus 65,537 offsets (CSR layout), so a
+    probe is two array reads; with uniformly spread hashes a bucket holds n / 65,536
+    rows, i.e. ~15 at a million entries.
+
+    Inserts go to a small unsorted delta that lookups scan linearly; compact()
+    (run automatically once the delta reaches `delta_limit`) merges it into the
+    sorted tables, and drops entries past `ttl_seconds` or beyond `max_items`
+    (oldest first). Like VerdictCache, entries are tied to the detector version.
+    """
+
+    def __init__(self, version, path=None, max_distance=PHASH_MAX_DISTANCE, max_items=5_000_000,
+                 ttl_seconds=30 * 24 * 3600, delta_limit=4096):
+        import numpy as np
+
+        self.version = version
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.delta_limit = delta_limit
+
+        self._lock = threading.Lock()
+        self._masks = {}
+        self.counters = {"hits": 0, "misses": 0, "inserts": 0, "compactions": 0, "evictions": 0}
+
+        # Compacted part: parallel arrays ordered by id, plus one (order, offsets) table per substring
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._created = np.empty(0, dtype=np.float64)
+        self._tables = []
+        # Delta: preallocated, filled up to _delta_size
+        self._delta_hashes = np.empty(delta_limit, dtype=np.uint64)
+        self._delta_ids = np.empty(delta_limit, dtype=np.int64)
+        self._delta_created = np.empty(delta_limit, dtype=np.float64)
+        self._delta_size = 0
+
+        self._results = {}  # id -> result, when there is no database
+        self._next_id = 1
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS phashes ("
+                " id INTEGER PRIMARY KEY, hash INTEGER, digest TEXT, version TEXT, result TEXT, created REAL)"
+            )
+            cur = self._db.execute("DELETE FROM phashes WHERE version != ?", (version,))
+            self.counters["evictions"] += cur.rowcount
+            self._db.commit()
+            rows = self._db.execute("SELECT id, hash, created FROM phashes ORDER BY id").fetchall()
+            if rows:
+                ids, hashes, created = zip(*rows)
+                self._ids = np.array(ids, dtype=np.int64)
+                self._hashes = np.array(hashes, dtype=np.int64).view(np.uint64)
+                self._created = np.array(created, dtype=np.float64)
+                self._next_id = int(self._ids[-1]) + 1
+        self.compact()
+
+    def lookup(self, value, max_distance=None):
+        """(distance, entry id) of the closest indexed hash within max_distance, or None."""
+        import numpy as np
+
+        max_distance = self.max_distance if max_distance is None else max_distance
+        query = np.uint64(value)
+        with self._lock:
+            best = None
+            rows = self._candidates(value, max_distance)
+            if len(rows):
+                distances = _popcount(self._hashes[rows] ^ query)
+                k = int(np.argmin(distances))
+                if distances[k] <= max_distance:
+                    best = (int(distances[k]), int(self._ids[rows[k]]))
+            if self._delta_size:
+                distances = _popcount(self._delta_hashes[:self._delta_size] ^ query)
+                k = int(np.argmin(distances))
+                if distances[k] <= max_distance and (best is None or distances[k] < best[0]):
+                    best = (int(distances[k]), int(self._delta_ids[k]))
+            return best
+
+    def get(self, value):
+        """
+        The stored result of the closest known fake, marked with
+        "near_duplicate": {"distance", "sha256"}, or None.
+        """
+        match = self.lookup(value)
+        with self._lock:
+            entry = self._entry(match[1]) if match is not None else None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+        digest, result = entry
+        result["near_duplicate"] = {"distance": match[0], "sha256": digest}
+        return result
+
+    def add(self, value, digest, result):
+        """Indexes a finished analysis; only successful results with a KNOWN_FAKE_VERDICTS verdict are kept."""
+        if result.get("status") != "success" or result.get("verdict") not in KNOWN_FAKE_VERDICTS:
+            return
+        result = copy.deepcopy(result)
+        for transient in ("timings", "peak_rss_mb", "cached", "near_duplicate"):
+            result.pop(transient, None)
+        now = time.time()
+        with self._lock:
+            if self._db is not None:
+                cur = self._db.execute(
+                    "INSERT INTO phashes (hash, digest, version, result, created) VALUES (?, ?, ?, ?, ?)",
+                    (_to_signed(value), digest, self.version, json.dumps(result), now),
+                )
+                self._db.commit()
+                entry_id = cur.lastrowid
+            else:
+                entry_id = self._next_id
+                self._results[entry_id] = (digest, result)
+            self._next_id = entry_id + 1
+            n = self._delta_size
+            self._delta_hashes[n], self._delta_ids[n], self._delta_created[n] = value, entry_id, now
+            self._delta_size += 1
+            self.counters["inserts"] += 1
+            full = self._delta_size >= self.delta_limit
+        if full:
+            self.compact()
+
+    def compact(self):
+        """Merges the delta into the sorted tables and evicts expired / excess entries."""
+        import numpy as np
+
+        with self._lock:
+            n = self._delta_size
+            hashes = np.concatenate([self._hashes, self._delta_hashes[:n]])
+            ids = np.concatenate([self._ids, self._delta_ids[:n]])
+            created = np.concatenate([self._created, self._delta_created[:n]])
+            self._delta_size = 0
+
+            # ids grow with insertion time, so "oldest" is simply the front of the arrays
+            keep = created >= time.time() - self.ttl_seconds
+            if keep.sum() > self.max_items:
+                keep[:len(keep) - self.max_items] = False
+            if not keep.all():
+                dropped = ids[~keep]
+                if self._db is not None:
+                    self._db.executemany("DELETE FROM phashes WHERE id = ?", ((int(i),) for i in dropped))
+                    self._db.commit()
+                else:
+                    for entry_id in dropped:
+                        self._results.pop(int(entry_id), None)
+                self.counters["evictions"] += len(dropped)
+                hashes, ids, created = hashes[keep], ids[keep], created[keep]
+
+            self._hashes, self._ids, self._created = hashes, ids, created
+            row_type = np.int32 if len(hashes) < 2 ** 31 else np.int64
+            self._tables = []
+            for j in range(CHUNKS):
+                values = ((hashes >> np.uint64(j * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.int64)
+                order = np.argsort(values, kind="stable").astype(row_type)
+                offsets = np.zeros((1 << CHUNK_BITS) + 1, dtype=np.int64)
+                np.cumsum(np.bincount(values, minlength=1 << CHUNK_BITS), out=offsets[1:])
+                self._tables.append((order, offsets))
+            self.counters["compactions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["items"] = len(self._hashes) + self._delta_size
+            stats["delta_items"] = self._delta_size
+            return stats
+
+    def __len__(self):
+        return len(self._hashes) + self._delta_size
+
+    def _candidates(self, value, max_distance):
+        # Rows of the compacted part that share a near-enough substring with `value`
+        import numpy as np
+
+        if not len(self._hashes):
+            return np.empty(0, dtype=np.int64)
+        radius = max_distance // CHUNKS
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = self._masks[radius] = _probe_masks(radius)
+        found = []
+        for j, (order, offsets) in enumerate(self._tables):
+            probes = ((value >> (j * CHUNK_BITS)) & CHUNK_MASK) ^ masks
+            starts, ends = offsets[probes], offsets[probes + 1]
+            lengths = ends - starts
+            total = int(lengths.sum())
+            if total:
+                # Concatenated [start, end) ranges without a Python loop
+                shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                found.append(order[np.arange(total) + shifts])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def _entry(self, entry_id):
+        if self._db is None:
+            entry = self._results.get(entry_id)
+            return (entry[0], copy.deepcopy(entry[1])) if entry is not None else None
+        row = self._db.execute("SELECT digest, result FROM phashes WHERE id = ?", (entry_id,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+
+# --- CLI: build from a folder of images, benchmark ---
+
+def build(folder, path, max_distance, backend="torch", cascade=False):
+    """
+    Analyses every image under `folder` (analyze_local_file) and indexes the known fakes.
+    backend / cascade must match the workers that will open the index: it is keyed with
+    the same cache_version(), and entries under any other version are purged on open.
+    """
+    try:
+        from detector_logic import DeepfakeDetectorLogic, LoadedImage, cache_version
+        from verdict_cache import sha256_file
+    except ImportError:
+        from backend.detector_logic import DeepfakeDetectorLogic, LoadedImage, cache_version
+        from backend.verdict_cache import sha256_file
+
+    detector = DeepfakeDetectorLogic()
+    detector.cascade = cascade
+    detector.load_models(backend=backend)
+    index = PhashIndex(cache_version(detector.inference_backend, cascade), path=path, max_distance=max_distance)
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+                continue
+            file_path = os.path.join(root, name)
+            # Decode once: the hash and the analysis read the same pixels
+            loaded = LoadedImage.from_source(file_path)
+            result = detector.analyze_local_file(loaded, "image")
+            index.add(phash(loaded.gray), sha256_file(file_path), result)
+            print(f"{file_path}: {result.get('verdict')}")
+    index.compact()
+    print(json.dumps(index.stats()))
+
+
+def bench(entries, queries, max_distance, brute_force_checks=200, seed=0):
+    """
+    Lookup latency at `entries` random hashes, for queries near an indexed hash
+    (up to max_distance bits flipped) and for misses, plus recall against brute force.
+    Uniform random hashes are the friendly case for substring buckets; real pHashes
+    cluster somewhat, so treat the numbers as a lower bound.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    index = PhashIndex("bench", max_distance=max_distance, delta_limit=max(4096, entries + 1))
+    hashes = rng.integers(0, 2 ** 64, size=entries, dtype=np.uint64)
+
+    started = time.perf_counter()
+    with index._lock:
+        index._delta_hashes[:entries] = hashes
+        index._delta_ids[:entries] = np.arange(1, entries + 1)
+        index._delta_created[:entries] = time.time()
+        index._delta_size = entries
+    index.compact()
+    compact_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for value in rng.integers(0, 2 ** 64, size=1000, dtype=np.uint64):
+        index.add(int(value), "bench", {"status": "success", "verdict": "AI Generated"})
+    insert_us = (time.perf_counter() - started) * 1e6 / 1000
+
+    def near(value):
+        for bit in rng.choice(64, size=rng.integers(0, max_distance + 1), replace=False):
+            value ^= 1 << int(bit)
+        return value
+
+    targets = [int(h) for h in rng.choice(hashes, size=queries)]
+    near_queries = [near(h) for h in targets]
+    miss_queries = [int(v) for v in rng.integers(0, 2 ** 64, size=queries, dtype=np.uint64)]
+
+    report = {"entries": len(index), "max_distance": max_distance, "compact_s": round(compact_s, 3),
+              "insert_us": round(insert_us, 2)}
+    for label, batch in (("near", near_queries), ("miss", miss_queries)):
+        latencies, found = [], 0
+        for value in batch:
+            started = time.perf_counter()
+            match = index.lookup(value)
+            latencies.append((time.perf_counter() - started) * 1e6)
+            found += match is not None
+        latencies.sort()
+        report[label] = {"found": found, "queries": len(batch),
+                         "p50_us": round(latencies[len(latencies) // 2], 1),
+                         "p99_us": round(latencies[int(len(latencies) * 0.99)], 1)}
+
+    # Exactness: multi-index search must find whatever a full scan finds
+    disagreements = 0
+    all_hashes = np.concatenate([index._hashes, index._delta_hashes[:index._delta_size]])
+    for value in near_queries[:brute_force_checks]:
+        nearest = int(_popcount(all_hashes ^ np.uint64(value)).min())
+        match = index.lookup(value)
+        if (match[0] if match else None) != (nearest if nearest <= max_distance else None):
+            disagreements += 1
+    report["brute_force_disagreements"] = disagreements
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perceptual-hash near-duplicate index: build, benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="analyse a folder of images and index the known fakes")
+    build_parser.add_argument("folder")
+    build_parser.add_argument("--path", default=os.getenv("PHASH_INDEX_PATH", "/tmp/phash_index.sqlite3"))
+    build_parser.add_argument("--max-distance", type=int, default=PHASH_MAX_DISTANCE)
+    # Defaults follow the worker's own settings (worker.py), so the index's version key matches
+    build_parser.add_argument("--backend", default=os.getenv("INFERENCE_BACKEND", "torch"),
+                              choices=["torch", "onnx", "onnx-int8"])
+    build_parser.add_argument("--cascade", action="store_true", default=os.getenv("CASCADE", "0") == "1")
+
+    bench_parser = sub.add_parser("bench", help="lookup latency and exactness at N synthetic entries")
+    bench_parser.add_argument("--entries", type=int, default=1_000_000)
+    bench_parser.add_argument("--queries", type=int, default=2000)
+    bench_parser.add_argument("--max-distance", type=int, default=PHASH_MAX_DISTANCE)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.folder, args.path, args.max_distance, backend=args.backend, cascade=args.cascade)
+    else:
+        json.dump(bench(args.entries, args.queries, args.max_distance), sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import glob
+import os
+import time
+
+import numpy as np
+
+try:
+    from detector_logic import CAMERA_TAGS, SPECTRUM_RADIAL_BINS, VERDICTS
+except ImportError:
+    from backend.detector_logic import CAMERA_TAGS, SPECTRUM_RADIAL_BINS, VERDICTS
+
+# Rows buffered in memory before a chunk file is written
+CHUNK_ROWS = 4096
+
+LABELS = {"real": 0, "fake": 1}
+
+COLUMNS = ("sha256", "label", "verdict", "model_a", "model_b", "has_camera_data", "camera_tags",
+           "spectral_energy", "radial_profile")
+
+
+def _float(value):
+    return np.nan if value is None else float(value)
+
+
+class SignalStore:
+    """
+    Columnar, append-only store of the detector's raw per-image signals, keyed by file SHA-256.
+
+    Each flush writes one compressed NumPy chunk (signals-*.npz) under `path`, atomically,
+    so a crashed run loses at most the unflushed rows. load() concatenates the chunks into
+    one array per column, which score_signals() re-scores in a single vectorised pass:
+    threshold sweeps need neither the models nor the images.
+
+    Columns: sha256 (S64), label (1 fake / 0 real / -1 unknown), verdict (index into VERDICTS,
+    as recorded), model_a / model_b (NaN when a model did not run), has_camera_data,
+    camera_tags (bitmask over CAMERA_TAGS), spectral_energy (NaN if the FFT failed) and
+    radial_profile (SPECTRUM_RADIAL_BINS floats per row, NaN if not recorded).
+    """
+
+    def __init__(self, path, version=None, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.version = version or ""
+        self.chunk_rows = chunk_rows
+        self._rows = []
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, sha256, label, result):
+        """Buffers one analysis result; anything without signals (errors, videos) is skipped."""
+        signals = result.get("signals")
+        if result.get("status") != "success" or not signals:
+            return False
+        tags = 0
+        for bit, tag in enumerate(CAMERA_TAGS):
+            if tag in signals.get("camera_tags", ()):
+                tags |= 1 << bit
+        profile = signals.get("radial_profile")
+        self._rows.append((
+            sha256,
+            LABELS.get(label, -1),
+            VERDICTS.index(result["verdict"]) if result.get("verdict") in VERDICTS else -1,
+            _float(signals.get("model_a")),
+            _float(signals.get("model_b")),
+            bool(signals.get("has_camera_data")),
+            tags,
+            _float(signals.get("spectral_energy")),
+            profile if profile is not None else [np.nan] * SPECTRUM_RADIAL_BINS,
+        ))
+        if len(self._rows) >= self.chunk_rows:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = list(zip(*self._rows))
+        arrays = {
+            "sha256": np.array(columns[0], dtype="S64"),
+            "label": np.array(columns[1], dtype=np.int8),
+            "verdict": np.array(columns[2], dtype=np.int8),
+            "model_a": np.array(columns[3], dtype=np.float64),
+            "model_b": np.array(columns[4], dtype=np.float64),
+            "has_camera_data": np.array(columns[5], dtype=bool),
+            "camera_tags": np.array(columns[6], dtype=np.uint8),
+            "spectral_energy": np.array(columns[7], dtype=np.float64),
+            "radial_profile": np.array(columns[8], dtype=np.float32).reshape(len(self._rows), SPECTRUM_RADIAL_BINS),
+        }
+        name = os.path.join(self.path, f"signals-{time.time_ns()}-{os.getpid()}.npz")
+        tmp = name + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, version=np.array(self.version), **arrays)
+        os.replace(tmp, name)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+    @staticmethod
+    def chunks(path):
+        # Oldest first: the file names start with the write time
+        return sorted(glob.glob(os.path.join(path, "signals-*.npz")))
+
+    @classmethod
+    def clear(cls, path):
+        for name in cls.chunks(path):
+            os.remove(name)
+
+    @classmethod
+    def load(cls, path, version=None):
+        """
+        All rows under `path` as {column: array}, one row per SHA-256 (the latest write wins).
+        version: only chunks written under this detector version (default: all of them).
+        """
+        parts = {column: [] for column in COLUMNS}
+        for name in cls.chunks(path):
+            with np.load(name) as chunk:
+                if version is not None and str(chunk["version"]) != version:
+                    continue
+                for column in COLUMNS:
+                    parts[column].append(chunk[column])
+        if not parts["sha256"]:
+            return None
+        data = {column: np.concatenate(arrays) for column, arrays in parts.items()}
+        # Keep each hash's last occurrence: np.unique returns first indices, so search the reversed rows
+        _, first = np.unique(data["sha256"][::-1], return_index=True)
+        keep = np.sort(len(data["sha256"]) - 1 - first)
+        return {column: values[keep] for column, values in data.items()}
@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+try:
+    from admission import AdmissionController, Rejected
+except ImportError:
+    from backend.admission import AdmissionController, Rejected
+
+
+class SlowWorker:
+    """Stands in for the dispatcher: every analysis takes `delay` seconds, optionally failing."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.finished = []
+
+    async def analyze(self, name, fail=False):
+        await asyncio.sleep(self.delay)
+        if fail:
+            raise RuntimeError(f"{name} failed")
+        self.finished.append(name)
+        return name
+
+
+async def run(controller, worker, lane, name, fail=False):
+    controller.admit(lane)
+    async with controller.slot(lane):
+        return await worker.analyze(name, fail)
+
+
+def test_interactive_overtakes_queued_bulk():
+    async def scenario():
+        controller = AdmissionController(slots=1, rate=0, deadlines={"interactive": 10, "bulk": 10})
+        worker = SlowWorker(0.02)
+        tasks = [asyncio.create_task(run(controller, worker, "bulk", f"bulk-{i}")) for i in range(4)]
+        await asyncio.sleep(0.005)  # bulk-0 holds the slot, the rest are queued
+        tasks.append(asyncio.create_task(run(controller, worker, "interactive", "interactive")))
+        await asyncio.gather(*tasks)
+        return worker.finished
+
+    finished = asyncio.run(scenario())
+    assert finished[:2] == ["bulk-0", "interactive"]
+    assert finished[2:] == ["bulk-1", "bulk-2", "bulk-3"]
+
+
+def test_client_over_rate_gets_429_with_retry_after():
+    now = [0.0]
+    controller = AdmissionController(slots=4, rate=1, burst=2, clock=lambda: now[0])
+    controller.admit("interactive", "1.2.3.4")
+    controller.admit("interactive", "1.2.3.4")
+    with pytest.raises(Rejected) as info:
+        controller.admit("interactive", "1.2.3.4")
+    assert info.value.status_code == 429
+    assert info.value.reason == "rate_limited"
+    assert info.value.retry_after == 1
+    # Other clients keep their own bucket, and the token comes back after Retry-After
+    controller.admit("interactive", "5.6.7.8")
+    now[0] += 1.0
+    controller.admit("interactive", "1.2.3.4")
+
+
+def test_http_429_carries_retry_after_header(monkeypatch):
+    from fastapi.testclient import TestClient
+    try:
+        import main
+    except ImportError:
+        from backend import main
+
+    class Dispatcher:
+        async def start(self):
+            pass
+
+        async def analyze(self, read_url, file_type):
+            await asyncio.sleep(0.01)
+            return {"status": "success", "verdict": "Likely Real"}
+
+    monkeypatch.setattr(main, "presign_read_url", lambda key: f"http://files/{key}")
+    main.app.state.dispatcher = Dispatcher()
+    main.app.state.admission = AdmissionController(slots=4, rate=0.5, burst=1)
+    try:
+        with TestClient(main.app) as client:
+            body = {"file_key": "uploads/a.jpg", "file_type": "image/jpeg"}
+            assert client.post("/analyze", json=body).status_code == 200
+            response = client.post("/analyze", json=body)
+    finally:
+        main.app.state.dispatcher = main.app.state.admission = None
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_request_that_would_miss_its_deadline_is_shed():
+    async def scenario():
+        controller = AdmissionController(slots=1, rate=0, deadlines={"interactive": 1})
+        controller.service_s = 5.0  # every analysis is known to take ~5s
+        worker = SlowWorker(0.05)
+        running = asyncio.create_task(run(controller, worker, "interactive", "first"))
+        await asyncio.sleep(0.005)
+        with pytest.raises(Rejected) as info:
+            controller.admit("interactive")
+        await running
+        return info.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.reason == "deadline"
+    assert rejected.retry_after >= 5
+
+
+def test_request_still_queued_at_its_deadline_expires():
+    async def scenario():
+        controller = AdmissionController(slots=1, rate=0, deadlines={"interactive": 0.05})
+        controller.service_s = 0.0  # the estimate lets it in; the slow worker then makes it wait too long
+        worker = SlowWorker(0.2)
+        running = asyncio.create_task(run(controller, worker, "interactive", "first"))
+        await asyncio.sleep(0.005)
+        with pytest.raises(Rejected) as info:
+            await run(controller, worker, "interactive", "second")
+        await running
+        return controller, info.value
+
+    controller, rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.reason == "expired"
+    assert controller.queue_depths()["interactive"] == 0
+    assert controller.running == 0
+
+
+def test_slots_are_released_when_work_fails_or_is_cancelled():
+    async def scenario():
+        controller = AdmissionController(slots=2, rate=0, deadlines={"interactive": 10})
+        worker = SlowWorker(0.01)
+        results = await asyncio.gather(
+            *[run(controller, worker, "interactive", f"job-{i}", fail=i % 2 == 0) for i in range(6)],
+            return_exceptions=True,
+        )
+        assert sum(isinstance(r, RuntimeError) for r in results) == 3
+        assert controller.running == 0
+
+        # A client that goes away while queued gives its place back too
+        holder = asyncio.create_task(run(controller, SlowWorker(0.05), "interactive", "holder"))
+        other = asyncio.create_task(run(controller, SlowWorker(0.05), "interactive", "other"))
+        queued = asyncio.create_task(run(controller, worker, "interactive", "queued"))
+        await asyncio.sleep(0.005)
+        queued.cancel()
+        await asyncio.gather(holder, other, queued, return_exceptions=True)
+        assert controller.running == 0
+        assert controller.queue_depths()["interactive"] == 0
+        # Both slots are free again
+        return await asyncio.gather(run(controller, worker, "interactive", "a"), run(controller, worker, "interactive", "b"))
+
+    assert asyncio.run(scenario()) == ["a", "b"]
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+try:
+    import main
+    from dispatch import LocalDispatcher
+except ImportError:
+    from backend import main
+    from backend.dispatch import LocalDispatcher
+
+
+class FakeWorker:
+    """DetectorWorker stand-in for LocalDispatcher: no models, same result and event contract."""
+
+    batcher = object()  # "started": LocalDispatcher skips start_worker()
+
+    def __init__(self):
+        self.seen = []
+
+    async def analyze_url(self, file_url, file_type):
+        self.seen.append(file_url)
+        await asyncio.sleep(0.01)
+        if file_url.endswith("corrupt.jpg"):
+            return {"status": "error", "message": "Could not decode image"}
+        return {"status": "success", "verdict": "Likely Real", "score": 90, "details": []}
+
+    async def analyze_url_events(self, file_url, file_type):
+        for stage in ("downloaded", "models"):
+            await asyncio.sleep(0.01)
+            yield {"event": "stage", "stage": stage}
+        yield {"event": "result", "result": await self.analyze_url(file_url, file_type)}
+
+
+def presign(file_key):
+    if file_key.startswith("missing/"):
+        raise RuntimeError("NoSuchKey")
+    return f"http://files/{file_key}"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    worker = FakeWorker()
+    monkeypatch.setattr(main, "presign_read_url", presign)
+    main.app.state.dispatcher = LocalDispatcher(worker)
+    try:
+        with TestClient(main.app) as client:
+            client.worker = worker
+            yield client
+    finally:
+        main.app.state.dispatcher = main.app.state.admission = main.app.state.jobs = None
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append({"id": int(fields["id"]), "event": fields["event"], "data": json.loads(fields["data"])})
+    return events
+
+
+def test_job_streams_stages_then_the_result(client):
+    body = {"file_key": "uploads/a.jpg", "file_type": "image/jpeg"}
+    submitted = client.post("/jobs", json=body)
+    assert submitted.status_code == 202
+    job = submitted.json()
+    assert job["events_url"] == f"/jobs/{job['job_id']}/events"
+
+    events = parse_sse(client.get(job["events_url"]).text)
+    assert [e["event"] for e in events] == ["stage", "stage", "stage", "result"]
+    assert [e["data"]["stage"] for e in events[:3]] == ["queued", "downloaded", "models"]
+    assert events[-1]["data"]["verdict"] == "Likely Real"
+    assert client.worker.seen == ["http://files/uploads/a.jpg"]
+
+    polled = client.get(job["status_url"]).json()
+    assert polled["status"] == "done"
+    assert polled["result"]["verdict"] == "Likely Real"
+
+    # A reconnecting EventSource resumes after the last id it saw
+    resumed = parse_sse(client.get(job["events_url"], headers={"Last-Event-ID": str(events[2]["id"])}).text)
+    assert [e["event"] for e in resumed] == ["result"]
+
+
+def test_failed_analysis_ends_the_job_in_error(client):
+    job = client.post("/jobs", json={"file_key": "uploads/corrupt.jpg", "file_type": "image/jpeg"}).json()
+    events = parse_sse(client.get(job["events_url"]).text)
+    assert events[-1]["event"] == "result"
+    assert events[-1]["data"]["status"] == "error"
+    assert client.get(job["status_url"]).json()["status"] == "error"
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.get("/jobs/nope/events").status_code == 404
+
+
+def test_analyze_batch_streams_one_line_per_item(client):
+    keys = ["uploads/a.jpg", "missing/b.jpg", "uploads/corrupt.jpg", "uploads/d.jpg"]
+    items = [{"file_key": key, "file_type": "image/jpeg"} for key in keys]
+    response = client.post("/analyze-batch", json={"items": items})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"done": True, "items": 4, "errors": 2}
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[0]["result"]["verdict"] == "Likely Real"
+    assert by_index[1]["result"]["message"].startswith("Presign failed")
+    assert by_index[2]["result"]["status"] == "error"
+    assert by_index[3]["file_key"] == "uploads/d.jpg"
+    # The item that failed to presign never reached the worker
+    assert sorted(client.worker.seen) == ["http://files/uploads/a.jpg", "http://files/uploads/corrupt.jpg",
+                                          "http://files/uploads/d.jpg"]
+
+
+def test_analyze_batch_rejects_empty_and_oversized_requests(client):
+    assert client.post("/analyze-batch", json={"items": []}).status_code == 422
+    items = [{"file_key": f"uploads/{i}.jpg", "file_type": "image/jpeg"} for i in range(main.MAX_BATCH_ITEMS + 1)]
+    assert client.post("/analyze-batch", json={"items": items}).status_code == 413
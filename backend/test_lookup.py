@@ -0,0 +1,96 @@
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+try:
+    import main
+    from verdict_cache import VerdictCache
+except ImportError:
+    from backend import main
+    from backend.verdict_cache import VerdictCache
+
+DIGEST = hashlib.sha256(b"known upload").hexdigest()
+
+
+class Dispatcher:
+    """Worker stand-in: reports the digest of the bytes it "read", as the real worker does."""
+
+    async def start(self):
+        pass
+
+    async def analyze(self, read_url, file_type):
+        return {"status": "success", "verdict": "AI Generated", "score": 12, "details": [], "sha256": DIGEST,
+                "timings": {"total_ms": 900.0}}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "results.sqlite3")
+
+
+def make_client(store_path, monkeypatch):
+    monkeypatch.setattr(main, "presign_read_url", lambda key: f"http://files/{key}")
+    main.app.state.dispatcher = Dispatcher()
+    main.app.state.results = VerdictCache("test-version", path=store_path)
+    return TestClient(main.app)
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    yield
+    main.app.state.dispatcher = main.app.state.admission = main.app.state.results = None
+
+
+def test_lookup_miss_then_hit_after_analysis(store_path, monkeypatch):
+    with make_client(store_path, monkeypatch) as client:
+        assert client.get(f"/lookup/{DIGEST}").status_code == 404
+        analyzed = client.post("/analyze", json={"file_key": "uploads/a.jpg", "file_type": "image/jpeg"})
+        assert analyzed.status_code == 200
+
+        hit = client.get(f"/lookup/{DIGEST.upper()}")
+        assert hit.status_code == 200
+        result = hit.json()
+        assert result["verdict"] == "AI Generated"
+        assert result["cached"] is True
+        # Timings describe the original analysis, not this lookup
+        assert "timings" not in result
+
+
+def test_lookup_survives_a_restart(store_path, monkeypatch):
+    with make_client(store_path, monkeypatch) as client:
+        client.post("/analyze", json={"file_key": "uploads/a.jpg", "file_type": "image/jpeg"})
+    main.app.state.results = None
+    with make_client(store_path, monkeypatch) as client:
+        assert client.get(f"/lookup/{DIGEST}").json()["verdict"] == "AI Generated"
+
+
+def test_failed_analyses_are_not_stored(store_path, monkeypatch):
+    class Failing(Dispatcher):
+        async def analyze(self, read_url, file_type):
+            return {"status": "error", "message": "Download failed", "sha256": DIGEST}
+
+    with make_client(store_path, monkeypatch) as client:
+        main.app.state.dispatcher = Failing()
+        client.post("/analyze", json={"file_key": "uploads/a.jpg", "file_type": "image/jpeg"})
+        assert client.get(f"/lookup/{DIGEST}").status_code == 404
+
+
+def test_lookup_rejects_malformed_digests(store_path, monkeypatch):
+    with make_client(store_path, monkeypatch) as client:
+        assert client.get("/lookup/not-a-digest").status_code == 422
+        assert client.get(f"/lookup/{DIGEST[:-1]}").status_code == 422
+
+
+def test_result_store_uses_the_workers_version_key(monkeypatch):
+    try:
+        from detector_logic import cache_version
+    except ImportError:
+        from backend.detector_logic import cache_version
+
+    monkeypatch.setattr(main, "INFERENCE_BACKEND", "onnx-int8")
+    monkeypatch.setattr(main, "CASCADE", True)
+    main.app.state.dispatcher = Dispatcher()
+    with TestClient(main.app):
+        assert main.app.state.results.version == cache_version("onnx-int8", True)
+        assert main.app.state.results.version.endswith("+onnx-int8+cascade")
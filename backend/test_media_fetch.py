@@ -0,0 +1,161 @@
+import hashlib
+import http.server
+import io
+import os
+import re
+import struct
+import threading
+import zlib
+
+import pytest
+
+try:
+    from media_fetch import FetchCancelled, MediaFetcher, MediaTooLarge
+except ImportError:
+    from backend.media_fetch import FetchCancelled, MediaFetcher, MediaTooLarge
+
+
+def png_header(width, height):
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    return b"\x89PNG\r\n\x1a\n" + chunk
+
+
+def webp_with_exif_at_end():
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (256, 256), os.urandom(256 * 256 * 3))
+    exif = Image.Exif()
+    exif[271] = "Canon"
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+FILES = {
+    "/small.bin": os.urandom(10_000),
+    "/large.bin": os.urandom(300_000),
+    "/image.png": png_header(640, 480) + os.urandom(200_000),
+    "/image.webp": webp_with_exif_at_end(),
+}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves FILES with Range support; paths under /stream/ are sent without a Content-Length."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path
+        streamed = path.startswith("/stream/")
+        if streamed:
+            path = path[len("/stream"):]
+        data = FILES.get(path)
+        if data is None:
+            self.send_error(404)
+            return
+        byte_range = self.headers.get("Range")
+        if byte_range:
+            start, end = re.match(r"bytes=(\d*)-(\d+)", byte_range).groups()
+            if not start:  # suffix range: the last `end` bytes
+                start, end = max(0, len(data) - int(end)), len(data) - 1
+            end = min(int(end), len(data) - 1)
+            body = data[int(start):end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        self.server.requests.append((self.path, byte_range))
+        if not streamed:
+            self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}", httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = MediaFetcher(spill_bytes=100_000, chunk_size=16 * 1024, tmp_dir=str(tmp_path))
+    yield fetcher
+    fetcher.close()
+
+
+def test_small_download_stays_in_memory(server, fetcher, tmp_path):
+    base, _ = server
+    with fetcher.fetch(f"{base}/small.bin") as media:
+        assert media.data == FILES["/small.bin"]
+        assert media.path is None
+        assert media.size == 10_000
+        assert media.sha256 == hashlib.sha256(FILES["/small.bin"]).hexdigest()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("prefix", ["", "/stream"])
+def test_large_download_spills_to_disk(server, fetcher, tmp_path, prefix):
+    # With a Content-Length the spill is decided up front; without one, mid-stream
+    base, _ = server
+    media = fetcher.fetch(f"{base}{prefix}/large.bin")
+    assert media.data is None
+    assert os.path.dirname(media.path) == str(tmp_path)
+    with open(media.path, "rb") as f:
+        assert f.read() == FILES["/large.bin"]
+    assert media.sha256 == hashlib.sha256(FILES["/large.bin"]).hexdigest()
+    media.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_to_file_always_gives_a_path(server, fetcher):
+    base, _ = server
+    with fetcher.fetch(f"{base}/small.bin", to_file=True) as media:
+        assert media.source == media.path
+        assert os.path.getsize(media.path) == 10_000
+
+
+@pytest.mark.parametrize("prefix", ["", "/stream"])
+def test_size_limit_refuses_the_download_and_leaves_no_file(server, fetcher, tmp_path, prefix):
+    base, _ = server
+    with pytest.raises(MediaTooLarge):
+        fetcher.fetch(f"{base}{prefix}/large.bin", max_bytes=200_000)
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancelled_download_stops(server, fetcher, tmp_path):
+    base, _ = server
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(FetchCancelled):
+        fetcher.fetch(f"{base}/large.bin", cancel=cancel)
+    assert os.listdir(tmp_path) == []
+
+
+def test_fetch_header_reads_a_range_only(server, fetcher):
+    base, httpd = server
+    header = fetcher.fetch_header(f"{base}/image.png", nbytes=4096)
+    assert (header.format, header.width, header.height) == ("png", 640, 480)
+    assert header.size == len(FILES["/image.png"])
+    assert header.etag == '"v1"'
+    assert ("/image.png", "bytes=0-4095") in httpd.requests
+
+
+def test_fetch_header_reads_the_webp_exif_from_the_tail(server, fetcher):
+    base, httpd = server
+    header = fetcher.fetch_header(f"{base}/image.webp", nbytes=4096)
+    assert (header.format, header.width, header.height) == ("webp", 256, 256)
+    assert header.exif_known
+    assert header.exif() == {271: "Canon"}
+    assert ("/image.webp", "bytes=-4096") in httpd.requests
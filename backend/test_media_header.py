@@ -0,0 +1,80 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+try:
+    from detector_logic import LoadedImage, metadata_finding
+    from media_header import find_webp_exif, parse_header
+    from worker import header_hint
+except ImportError:
+    from backend.detector_logic import LoadedImage, metadata_finding
+    from backend.media_header import find_webp_exif, parse_header
+    from backend.worker import header_hint
+
+CAMERA = {271: "Canon", 272: "EOS R5"}  # Make, Model
+
+
+def encode(fmt, size=(320, 200), exif=CAMERA, noise=False):
+    if noise:
+        image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new("RGB", size, (10, 20, 30))
+    block = Image.Exif()
+    for tag, value in (exif or {}).items():
+        block[tag] = value
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **({"exif": block.tobytes()} if exif else {}))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG", "WEBP"])
+def test_header_carries_the_exif_block(fmt):
+    header = parse_header(encode(fmt)[:4096])
+    assert (header.format, header.width, header.height) == (fmt.lower(), 320, 200)
+    assert header.exif_known
+    assert header.exif() == CAMERA
+    assert header.as_dict()["exif"] is True
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_header_without_exif_is_settled_at_the_image_data(fmt):
+    header = parse_header(encode(fmt, exif=None))
+    assert header.exif_known and header.exif() is None
+    assert header.as_dict()["exif"] is False
+
+
+def test_cut_short_exif_leaves_the_question_open():
+    data = encode("JPEG", exif={**CAMERA, 270: "x" * 5000})
+    header = parse_header(data[:1024])
+    assert not header.exif_known
+    assert header.need > 1024
+    assert header.as_dict()["exif"] is None
+    assert header_hint(header) is None
+
+
+def test_webp_exif_after_the_image_data_comes_from_the_tail():
+    data = encode("WEBP", size=(256, 256), noise=True)
+    header = parse_header(data[:4096])
+    assert header.exif_at_end and not header.exif_known
+    assert header.exif_raw is None
+    header.exif_raw = find_webp_exif(data[-4096:])
+    assert header.exif() == CAMERA
+
+
+def test_hint_feeds_the_decode_and_layer_one():
+    data = encode("JPEG")
+    hint = header_hint(parse_header(data))
+    has_camera_data, message = hint["metadata"]
+    assert has_camera_data is True and metadata_finding(CAMERA)[0] is True
+    assert "Make: Canon" in message and "Model: EOS R5" in message
+
+    loaded = LoadedImage.from_source(data, header=hint)
+    assert loaded.exif_from_header and loaded.exif == CAMERA
+
+    # A header of another object (dimensions differ) is ignored: the body's own EXIF is parsed
+    other = dict(hint, width=640, exif={271: "Other"})
+    loaded = LoadedImage.from_source(data, header=other)
+    assert not loaded.exif_from_header
+    assert loaded.exif[271] == "Canon"
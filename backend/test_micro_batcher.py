@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+try:
+    from micro_batcher import MicroBatcher
+except ImportError:
+    from backend.micro_batcher import MicroBatcher
+
+
+class FakeModel:
+    """process_batch stand-in: records every batch it is handed and doubles each item."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return [item * 2 for item in items]
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_window():
+    async def scenario():
+        model = FakeModel()
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=5000)
+        started = time.perf_counter()
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(4)])
+        elapsed = time.perf_counter() - started
+        await batcher.close()
+        return model, results, elapsed
+
+    model, results, elapsed = asyncio.run(scenario())
+    assert results == [0, 2, 4, 6]
+    assert model.batches == [[0, 1, 2, 3]]
+    assert elapsed < 1.0
+
+
+def test_partial_batch_is_flushed_when_the_window_closes():
+    async def scenario():
+        model = FakeModel()
+        batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+        started = time.perf_counter()
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(3)])
+        elapsed = time.perf_counter() - started
+        stats = batcher.stats()
+        await batcher.close()
+        return model, results, elapsed, stats
+
+    model, results, elapsed, stats = asyncio.run(scenario())
+    assert results == [0, 2, 4]
+    assert model.batches == [[0, 1, 2]]
+    assert 0.04 <= elapsed < 1.0
+    assert stats["batches"] == 1 and stats["items"] == 3
+    assert stats["queue_delay_p50_ms"] >= 40
+
+
+def test_overflow_forms_the_next_batch():
+    async def scenario():
+        model = FakeModel()
+        batcher = MicroBatcher(model, max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(7)])
+        await batcher.close()
+        return model, results
+
+    model, results = asyncio.run(scenario())
+    assert results == [i * 2 for i in range(7)]
+    assert [len(batch) for batch in model.batches] == [3, 3, 1]
+
+
+def test_batch_failure_reaches_every_caller_and_the_batcher_keeps_going():
+    async def scenario():
+        model = FakeModel(fail=True)
+        batcher = MicroBatcher(model, max_batch_size=2, max_wait_ms=10)
+        failed = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        model.fail = False
+        recovered = await batcher.submit(3)
+        await batcher.close()
+        return failed, recovered
+
+    failed, recovered = asyncio.run(scenario())
+    assert all(isinstance(e, RuntimeError) for e in failed)
+    assert recovered == 6
+
+
+def test_wrong_result_count_is_an_error():
+    async def scenario():
+        batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=2, max_wait_ms=10)
+        try:
+            await asyncio.gather(batcher.submit(1), batcher.submit(2))
+        finally:
+            await batcher.close()
+
+    with pytest.raises(RuntimeError, match="returned 1 results for 2 items"):
+        asyncio.run(scenario())
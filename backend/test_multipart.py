@@ -0,0 +1,101 @@
+import os
+
+import boto3
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from moto import mock_aws
+
+try:
+    import main
+    from media_fetch import max_media_bytes
+except ImportError:
+    from backend import main
+    from backend.media_fetch import max_media_bytes
+
+PART_SIZE = 5 * 1024 * 1024  # S3's minimum for every part but the last
+
+
+@pytest.fixture
+def client(monkeypatch):
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=main.AWS_BUCKET_NAME)
+        monkeypatch.setattr(main, "s3_client", s3)
+        monkeypatch.setattr(main, "MULTIPART_PART_SIZE", PART_SIZE)
+        try:
+            with TestClient(main.app) as client:
+                client.s3 = s3
+                yield client
+        finally:
+            main.app.state.dispatcher = main.app.state.admission = main.app.state.jobs = main.app.state.results = None
+
+
+def initiate(client, size, file_type="video/mp4"):
+    response = client.post("/multipart-upload/initiate", json={"file_type": file_type, "extension": "mp4", "size": size})
+    assert response.status_code == 200
+    return response.json()
+
+
+def upload_parts(client, upload, data):
+    numbers = list(range(1, upload["part_count"] + 1))
+    urls = client.post("/multipart-upload/presign-parts", json={
+        "file_key": upload["file_key"], "upload_id": upload["upload_id"], "part_numbers": numbers,
+    }).json()["urls"]
+    parts = []
+    for number in numbers:
+        chunk = data[(number - 1) * upload["part_size"]:number * upload["part_size"]]
+        put = requests.put(urls[str(number)], data=chunk)
+        assert put.status_code == 200
+        parts.append({"part_number": number, "etag": put.headers["ETag"]})
+    return parts
+
+
+def test_initiate_presign_put_complete(client):
+    data = os.urandom(PART_SIZE + 1024)
+    upload = initiate(client, len(data))
+    assert upload["part_count"] == 2 and upload["part_size"] == PART_SIZE
+    assert upload["file_key"].startswith("uploads/")
+    parts = upload_parts(client, upload, data)
+
+    # Parts may finish in any order: complete sorts them, as S3 requires
+    completed = client.post("/multipart-upload/complete", json={
+        "file_key": upload["file_key"], "upload_id": upload["upload_id"], "parts": parts[::-1],
+    })
+    assert completed.status_code == 200
+    assert completed.json() == {"file_key": upload["file_key"]}
+    stored = client.s3.get_object(Bucket=main.AWS_BUCKET_NAME, Key=upload["file_key"])["Body"].read()
+    assert stored == data
+
+
+def test_abort_drops_the_upload(client):
+    data = os.urandom(1024)
+    upload = initiate(client, len(data))
+    parts = upload_parts(client, upload, data)
+    body = {"file_key": upload["file_key"], "upload_id": upload["upload_id"]}
+    assert client.post("/multipart-upload/abort", json=body).json() == {"aborted": True}
+    assert client.s3.list_multipart_uploads(Bucket=main.AWS_BUCKET_NAME).get("Uploads", []) == []
+    # Nothing left to complete
+    assert client.post("/multipart-upload/complete", json={**body, "parts": parts}).status_code == 400
+
+
+def test_initiate_refuses_files_the_worker_would_not_download(client):
+    size = max_media_bytes("image/jpeg") + 1
+    response = client.post("/multipart-upload/initiate", json={"file_type": "image/jpeg", "extension": "jpg", "size": size})
+    assert response.status_code == 413
+    assert client.s3.list_multipart_uploads(Bucket=main.AWS_BUCKET_NAME).get("Uploads", []) == []
+
+
+@pytest.mark.parametrize("numbers", [[], [0], [1, main.MULTIPART_MAX_PARTS + 1]])
+def test_presign_validates_part_numbers(client, numbers):
+    upload = initiate(client, 1024)
+    response = client.post("/multipart-upload/presign-parts", json={
+        "file_key": upload["file_key"], "upload_id": upload["upload_id"], "part_numbers": numbers,
+    })
+    assert response.status_code == 422
+
+
+def test_complete_and_abort_only_take_upload_keys(client):
+    body = {"file_key": "private/report.pdf", "upload_id": "x"}
+    assert client.post("/multipart-upload/abort", json=body).status_code == 422
+    assert client.post("/multipart-upload/complete", json={**body, "parts": [{"part_number": 1, "etag": "e"}]}).status_code == 422
@@ -0,0 +1,43 @@
+try:
+    from phash_index import PHASH_MAX_DISTANCE, PhashIndex
+except ImportError:
+    from backend.phash_index import PHASH_MAX_DISTANCE, PhashIndex
+
+FAKE = {"status": "success", "verdict": "AI Generated", "score": 8, "details": [], "timings": {"total_ms": 500.0}}
+REAL = {"status": "success", "verdict": "Likely Real", "score": 92, "details": []}
+
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_near_duplicate_of_a_known_fake_returns_its_verdict(tmp_path):
+    index = PhashIndex("v1", path=str(tmp_path / "index.sqlite3"))
+    base = 0x0123456789ABCDEF
+    index.add(base, "ab" * 32, FAKE)
+
+    hit = index.get(flip(base, range(PHASH_MAX_DISTANCE)))
+    assert hit["verdict"] == "AI Generated"
+    assert hit["near_duplicate"] == {"distance": PHASH_MAX_DISTANCE, "sha256": "ab" * 32}
+    assert "timings" not in hit
+    assert index.get(flip(base, range(PHASH_MAX_DISTANCE + 1))) is None
+    assert index.stats()["hits"] == 1 and index.stats()["misses"] == 1
+
+
+def test_real_verdicts_and_errors_are_not_indexed():
+    index = PhashIndex("v1")
+    index.add(42, "cd" * 32, REAL)
+    index.add(43, "ef" * 32, {"status": "error", "message": "Could not decode image"})
+    assert len(index) == 0
+    assert index.get(42) is None
+
+
+def test_entries_survive_a_reopen_only_under_the_same_version(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    PhashIndex("v1", path=path).add(7, "ab" * 32, FAKE)
+    assert PhashIndex("v1", path=path).get(7)["verdict"] == "AI Generated"
+    # Another version (new weights, onnx, cascade) purges the entries on open
+    assert PhashIndex("v1+cascade", path=path).get(7) is None
+    assert len(PhashIndex("v1", path=path)) == 0
@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+import pytest
+
+try:
+    from detector_logic import (CAMERA_TAGS, MODEL_UNSURE_BELOW, SPECTRUM_RADIAL_BINS, VERDICTS, fft_penalty_for,
+                                fuse_scores, score_signals, verdict_for)
+    from signal_store import SignalStore
+except ImportError:
+    from backend.detector_logic import (CAMERA_TAGS, MODEL_UNSURE_BELOW, SPECTRUM_RADIAL_BINS, VERDICTS,
+                                        fft_penalty_for, fuse_scores, score_signals, verdict_for)
+    from backend.signal_store import SignalStore
+
+
+def scalar_score(model_a, model_b, has_camera_data, energy):
+    # The serving path: max over the models that ran, no spectral penalty when the FFT failed
+    model_score = max(score for score in (model_a, model_b) if not math.isnan(score))
+    fft_penalty = 0 if math.isnan(energy) else fft_penalty_for(energy)[0]
+    fake_probability, _ = fuse_scores(model_score, has_camera_data, fft_penalty)
+    credibility, verdict, _ = verdict_for(fake_probability, has_camera_data)
+    return credibility, VERDICTS.index(verdict)
+
+
+def random_signals(n, seed):
+    rng = np.random.default_rng(seed)
+    # Half continuous, half on the integer grid, so rule boundaries (30, MODEL_UNSURE_BELOW, 80) get hit exactly
+    model_a = np.where(rng.random(n) < 0.5, rng.uniform(0, 100, n), rng.integers(0, 101, n)).astype(np.float64)
+    model_b = np.where(rng.random(n) < 0.5, rng.uniform(0, 100, n), rng.integers(0, 101, n)).astype(np.float64)
+    # Cascade rows: one of the two models skipped
+    skipped = rng.random(n)
+    model_a[skipped < 0.15] = np.nan
+    model_b[(skipped >= 0.15) & (skipped < 0.3)] = np.nan
+    has_camera_data = rng.random(n) < 0.5
+    energy = rng.uniform(0, 400, n)
+    energy[rng.random(n) < 0.1] = np.nan  # FFT failed
+    return model_a, model_b, has_camera_data, energy
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_score_signals_matches_the_scalar_path(seed):
+    model_a, model_b, has_camera_data, energy = random_signals(2000, seed)
+    credibility, verdict = score_signals(model_a, model_b, has_camera_data, energy)
+    for i in range(len(model_a)):
+        expected_credibility, expected_verdict = scalar_score(model_a[i], model_b[i], bool(has_camera_data[i]), energy[i])
+        assert credibility[i] == pytest.approx(expected_credibility), i
+        assert verdict[i] == expected_verdict, i
+
+
+def test_score_signals_edges():
+    model_a = np.array([MODEL_UNSURE_BELOW, MODEL_UNSURE_BELOW - 1e-9, 80.0, 79.999, np.nan, 0.0])
+    model_b = np.array([np.nan, np.nan, 0.0, np.nan, 100.0, 0.0])
+    has_camera_data = np.array([False, False, True, True, False, False])
+    energy = np.array([0.0, 0.0, 500.0, np.nan, np.nan, np.nan])
+    credibility, verdict = score_signals(model_a, model_b, has_camera_data, energy)
+    for i in range(len(model_a)):
+        expected = scalar_score(model_a[i], model_b[i], bool(has_camera_data[i]), energy[i])
+        assert (credibility[i], verdict[i]) == pytest.approx(expected), i
+
+
+def result(verdict, model_a, camera_tags=()):
+    return {
+        "status": "success",
+        "verdict": verdict,
+        "signals": {"model_a": model_a, "model_b": None, "has_camera_data": bool(camera_tags),
+                    "camera_tags": list(camera_tags), "spectral_energy": 120.0},
+    }
+
+
+def test_signal_store_last_write_wins_across_chunks(tmp_path):
+    path = str(tmp_path / "signals")
+    store = SignalStore(path, version="v1", chunk_rows=2)
+    assert store.append("a" * 64, "fake", result("AI Generated", 95.0))
+    assert store.append("b" * 64, "real", result("Likely Real", 3.0, camera_tags=CAMERA_TAGS[:2]))  # flushes chunk 1
+    assert not store.append("c" * 64, "real", {"status": "error", "message": "Could not decode image"})
+    assert store.append("a" * 64, "fake", result("Suspicious / Unverified", 60.0))  # overwrites "a" in chunk 2
+    store.close()
+    assert len(SignalStore.chunks(path)) == 2
+
+    data = SignalStore.load(path)
+    rows = {sha.decode(): i for i, sha in enumerate(data["sha256"])}
+    assert sorted(rows) == ["a" * 64, "b" * 64]
+    a, b = rows["a" * 64], rows["b" * 64]
+    assert data["model_a"][a] == 60.0
+    assert data["verdict"][a] == VERDICTS.index("Suspicious / Unverified")
+    assert np.isnan(data["model_b"][a])
+    assert data["label"][b] == 0 and data["has_camera_data"][b]
+    assert data["camera_tags"][b] == 0b11
+    assert data["radial_profile"].shape == (2, SPECTRUM_RADIAL_BINS)
+
+    # A later run under another version is kept apart by load(version=...)
+    other = SignalStore(path, version="v2")
+    other.append("a" * 64, "fake", result("AI Generated", 99.0))
+    other.close()
+    latest = SignalStore.load(path)
+    assert latest["model_a"][list(latest["sha256"]).index(b"a" * 64)] == 99.0
+    assert SignalStore.load(path, version="v1")["model_a"][a] == 60.0
+    assert len(SignalStore.load(path, version="v2")["sha256"]) == 1
+
+    SignalStore.clear(path)
+    assert SignalStore.load(path) is None
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+try:
+    from detector_logic import SPECTRUM_LOW_FREQ_MASK, SPECTRUM_RADIAL_BINS, spectral_signature
+except ImportError:
+    from backend.detector_logic import SPECTRUM_LOW_FREQ_MASK, SPECTRUM_RADIAL_BINS, spectral_signature
+
+
+def baseline_signature(gray, mask_size=SPECTRUM_LOW_FREQ_MASK, bins=SPECTRUM_RADIAL_BINS):
+    # The original layer: full complex fft2 in float64, fftshift, zeroed low-frequency square, mean.
+    # The radial profile (added with the signal store) averages the same full spectrum per ring
+    h, w = gray.shape
+    magnitude = 20 * np.log(np.abs(np.fft.fftshift(np.fft.fft2(gray.astype(np.float64)))) + 1e-8)
+    profile_source = np.fft.ifftshift(magnitude)  # back to unshifted order for the radial bins
+    masked = magnitude.copy()
+    masked[h // 2 - mask_size:h // 2 + mask_size, w // 2 - mask_size:w // 2 + mask_size] = 0
+    energy = masked.mean()
+
+    # Same bin arithmetic as _spectral_geometry, so pixels on a bin edge land alike
+    rows = np.fft.fftfreq(h, 1.0 / h).astype(np.int64)[:, None] / float(h)
+    cols = np.fft.fftfreq(w, 1.0 / w).astype(np.int64)[None, :] / float(w)
+    radius = np.sqrt(rows ** 2 + cols ** 2) / np.sqrt(0.5)
+    index = np.minimum((radius * bins).astype(np.intp), bins - 1).ravel()
+    counts = np.bincount(index, minlength=bins)
+    profile = np.bincount(index, weights=profile_source.ravel(), minlength=bins) / np.maximum(counts, 1)
+    return energy, profile
+
+
+@pytest.mark.parametrize("shape", [(120, 160), (121, 160), (120, 161), (121, 161), (97, 64)])
+def test_rfft_signature_matches_the_fft2_baseline(shape):
+    rng = np.random.default_rng(sum(shape))
+    # Smooth gradient plus sensor-like noise: a spectrum with both low- and high-frequency content
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    gray = np.clip(96 + 0.4 * xx + 0.3 * yy + rng.normal(0, 12, shape), 0, 255).astype(np.uint8)
+
+    signature = spectral_signature(gray)
+    energy, profile = baseline_signature(gray)
+    assert signature["shape"] == shape
+    assert signature["energy"] == pytest.approx(energy, rel=1e-4)
+    assert signature["radial_profile"] == pytest.approx(profile, rel=1e-4, abs=1e-3)
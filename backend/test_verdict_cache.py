@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+try:
+    from verdict_cache import VerdictCache
+except ImportError:
+    from backend.verdict_cache import VerdictCache
+
+OK = {"status": "success", "verdict": "AI Generated", "score": 10, "details": []}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "verdicts.sqlite3")
+
+
+def digest(i):
+    return f"{i:064x}"
+
+
+def test_memory_tier_is_a_bounded_lru():
+    cache = VerdictCache("v1", max_memory_items=2)
+    cache.put(digest(1), OK)
+    cache.put(digest(2), OK)
+    assert cache.get(digest(1)) is not None  # 1 is now the most recent
+    cache.put(digest(3), OK)                 # evicts 2
+    assert cache.get(digest(2)) is None
+    assert cache.get(digest(1)) is not None and cache.get(digest(3)) is not None
+    stats = cache.stats()
+    assert stats["memory_items"] == 2 and stats["memory_evictions"] == 1
+
+
+def test_disk_tier_keeps_the_recently_used_rows(path):
+    cache = VerdictCache("v1", path=path, max_memory_items=1, max_disk_items=2, evict_every=1)
+    cache.put(digest(1), OK)
+    cache.put(digest(2), OK)
+    assert cache.get(digest(1)) is not None  # from disk: refreshes its access time
+    cache.put(digest(3), OK)                 # over the bound: 2 is the least recently accessed
+    assert cache.stats()["disk_items"] == 2
+    reopened = VerdictCache("v1", path=path)
+    assert reopened.get(digest(2)) is None
+    assert reopened.get(digest(1)) is not None and reopened.get(digest(3)) is not None
+
+
+def test_disk_bound_is_enforced_every_n_puts(path):
+    cache = VerdictCache("v1", path=path, max_disk_items=2, evict_every=4)
+    for i in range(3):
+        cache.put(digest(i), OK)
+    assert cache.stats()["disk_items"] == 3  # bound not checked yet
+    cache.put(digest(3), OK)
+    assert cache.stats()["disk_items"] == 2
+    assert cache.stats()["disk_evictions"] == 2
+
+
+def test_entries_expire_after_the_ttl(path, monkeypatch):
+    cache = VerdictCache("v1", path=path, ttl_seconds=60)
+    cache.put(digest(1), OK)
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.get(digest(1)) is None
+    assert cache.counters["memory_evictions"] == 1
+    # The expired row is not served from disk either, and a reopen drops it
+    assert VerdictCache("v1", path=path, ttl_seconds=60).stats()["disk_items"] == 0
+
+
+def test_new_version_purges_the_old_entries(path):
+    VerdictCache("v1", path=path).put(digest(1), OK)
+    assert VerdictCache("v1", path=path).get(digest(1)) is not None
+    upgraded = VerdictCache("v2", path=path)
+    assert upgraded.counters["disk_evictions"] == 1
+    assert upgraded.get(digest(1)) is None
+    assert VerdictCache("v1", path=path).get(digest(1)) is None
+
+
+def test_counters_track_hits_and_misses(path):
+    cache = VerdictCache("v1", path=path)
+    assert cache.get(digest(1)) is None
+    cache.put(digest(1), OK)
+    cache.get(digest(1))
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["disk_hits"]) == (1, 1, 0)
+    # A fresh process finds it on disk, then in memory
+    fresh = VerdictCache("v1", path=path)
+    fresh.get(digest(1))
+    fresh.get(digest(1))
+    stats = fresh.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["disk_hits"]) == (0, 1, 1)
+
+
+def test_results_are_copies_and_failures_are_not_stored(path):
+    cache = VerdictCache("v1", path=path)
+    cache.put(digest(1), {"status": "error", "message": "Could not decode image"})
+    assert cache.get(digest(1)) is None
+    assert cache.stats()["disk_items"] == 0
+
+    result = dict(OK, details=["a"])
+    cache.put(digest(2), result)
+    result["details"].append("b")
+    hit = cache.get(digest(2))
+    hit["cached"] = True
+    assert cache.get(digest(2)) == dict(OK, details=["a"])
@@ -0,0 +1,152 @@
+import collections
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class VerdictCache:
+    """
+    Content-addressed cache of analysis results.
+
+    Keyed by the SHA-256 of the file bytes plus the detector version string,
+    so re-uploads of identical bytes under a new S3 key skip inference, and a
+    model or heuristic change (new version) never serves an old verdict.
+
+    Tier 1: in-process LRU (max_memory_items).
+    Tier 2: SQLite file on local disk, bounded by max_disk_items and ttl_seconds.
+    The disk bound is enforced every evict_every puts rather than on each write, so it
+    may be exceeded by up to evict_every rows in between (the file is shared by several
+    processes, so an in-process row count would drift).
+    """
+
+    def __init__(self, version, path=None, max_memory_items=1024, max_disk_items=100_000, ttl_seconds=7 * 24 * 3600,
+                 evict_every=64):
+        self.version = version
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = max(1, evict_every)
+        self._puts_since_evict = 0
+
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                " key TEXT PRIMARY KEY, version TEXT, result TEXT, created REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_accessed ON verdicts (accessed)")
+            # Entries written by another detector version can never be hit again
+            cur = self._db.execute("DELETE FROM verdicts WHERE version != ?", (version,))
+            self.counters["disk_evictions"] += cur.rowcount
+            self._db.commit()
+            self._evict_disk()
+
+    def key(self, digest):
+        return f"{digest}:{self.version}"
+
+    def get(self, digest):
+        """Returns the cached result dict for these file bytes, or None."""
+        key = self.key(digest)
+        with self._lock:
+            now = time.time()
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, result = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return copy.deepcopy(result)
+                del self._memory[key]
+                self.counters["memory_evictions"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, created FROM verdicts WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    self._db.execute("UPDATE verdicts SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    result = json.loads(row[0])
+                    self._remember(key, row[1], result)
+                    self.counters["disk_hits"] += 1
+                    return copy.deepcopy(result)
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, digest, result):
+        # Only successful analyses are worth replaying
+        if result.get("status") != "success":
+            return
+        key = self.key(digest)
+        result = copy.deepcopy(result)
+        with self._lock:
+            now = time.time()
+            self._remember(key, now, result)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, version, result, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, self.version, json.dumps(result), now, now),
+                )
+                self._db.commit()
+                self._puts_since_evict += 1
+                if self._puts_since_evict >= self.evict_every:
+                    self._evict_disk()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_items"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_items"] = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+            return stats
+
+    def _remember(self, key, created, result):
+        self._memory[key] = (created, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    def _evict_disk(self):
+        # TTL first, then least-recently-accessed beyond the size bound
+        self._puts_since_evict = 0
+        cur = self._db.execute("DELETE FROM verdicts WHERE created < ?", (time.time() - self.ttl_seconds,))
+        evicted = cur.rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if count > self.max_disk_items:
+            cur = self._db.execute(
+                "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_disk_items,),
+            )
+            evicted += cur.rowcount
+        # Always end the transaction: even a no-op DELETE holds the write lock until commit,
+        # which would block other processes sharing the file (local_pool workers)
+        self._db.commit()
+        self.counters["disk_evictions"] += evicted
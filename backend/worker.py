@@ -0,0 +1,298 @@
+import os
+import time
+import asyncio
+import threading
+try:
+    from detector_logic import (MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, DeepfakeDetectorLogic, LoadedImage, cache_version,
+                                metadata_finding)
+    from micro_batcher import MicroBatcher
+    from verdict_cache import VerdictCache
+    from media_fetch import FetchCancelled, MediaFetcher, max_media_bytes
+    from phash_index import PHASH_MAX_DISTANCE, PhashIndex, phash
+except ImportError:
+    from backend.detector_logic import (MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, DeepfakeDetectorLogic, LoadedImage,
+                                        cache_version, metadata_finding)
+    from backend.micro_batcher import MicroBatcher
+    from backend.verdict_cache import VerdictCache
+    from backend.media_fetch import FetchCancelled, MediaFetcher, max_media_bytes
+    from backend.phash_index import PHASH_MAX_DISTANCE, PhashIndex, phash
+
+# Micro-batching window: a batch closes at BATCH_MAX_SIZE items or BATCH_MAX_WAIT_MS, whichever first
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "25"))
+
+# Content-addressed verdict cache (worker-local SQLite tier)
+VERDICT_CACHE_PATH = os.getenv("VERDICT_CACHE_PATH", "/tmp/verdict_cache.sqlite3")
+VERDICT_CACHE_TTL_S = int(os.getenv("VERDICT_CACHE_TTL_S", str(7 * 24 * 3600)))
+
+# Near-duplicate tier: resized / recompressed copies of a known fake reuse its verdict (see phash_index.py)
+PHASH_INDEX = os.getenv("PHASH_INDEX", "1") == "1"
+PHASH_INDEX_PATH = os.getenv("PHASH_INDEX_PATH", "/tmp/phash_index.sqlite3")
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", str(PHASH_MAX_DISTANCE)))
+
+# "torch" (GPU / default) or "onnx" / "onnx-int8" for CPU-only overflow workers
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+
+# Confidence cascade for stills: skip the second model when the first one and the forensics settle the verdict
+CASCADE = os.getenv("CASCADE", "0") == "1"
+
+# Header-first read for stills: a Range read of the first bytes (format, dimensions, size, EXIF)
+# runs alongside the body download. It cancels the download for images above detector_logic's
+# MAX_IMAGE_PIXELS / MAX_IMAGE_BYTES, and runs Forensic Layer 1 on the EXIF while the body is
+# still arriving, so the decode skips the EXIF parse and the cascade has the metadata at hand
+HEADER_PREFILTER = os.getenv("HEADER_PREFILTER", "1") == "1"
+
+# Warm-up inference before the worker takes traffic (see DeepfakeDetectorLogic.warmup)
+WARMUP = os.getenv("WARMUP", "1") != "0"
+
+# Per-stage timings in every result (consumed by the control plane's /metrics)
+RECORD_TIMINGS = os.getenv("RECORD_TIMINGS", "1") != "0"
+# Per-analysis peak RSS in every result (see DeepfakeDetectorLogic.record_peak_rss): resetting
+# the kernel's peak counter costs a page-table walk per analysis, so it is opt-in
+RECORD_PEAK_RSS = os.getenv("RECORD_PEAK_RSS", "0") == "1"
+
+
+class DetectorWorker(DeepfakeDetectorLogic):
+    """
+    Worker side of an analysis: media URL in, verdict out.
+    Shared by the Modal container (modal_app.DeepfakeDetector) and the in-process
+    stand-in the API can use instead of Modal (dispatch.LocalDispatcher).
+    """
+
+    def start_worker(self, warmup=WARMUP):
+        """
+        Opens the per-process state (batcher, caches, HTTP session), loading the models
+        first if they are not in place yet. warmup=False skips the warm-up analyses, for
+        workers whose models already ran them (a pool child forked from a warm zygote).
+        """
+        started = time.perf_counter()
+        self.record_timings = RECORD_TIMINGS
+        self.record_peak_rss = RECORD_PEAK_RSS
+        self.cascade = CASCADE
+        # Pipelines may already be in place (e.g. stand-in models for load tests, or a forked pool worker)
+        if not hasattr(self, "pipe1"):
+            self.load_models(batch_size=BATCH_MAX_SIZE, backend=INFERENCE_BACKEND)
+        timings = self.startup_timings = dict(self.startup_timings or {})
+        # Concurrent analyze_url calls on this worker are merged into one ensemble pass
+        self.batcher = MicroBatcher(self.analyze_urls, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+        # Identical bytes re-uploaded under a new key skip the ensemble entirely
+        # Quantised backends and the cascade score slightly differently, so they get their own cache keys
+        version = cache_version(self.inference_backend, self.cascade)
+        stage_started = time.perf_counter()
+        self.cache = VerdictCache(version, path=VERDICT_CACHE_PATH, ttl_seconds=VERDICT_CACHE_TTL_S)
+        self.phash_index = PhashIndex(version, path=PHASH_INDEX_PATH, max_distance=PHASH_MAX_DISTANCE) if PHASH_INDEX else None
+        # Opening the caches includes loading the pHash index into memory
+        timings["caches_ms"] = round((time.perf_counter() - stage_started) * 1000, 3)
+        # Pooled keep-alive session shared by every download on this worker
+        self.fetcher = MediaFetcher(pool_size=BATCH_MAX_SIZE * 4)
+        if warmup:
+            self.warmup()
+        timings["start_worker_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        print(f"Worker ready: {timings}")
+
+    async def analyze_url(self, file_url, file_type, progress=None):
+        """
+        progress: optional callable(stage) run on this event loop as the file passes
+        "downloaded", "model_a", "model_b", "forensics" and "verdict".
+        """
+        started = time.perf_counter()
+        if progress is not None:
+            # The batch runs in worker threads: hop back onto the caller's loop
+            loop = asyncio.get_running_loop()
+            on_stage = progress
+            progress = lambda stage: loop.call_soon_threadsafe(on_stage, stage)
+        try:
+            result = await self.batcher.submit((file_url, file_type, progress))
+        except Exception as e:
+            result = {"status": "error", "message": f"Batch failed: {str(e)}"}
+        if self.record_timings:
+            # worker_ms = batching queue + download + analysis, as seen by this call
+            result.setdefault("timings", {})["worker_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    async def analyze_url_events(self, file_url, file_type):
+        """
+        Streaming form of analyze_url: yields {"event": "stage", "stage": ...}
+        as the file progresses, then {"event": "result", "result": ...}.
+        """
+        stages = asyncio.Queue()
+        task = asyncio.create_task(self.analyze_url(file_url, file_type, progress=stages.put_nowait))
+        while not task.done() or not stages.empty():
+            getter = asyncio.ensure_future(stages.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield {"event": "stage", "stage": getter.result()}
+            else:
+                getter.cancel()
+        yield {"event": "result", "result": task.result()}
+
+    def analyze_urls(self, requests_batch):
+        """
+        requests_batch: list of (file_url, file_type) or (file_url, file_type, progress).
+        Downloads every file in parallel, answers what it can from the verdict
+        cache (exact bytes) and the near-duplicate index (same picture as a known
+        fake), then runs one batched analysis over the rest.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        results = [None] * len(requests_batch)
+        stage_ms = [{} for _ in requests_batch]
+        fetched = [None] * len(requests_batch)
+        requests_batch = [tuple(req) + (None,) * (3 - len(req)) for req in requests_batch]
+
+        headers = [None] * len(requests_batch)
+        hints = [None] * len(requests_batch)
+
+        def fetch(idx):
+            file_url, file_type, progress = requests_batch[idx]
+            started = time.perf_counter()
+            try:
+                # Images are decoded straight from memory; cv2 needs a file for video
+                fetched[idx] = self.fetcher.fetch(file_url, to_file=not file_type.startswith("image"), cancel=cancels[idx],
+                                                  max_bytes=max_media_bytes(file_type))
+                _notify(progress, "downloaded")
+                return None
+            except FetchCancelled:
+                return None  # rejected from its header, see prefilter()
+            except Exception as e:
+                return {"status": "error", "message": f"Download failed: {str(e)}"}
+            finally:
+                stage_ms[idx]["download_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+        def prefilter(idx):
+            file_url, file_type, _ = requests_batch[idx]
+            if not (HEADER_PREFILTER and file_type.startswith("image")):
+                return None
+            started = time.perf_counter()
+            try:
+                headers[idx] = self.fetcher.fetch_header(file_url)
+            except Exception as e:
+                # The header is only a shortcut: the full download decides
+                print(f"Header read failed, using the full download: {e}")
+                return None
+            finally:
+                stage_ms[idx]["header_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            error = header_rejection(headers[idx])
+            if error is not None:
+                cancels[idx].set()
+                return error
+            # Forensic Layer 1 on the header's EXIF, while the body is still downloading
+            started = time.perf_counter()
+            hints[idx] = header_hint(headers[idx])
+            if hints[idx] is not None:
+                stage_ms[idx]["header_metadata_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            return None
+
+        cancels = [threading.Event() for _ in requests_batch]
+        try:
+            # Body downloads and header reads share one pool, so a rejected header stops its body mid-stream
+            with ThreadPoolExecutor(max_workers=max(1, 2 * len(requests_batch))) as pool:
+                downloads = [pool.submit(fetch, idx) for idx in range(len(requests_batch))]
+                rejections = list(pool.map(prefilter, range(len(requests_batch))))
+                download_errors = [rejection or download.result() for rejection, download in zip(rejections, downloads)]
+
+            items, slots, digests, hashes = [], [], [], []
+            for idx, error in enumerate(download_errors):
+                if error is not None:
+                    results[idx] = error
+                    if fetched[idx] is not None:
+                        fetched[idx].close()
+                        fetched[idx] = None
+                    continue
+                started = time.perf_counter()
+                digest = fetched[idx].sha256
+                cached = self.cache.get(digest)
+                stage_ms[idx]["cache_lookup_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                if cached is not None:
+                    # The stored timings belong to the original analysis, not to this request
+                    cached.pop("timings", None)
+                    cached.pop("peak_rss_mb", None)
+                    cached["cached"] = True
+                    results[idx] = cached
+                    _notify(requests_batch[idx][2], "verdict")
+                    continue
+                source, hash_value = fetched[idx].source, None
+                # The header hint only stands for the body if both reads saw the same object
+                hint = hints[idx] if headers[idx] is not None and headers[idx].etag == fetched[idx].etag else None
+                if self.phash_index is not None and requests_batch[idx][1].startswith("image"):
+                    started = time.perf_counter()
+                    try:
+                        # Decoded once here; analyze_batch takes the LoadedImage as is
+                        source = LoadedImage.from_source(source, header=hint)
+                        stage_ms[idx]["decode_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                        started = time.perf_counter()
+                        hash_value = phash(source.gray)
+                        near = self.phash_index.get(hash_value)
+                    except Exception:
+                        near = None  # undecodable: analyze_batch reports the error
+                    stage_ms[idx]["phash_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                    if near is not None:
+                        # Same picture as a known fake: its verdict, no inference
+                        near.pop("timings", None)
+                        near.pop("peak_rss_mb", None)
+                        near["cached"] = True
+                        results[idx] = near
+                        _notify(requests_batch[idx][2], "verdict")
+                        continue
+                items.append((source, requests_batch[idx][1], hint))
+                slots.append(idx)
+                digests.append(digest)
+                hashes.append(hash_value)
+
+            def batch_progress(i, stage):
+                _notify(requests_batch[slots[i]][2], stage)
+
+            for idx, digest, hash_value, result in zip(slots, digests, hashes, self.analyze_batch(items, progress=batch_progress)):
+                self.cache.put(digest, result)
+                if hash_value is not None:
+                    self.phash_index.add(hash_value, digest, result)
+                results[idx] = result
+        finally:
+            for media in fetched:
+                if media is not None:
+                    media.close()
+
+        for result, media in zip(results, fetched):
+            # Digest of the bytes we actually read: the API files verdicts under it for GET /lookup
+            if media is not None and result.get("status") == "success":
+                result["sha256"] = media.sha256
+        for result, header in zip(results, headers):
+            if header is not None and header.format is not None:
+                result["media"] = header.as_dict()
+        if self.record_timings:
+            for result, stages in zip(results, stage_ms):
+                result.setdefault("timings", {}).update(stages)
+        return results
+
+
+def header_rejection(header):
+    """Error result for stills the header already rules out, else None."""
+    # Containers the parser does not know (GIF, BMP, ...) are left to the full decode
+    if header.pixels and header.pixels > MAX_IMAGE_PIXELS:
+        return {"status": "error",
+                "message": f"Image is {header.width}x{header.height}, above the {MAX_IMAGE_PIXELS} pixel limit"}
+    if header.size and header.size > MAX_IMAGE_BYTES:
+        return {"status": "error", "message": f"Image is {header.size} bytes, above the {MAX_IMAGE_BYTES} byte limit"}
+    return None
+
+
+def header_hint(header):
+    """
+    What a still's header read hands to analyze_batch: its dimensions and EXIF, plus
+    Forensic Layer 1 already run on that EXIF. None when the header leaves EXIF open.
+    """
+    if header.format is None or not header.exif_known or header.width is None:
+        return None
+    try:
+        exif = header.exif()
+    except Exception:
+        return None  # unreadable block: the full decode reports it as analyze_metadata would
+    return {"width": header.width, "height": header.height, "exif": exif, "metadata": metadata_finding(exif)}
+
+
+def _notify(progress, stage):
+    if progress is not None:
+        try:
+            progress(stage)
+        except Exception as e:
+            print(f"Progress callback failed: {e}")